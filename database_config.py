@@ -2,11 +2,12 @@
 Database Configuration for PostgreSQL with SQLAlchemy and PostGIS
 """
 import os
-from sqlalchemy import create_engine, event
+from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 from geoalchemy2 import Geometry
+from db_telemetry import QueryTelemetry, telemetry_from_env
 
 # Load environment variables
 load_dotenv()
@@ -30,6 +31,9 @@ engine = create_engine(
     echo=False  # Set to True for SQL query logging
 )
 
+# Query/pool telemetry (enabled with DB_TELEMETRY=true)
+telemetry = telemetry_from_env(engine)
+
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -46,6 +50,23 @@ def get_db():
     finally:
         db.close()
 
+def enable_telemetry(slow_query_threshold_ms: float = 500.0,
+                     explain_slow_queries: bool = False) -> QueryTelemetry:
+    """
+    Enable query latency and pool telemetry on the shared engine
+    """
+    global telemetry
+    if telemetry is None:
+        telemetry = QueryTelemetry(
+            engine,
+            slow_query_threshold_ms=slow_query_threshold_ms,
+            explain_slow_queries=explain_slow_queries
+        ).install()
+    else:
+        telemetry.slow_query_threshold = slow_query_threshold_ms / 1000.0
+        telemetry.explain_slow_queries = explain_slow_queries
+    return telemetry
+
 def enable_postgis(connection, connection_record):
     """
     Enable PostGIS extension on database connection
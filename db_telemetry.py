@@ -0,0 +1,385 @@
+"""
+Query and connection-pool telemetry for the SQLAlchemy engine
+Slow-query log, latency histograms and pool checkout wait times
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Any, Optional
+from sqlalchemy import event
+
+
+# Histogram bucket upper bounds in seconds (Prometheus style, +Inf implied)
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Frames from these modules are skipped when resolving the calling repository method
+_SKIP_CALLER_PREFIXES = ('sqlalchemy', 'geoalchemy2', 'db_telemetry', 'psycopg2')
+
+
+class LatencyHistogram:
+    """
+    Cumulative latency histogram with fixed bucket bounds
+    """
+
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        """Record one observation"""
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile from bucket counts (upper bucket bound)"""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        running = 0
+        for i, bucket_count in enumerate(self.counts):
+            running += bucket_count
+            if running >= target:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Export histogram as dictionary"""
+        cumulative = []
+        running = 0
+        for bound, bucket_count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            running += bucket_count
+            cumulative.append({'le': bound, 'count': running})
+
+        return {
+            'count': self.count,
+            'sum_seconds': self.total,
+            'mean_seconds': self.total / self.count if self.count else 0.0,
+            'max_seconds': self.max,
+            'p50_seconds': self.quantile(0.50),
+            'p99_seconds': self.quantile(0.99),
+            'buckets': cumulative
+        }
+
+
+class QueryTelemetry:
+    """
+    Collects per-statement latency, slow queries and pool checkout waits
+    by listening to engine and pool events
+    """
+
+    def __init__(self, engine, slow_query_threshold_ms: float = 500.0,
+                 explain_slow_queries: bool = False,
+                 track_callers: bool = True,
+                 max_slow_queries: int = 100,
+                 buckets=DEFAULT_LATENCY_BUCKETS):
+        self.engine = engine
+        self.slow_query_threshold = slow_query_threshold_ms / 1000.0
+        self.explain_slow_queries = explain_slow_queries
+        self.track_callers = track_callers
+        self.buckets = tuple(buckets)
+
+        self._lock = threading.Lock()
+        self.statement_latency: Dict[str, LatencyHistogram] = {}
+        self.caller_latency: Dict[str, LatencyHistogram] = {}
+        self.checkout_wait = LatencyHistogram(self.buckets)
+        self.slow_queries = deque(maxlen=max_slow_queries)
+        self.slow_query_count = 0
+        self.checkout_count = 0
+        self.checkout_timeouts = 0
+        self.max_checked_out = 0
+        self.started_at = time.time()
+        self._installed = False
+
+    def install(self):
+        """
+        Register event listeners on the engine and wrap pool checkout
+        """
+        if self._installed:
+            return self
+
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(self.engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(self.engine, 'checkout', self._on_checkout)
+        event.listen(self.engine, 'engine_disposed', self._on_engine_disposed)
+        self._wrap_pool(self.engine.pool)
+
+        self._installed = True
+        return self
+
+    def _wrap_pool(self, pool):
+        """
+        Time pool.connect() so the wait for a free connection is measured,
+        not only the moment the checkout event fires
+        """
+        if getattr(pool, '_telemetry_wrapped', False):
+            return
+
+        original_connect = pool.connect
+
+        def timed_connect():
+            start = time.perf_counter()
+            try:
+                return original_connect()
+            except Exception as e:
+                if type(e).__name__ == 'TimeoutError':
+                    with self._lock:
+                        self.checkout_timeouts += 1
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.checkout_wait.observe(elapsed)
+
+        pool.connect = timed_connect
+        pool._telemetry_wrapped = True
+
+    def _on_engine_disposed(self, engine):
+        # dispose() replaces the pool; wrap the new one as well
+        self._wrap_pool(engine.pool)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        pool = self.engine.pool
+        checked_out = pool.checkedout() if hasattr(pool, 'checkedout') else 0
+        with self._lock:
+            self.checkout_count += 1
+            if checked_out > self.max_checked_out:
+                self.max_checked_out = checked_out
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_telemetry_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('_telemetry_start')
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+
+        key = normalize_statement(statement)
+        caller = self._find_caller() if self.track_callers else None
+
+        with self._lock:
+            histogram = self.statement_latency.get(key)
+            if histogram is None:
+                histogram = self.statement_latency[key] = LatencyHistogram(self.buckets)
+            histogram.observe(elapsed)
+
+            if caller:
+                caller_histogram = self.caller_latency.get(caller)
+                if caller_histogram is None:
+                    caller_histogram = self.caller_latency[caller] = LatencyHistogram(self.buckets)
+                caller_histogram.observe(elapsed)
+
+        if elapsed >= self.slow_query_threshold:
+            self._record_slow_query(conn, statement, parameters, elapsed, caller, executemany)
+
+    def _record_slow_query(self, conn, statement, parameters, elapsed, caller, executemany):
+        entry = {
+            'timestamp': time.time(),
+            'duration_ms': elapsed * 1000.0,
+            'statement': statement,
+            'caller': caller
+        }
+
+        if self.explain_slow_queries and not executemany and \
+                statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            entry['explain'] = self._explain(conn, statement, parameters)
+
+        with self._lock:
+            self.slow_queries.append(entry)
+            self.slow_query_count += 1
+
+        print(f"[slow query] {entry['duration_ms']:.1f} ms"
+              f"{' in ' + caller if caller else ''}: {normalize_statement(statement)}")
+
+    def _explain(self, conn, statement, parameters) -> Optional[List[str]]:
+        """
+        Run EXPLAIN on a raw DBAPI cursor so it does not re-enter the listeners
+        It runs inside a savepoint: on PostgreSQL a failed statement would
+        otherwise abort the caller's transaction
+        """
+        cursor = None
+        try:
+            cursor = conn.connection.cursor()
+            cursor.execute("SAVEPOINT telemetry_explain")
+            try:
+                cursor.execute(f"EXPLAIN {statement}", parameters)
+                plan = [row[0] for row in cursor.fetchall()]
+            except Exception as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT telemetry_explain")
+                plan = [f"EXPLAIN failed: {e}"]
+            cursor.execute("RELEASE SAVEPOINT telemetry_explain")
+            return plan
+        except Exception as e:
+            return [f"EXPLAIN failed: {e}"]
+        finally:
+            if cursor is not None:
+                cursor.close()
+
+    def _find_caller(self) -> Optional[str]:
+        """
+        Walk the stack to the first frame outside SQLAlchemy, e.g.
+        'geo_repository.get_by_district'
+        """
+        frame = sys._getframe(2)
+        while frame is not None:
+            module = frame.f_globals.get('__name__', '')
+            if not module.startswith(_SKIP_CALLER_PREFIXES):
+                return f"{module}.{frame.f_code.co_name}"
+            frame = frame.f_back
+        return None
+
+    def reset(self):
+        """Clear all collected metrics"""
+        with self._lock:
+            self.statement_latency.clear()
+            self.caller_latency.clear()
+            self.checkout_wait = LatencyHistogram(self.buckets)
+            self.slow_queries.clear()
+            self.slow_query_count = 0
+            self.checkout_count = 0
+            self.checkout_timeouts = 0
+            self.max_checked_out = 0
+            self.started_at = time.time()
+
+    def _pool_status(self) -> Dict[str, Any]:
+        pool = self.engine.pool
+        status = {'status': pool.status()}
+        for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+            method = getattr(pool, name, None)
+            if callable(method):
+                status[name] = method()
+        return status
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Get a point-in-time copy of all metrics
+        """
+        with self._lock:
+            statements = sorted(
+                ({'statement': key, **hist.to_dict()} for key, hist in self.statement_latency.items()),
+                key=lambda s: s['sum_seconds'], reverse=True
+            )
+            callers = sorted(
+                ({'caller': key, **hist.to_dict()} for key, hist in self.caller_latency.items()),
+                key=lambda s: s['sum_seconds'], reverse=True
+            )
+
+            return {
+                'collected_since': self.started_at,
+                'slow_query_threshold_ms': self.slow_query_threshold * 1000.0,
+                'statements': statements,
+                'callers': callers,
+                'pool': {
+                    **self._pool_status(),
+                    'checkouts': self.checkout_count,
+                    'checkout_timeouts': self.checkout_timeouts,
+                    'max_checked_out': self.max_checked_out,
+                    'checkout_wait': self.checkout_wait.to_dict()
+                },
+                'slow_query_count': self.slow_query_count,
+                'slow_queries': list(self.slow_queries)
+            }
+
+    def to_json(self, indent: int = 2) -> str:
+        """Export snapshot as JSON text"""
+        return json.dumps(self.snapshot(), indent=indent, ensure_ascii=False, default=str)
+
+    def to_prometheus(self) -> str:
+        """
+        Export snapshot in Prometheus text exposition format
+        """
+        snap = self.snapshot()
+        lines = []
+
+        lines.append('# HELP db_statement_duration_seconds SQL statement latency')
+        lines.append('# TYPE db_statement_duration_seconds histogram')
+        for stat in snap['statements']:
+            lines.extend(_histogram_lines('db_statement_duration_seconds',
+                                          {'statement': stat['statement']}, stat))
+
+        lines.append('# HELP db_caller_duration_seconds SQL latency by calling function')
+        lines.append('# TYPE db_caller_duration_seconds histogram')
+        for stat in snap['callers']:
+            lines.extend(_histogram_lines('db_caller_duration_seconds',
+                                          {'caller': stat['caller']}, stat))
+
+        pool = snap['pool']
+        lines.append('# HELP db_pool_checkout_wait_seconds Time spent waiting for a pooled connection')
+        lines.append('# TYPE db_pool_checkout_wait_seconds histogram')
+        lines.extend(_histogram_lines('db_pool_checkout_wait_seconds', {}, pool['checkout_wait']))
+
+        for name in ('checkedout', 'checkedin', 'overflow', 'max_checked_out'):
+            if name in pool:
+                lines.append(f'# TYPE db_pool_{name} gauge')
+                lines.append(f'db_pool_{name} {pool[name]}')
+        lines.append('# TYPE db_pool_checkout_timeouts_total counter')
+        lines.append(f"db_pool_checkout_timeouts_total {pool['checkout_timeouts']}")
+        lines.append('# TYPE db_slow_queries_total counter')
+        lines.append(f"db_slow_queries_total {snap['slow_query_count']}")
+
+        return '\n'.join(lines) + '\n'
+
+    def save_snapshot(self, file_path: str, fmt: str = 'json') -> str:
+        """
+        Save snapshot as 'json' or 'prometheus' text
+        """
+        content = self.to_prometheus() if fmt == 'prometheus' else self.to_json()
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return file_path
+
+
+def normalize_statement(statement: str, max_length: int = 160) -> str:
+    """
+    Collapse whitespace and truncate so the statement can be used as a metric key
+    """
+    collapsed = re.sub(r'\s+', ' ', statement).strip()
+    if len(collapsed) > max_length:
+        collapsed = collapsed[:max_length - 3] + '...'
+    return collapsed
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+def _histogram_lines(name: str, labels: Dict[str, str], stat: Dict[str, Any]) -> List[str]:
+    label_parts = [f'{k}="{_escape_label(str(v))}"' for k, v in labels.items()]
+    lines = []
+    for bucket in stat['buckets']:
+        bucket_labels = ','.join(label_parts + [f'le="{bucket["le"]}"'])
+        lines.append(f'{name}_bucket{{{bucket_labels}}} {bucket["count"]}')
+    suffix = '{' + ','.join(label_parts) + '}' if label_parts else ''
+    lines.append(f'{name}_sum{suffix} {stat["sum_seconds"]}')
+    lines.append(f'{name}_count{suffix} {stat["count"]}')
+    return lines
+
+
+def telemetry_from_env(engine) -> Optional[QueryTelemetry]:
+    """
+    Install telemetry on engine if DB_TELEMETRY is enabled in the environment
+    """
+    if os.getenv('DB_TELEMETRY', 'false').lower() not in ('1', 'true', 'yes'):
+        return None
+
+    return QueryTelemetry(
+        engine,
+        slow_query_threshold_ms=float(os.getenv('DB_SLOW_QUERY_MS', '500')),
+        explain_slow_queries=os.getenv('DB_EXPLAIN_SLOW_QUERIES', 'false').lower() in ('1', 'true', 'yes'),
+        track_callers=os.getenv('DB_TRACK_CALLERS', 'true').lower() in ('1', 'true', 'yes')
+    ).install()
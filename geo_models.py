@@ -109,6 +109,19 @@ class MahalleRiskData(Base):
     human_building_vulnerability = Column(Float)
     combined_risk_index = Column(Float)
 
+    # Model predictions written back by PredictionService
+    # Regressor (risk score)
+    predicted_risk = Column(Float)
+    predicted_at = Column(DateTime)
+    prediction_feature_hash = Column(String(32))  # md5 of the input features last scored
+    prediction_model_version = Column(String(64), index=True)
+    # Classifier (risk class)
+    predicted_class = Column(Integer)
+    prediction_confidence = Column(Float)
+    class_predicted_at = Column(DateTime)
+    class_feature_hash = Column(String(32))
+    class_model_version = Column(String(64), index=True)
+
     # GeoJSON properties as JSON (tüm ekstra alanlar için)
     properties = Column(JSON)
 
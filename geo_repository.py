@@ -3,13 +3,37 @@ Spatial/Geographic Repository for PostGIS operations
 """
 from typing import List, Optional, Dict, Any, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func, text
-from geoalchemy2 import WKTElement
+from sqlalchemy import and_, or_, func, text, cast
+from geoalchemy2 import WKTElement, Geography
 from geoalchemy2.functions import ST_AsGeoJSON, ST_Distance, ST_DWithin, ST_Intersects, \
     ST_Contains, ST_Within, ST_Area, ST_Centroid, ST_MakeValid, ST_GeomFromGeoJSON
 import json
 from geo_models import MahalleRiskData, SpatialIndex
 
+# bilesik_risk_skoru from which a neighborhood counts as high risk
+HIGH_RISK_THRESHOLD = 0.2
+
+# Write-back columns per model type, so a regressor and a classifier scoring
+# the same rows keep their own predictions, input hashes and versions
+PREDICTION_COLUMNS = {
+    'regressor': {
+        'prediction': 'predicted_risk',
+        'prediction_type': 'DOUBLE PRECISION',
+        'confidence': None,
+        'predicted_at': 'predicted_at',
+        'feature_hash': 'prediction_feature_hash',
+        'model_version': 'prediction_model_version'
+    },
+    'classifier': {
+        'prediction': 'predicted_class',
+        'prediction_type': 'INTEGER',
+        'confidence': 'prediction_confidence',
+        'predicted_at': 'class_predicted_at',
+        'feature_hash': 'class_feature_hash',
+        'model_version': 'class_model_version'
+    }
+}
+
 
 class GeoSpatialRepository:
     """
@@ -180,17 +204,28 @@ class GeoSpatialRepository:
             )
         ).all()
 
+    @staticmethod
+    def district_filter(district: str):
+        """WHERE clause of get_by_district"""
+        return MahalleRiskData.ilce_adi.ilike(f"%{district}%")
+
+    @staticmethod
+    def high_risk_filter(threshold: float = HIGH_RISK_THRESHOLD):
+        """WHERE clause of get_high_risk_areas"""
+        return MahalleRiskData.bilesik_risk_skoru >= threshold
+
+    # ORDER BY of get_high_risk_areas
+    HIGH_RISK_ORDER = (MahalleRiskData.bilesik_risk_skoru.desc(),)
+
     def get_by_district(self, district: str) -> List[MahalleRiskData]:
         """Get all neighborhoods in a district"""
-        return self.db.query(MahalleRiskData).filter(
-            MahalleRiskData.ilce_adi.ilike(f"%{district}%")
-        ).all()
+        return self.db.query(MahalleRiskData).filter(self.district_filter(district)).all()
 
-    def get_high_risk_areas(self, threshold: float = 0.2) -> List[MahalleRiskData]:
+    def get_high_risk_areas(self, threshold: float = HIGH_RISK_THRESHOLD) -> List[MahalleRiskData]:
         """Get high risk areas above threshold"""
         return self.db.query(MahalleRiskData).filter(
-            MahalleRiskData.bilesik_risk_skoru >= threshold
-        ).order_by(MahalleRiskData.bilesik_risk_skoru.desc()).all()
+            self.high_risk_filter(threshold)
+        ).order_by(*self.HIGH_RISK_ORDER).all()
 
     def find_within_distance(self, longitude: float, latitude: float,
                             distance_km: float) -> List[MahalleRiskData]:
@@ -202,8 +237,8 @@ class GeoSpatialRepository:
 
         return self.db.query(MahalleRiskData).filter(
             func.ST_DWithin(
-                MahalleRiskData.geometry,
-                func.ST_SetSRID(func.ST_GeomFromText(point), 4326)::Geography,
+                cast(MahalleRiskData.geometry, Geography),
+                cast(func.ST_SetSRID(func.ST_GeomFromText(point), 4326), Geography),
                 distance_km * 1000  # Convert km to meters
             )
         ).all()
@@ -219,8 +254,8 @@ class GeoSpatialRepository:
         results = self.db.query(
             MahalleRiskData,
             func.ST_Distance(
-                MahalleRiskData.geometry,
-                func.ST_SetSRID(func.ST_GeomFromText(point), 4326)::Geography
+                cast(MahalleRiskData.geometry, Geography),
+                cast(func.ST_SetSRID(func.ST_GeomFromText(point), 4326), Geography)
             ).label('distance')
         ).order_by('distance').limit(limit).all()
 
@@ -320,3 +355,83 @@ class GeoSpatialRepository:
             """)
         )
         self.db.commit()
+
+    def ensure_prediction_columns(self):
+        """
+        Add prediction write-back columns to existing tables
+        (create_all does not alter tables created before they were added)
+        """
+        self.db.execute(
+            text("""
+                ALTER TABLE mahalle_risk_data
+                    ADD COLUMN IF NOT EXISTS predicted_risk DOUBLE PRECISION,
+                    ADD COLUMN IF NOT EXISTS predicted_at TIMESTAMP,
+                    ADD COLUMN IF NOT EXISTS prediction_feature_hash VARCHAR(32),
+                    ADD COLUMN IF NOT EXISTS prediction_model_version VARCHAR(64),
+                    ADD COLUMN IF NOT EXISTS predicted_class INTEGER,
+                    ADD COLUMN IF NOT EXISTS prediction_confidence DOUBLE PRECISION,
+                    ADD COLUMN IF NOT EXISTS class_predicted_at TIMESTAMP,
+                    ADD COLUMN IF NOT EXISTS class_feature_hash VARCHAR(32),
+                    ADD COLUMN IF NOT EXISTS class_model_version VARCHAR(64);
+                CREATE INDEX IF NOT EXISTS ix_mahalle_risk_data_prediction_model_version
+                    ON mahalle_risk_data (prediction_model_version);
+                CREATE INDEX IF NOT EXISTS ix_mahalle_risk_data_class_model_version
+                    ON mahalle_risk_data (class_model_version);
+            """)
+        )
+        self.db.commit()
+
+    def bulk_update_predictions(self, ids: List[int], predictions: List[float],
+                                confidences: Optional[List[Optional[float]]] = None,
+                                feature_hashes: Optional[List[Optional[str]]] = None,
+                                model_version: Optional[str] = None,
+                                batch_size: int = 1000,
+                                model_type: str = 'regressor') -> int:
+        """
+        Write predictions back with set-based UPDATE ... FROM (VALUES ...) statements
+        feature_hashes / model_version record what each prediction was made from,
+        so unchanged rows can be skipped next time
+        model_type picks the columns written (see PREDICTION_COLUMNS)
+        """
+        columns = PREDICTION_COLUMNS[model_type]
+        assignments = [f"{columns['prediction']} = CAST(v.prediction AS {columns['prediction_type']})"]
+        if columns['confidence']:
+            assignments.append(f"{columns['confidence']} = CAST(v.confidence AS DOUBLE PRECISION)")
+        assignments += [f"{columns['feature_hash']} = CAST(v.feature_hash AS VARCHAR)",
+                        f"{columns['model_version']} = CAST(:model_version AS VARCHAR)",
+                        f"{columns['predicted_at']} = now()"]
+
+        if confidences is None:
+            confidences = [None] * len(ids)
+        if feature_hashes is None:
+            feature_hashes = [None] * len(ids)
+
+        updated = 0
+        for start in range(0, len(ids), batch_size):
+            rows = list(zip(ids[start:start + batch_size],
+                            predictions[start:start + batch_size],
+                            confidences[start:start + batch_size],
+                            feature_hashes[start:start + batch_size]))
+
+            params = {'model_version': model_version}
+            values = []
+            for i, (item_id, prediction, confidence, feature_hash) in enumerate(rows):
+                values.append(f"(:id_{i}, :risk_{i}, :conf_{i}, :hash_{i})")
+                params[f"id_{i}"] = int(item_id)
+                params[f"risk_{i}"] = None if prediction is None else float(prediction)
+                params[f"conf_{i}"] = None if confidence is None else float(confidence)
+                params[f"hash_{i}"] = feature_hash
+
+            result = self.db.execute(
+                text(f"""
+                    UPDATE mahalle_risk_data AS m
+                    SET {', '.join(assignments)}
+                    FROM (VALUES {', '.join(values)}) AS v(id, prediction, confidence, feature_hash)
+                    WHERE m.id = CAST(v.id AS INTEGER)
+                """),
+                params
+            )
+            updated += result.rowcount
+
+        self.db.commit()
+        return updated
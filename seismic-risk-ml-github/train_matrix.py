@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+🗺️ Seismic Risk Assessment - Multi-City Training Matrix
+=======================================================
+Trains Model A and Model B for every (city, year) snapshot, running the
+jobs concurrently under a global CPU and memory budget. Each job writes
+to its own versioned directory and the run ends with one comparison report
+
+Usage:
+    python train_matrix.py --cities istanbul,ankara --years 2025,2026
+    python train_matrix.py --cities istanbul,ankara,izmir --n-jobs 32 --memory-gb 96
+"""
+
+import os
+import sys
+import time
+import json
+import argparse
+import subprocess
+import pandas as pd
+import pyarrow.parquet as pq
+from pathlib import Path
+from datetime import datetime
+
+from train_models import Config, ensure_snapshots, print_header, print_section, save_json
+
+# Memory estimate per job: interpreter and libraries, plus training copies per row
+JOB_BASE_MB = 512
+JOB_MB_PER_1K_ROWS = 16
+
+METRICS = {
+    'model_a': ['rmse', 'mae', 'spearman'],
+    'model_b': ['qwk', 'macro_f1', 'balanced_accuracy']
+}
+
+class MatrixJob:
+    """One (city, year) training run in a subprocess"""
+
+    def __init__(self, city, year, snapshot, rows, output_dir):
+        self.city = city
+        self.year = year
+        self.snapshot = snapshot
+        self.rows = rows
+        self.output_dir = output_dir
+        self.threads = None
+        self.process = None
+        self.log_file = None
+        self.started = None
+        self.elapsed = None
+        self.returncode = None
+
+    @property
+    def name(self):
+        return f"{self.city}/{self.year}"
+
+    @property
+    def memory_mb(self):
+        return JOB_BASE_MB + self.rows * JOB_MB_PER_1K_ROWS / 1000
+
+    def start(self, threads, train_args):
+        """Launch train_models.py for this city and year, logging to train.log"""
+        self.threads = threads
+        self.output_dir.mkdir(exist_ok=True, parents=True)
+        command = [sys.executable, str(Path(__file__).with_name('train_models.py')),
+                   '--cities', self.city, '--years', str(self.year),
+                   '--output-dir', str(self.output_dir), '--n-jobs', str(threads)] + train_args
+        # Native thread pools (BLAS, OpenMP) stay inside the job's share
+        env = dict(os.environ, OMP_NUM_THREADS=str(threads), OPENBLAS_NUM_THREADS=str(threads),
+                   MKL_NUM_THREADS=str(threads))
+
+        self.log_file = open(self.output_dir / 'train.log', 'w', encoding='utf-8')
+        self.started = time.perf_counter()
+        self.process = subprocess.Popen(command, stdout=self.log_file, stderr=subprocess.STDOUT, env=env)
+
+    def poll(self):
+        """True once the subprocess has exited"""
+        if self.process.poll() is None:
+            return False
+        self.returncode = self.process.returncode
+        self.elapsed = time.perf_counter() - self.started
+        self.log_file.close()
+        return True
+
+    def report(self):
+        """Row of the comparison report: status, timing and CV metrics"""
+        row = {
+            'city': self.city,
+            'year': self.year,
+            'rows': self.rows,
+            'snapshot': self.snapshot.name,
+            'status': 'failed',
+            'elapsed_s': round(self.elapsed, 1) if self.elapsed is not None else None,
+            'threads': self.threads,
+            'output_dir': str(self.output_dir)
+        }
+        results_path = self.output_dir / 'artifacts' / 'training_results.json'
+        if self.returncode == 0 and results_path.exists():
+            with open(results_path, encoding='utf-8') as f:
+                results = json.load(f)
+            row['status'] = 'ok'
+            for model, metrics in METRICS.items():
+                for metric in metrics:
+                    row[metric] = results[model]['metrics'][metric]
+
+        distill_path = self.output_dir / 'artifacts' / 'distillation_report.json'
+        if row['status'] == 'ok' and distill_path.exists():
+            with open(distill_path, encoding='utf-8') as f:
+                distill = json.load(f)
+            row['student_a'] = distill['model_a']['accepted']
+            row['student_b'] = distill['model_b']['accepted']
+        return row
+
+    def log_tail(self, lines=5):
+        with open(self.output_dir / 'train.log', encoding='utf-8', errors='replace') as f:
+            return f.read().splitlines()[-lines:]
+
+def total_memory_mb():
+    """Physical memory in MB, or None where sysconf is unavailable"""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 1024 ** 2
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def plan_jobs(cities, years, output_root, run_id, refresh=False):
+    """
+    Export (or reuse) one snapshot per city and year, and a job per snapshot
+    Jobs write to output_root/<city>/<year>/<run_id>
+    """
+    jobs = []
+    for path in ensure_snapshots(cities, years, refresh=refresh):
+        meta = pq.read_metadata(str(path))
+        city = meta.metadata[b'city'].decode()
+        year = int(meta.metadata[b'year'])
+        jobs.append(MatrixJob(city, year, path, meta.num_rows, output_root / city / str(year) / run_id))
+    return jobs
+
+def threads_per_job(jobs, n_jobs, memory_mb):
+    """Split the CPU budget over as many jobs as can run at once"""
+    concurrent = min(len(jobs), n_jobs)
+    if memory_mb:
+        concurrent = min(concurrent, int(memory_mb // max(job.memory_mb for job in jobs)))
+    return max(1, n_jobs // max(1, concurrent))
+
+def run_matrix(jobs, n_jobs, memory_mb, threads, train_args, poll_seconds=0.5):
+    """
+    Start jobs largest first while CPU slots and the memory estimate allow;
+    a job larger than the whole memory budget runs on its own
+    """
+    pending = sorted(jobs, key=lambda job: job.rows, reverse=True)
+    running = []
+    slots = max(1, n_jobs // threads)
+
+    while pending or running:
+        for job in [job for job in running if job.poll()]:
+            running.remove(job)
+            status = '✓' if job.returncode == 0 else '❌'
+            print(f"  {status} {job.name}: finished in {job.elapsed:.1f}s (exit {job.returncode})")
+
+        reserved = sum(job.memory_mb for job in running)
+        while pending and len(running) < slots:
+            job = next((job for job in pending
+                        if not memory_mb or reserved + job.memory_mb <= memory_mb), None)
+            if job is None and not running:
+                job = pending[0]
+            if job is None:
+                break
+            pending.remove(job)
+            job.start(threads, train_args)
+            running.append(job)
+            reserved += job.memory_mb
+            print(f"  ▶ {job.name}: {job.rows} rows, {threads} threads, ~{job.memory_mb:.0f} MB "
+                  f"({len(running)} running, {len(pending)} queued)")
+
+        if running:
+            time.sleep(poll_seconds)
+
+def comparison_report(jobs, output_root, run_id):
+    """One table of all jobs, saved as CSV and JSON next to the job directories"""
+    report = pd.DataFrame([job.report() for job in jobs]).sort_values(['city', 'year'])
+    report.to_csv(output_root / f'matrix_report_{run_id}.csv', index=False)
+    save_json(json.loads(report.to_json(orient='records')), output_root / f'matrix_report_{run_id}.json')
+    return report
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train every (city, year) in parallel")
+    parser.add_argument('--cities', required=True, help="Comma-separated cities")
+    parser.add_argument('--years', default=None, help="Comma-separated years (default: all per city)")
+    parser.add_argument('--refresh-snapshots', action='store_true',
+                        help="Re-export Parquet snapshots even if the database is unchanged")
+    parser.add_argument('--n-jobs', type=int, default=Config.N_JOBS, help="Total CPU threads")
+    parser.add_argument('--threads-per-job', type=int, default=None,
+                        help="Threads per training job (default: split --n-jobs over the jobs)")
+    parser.add_argument('--memory-gb', type=float, default=None,
+                        help="Total memory budget (default: 80%% of physical memory)")
+    parser.add_argument('--output-root', default=str(Config.OUTPUT_DIR / 'matrix'))
+    parser.add_argument('--use-tuned', action='store_true',
+                        help="Each job uses the params tuned on its own city and year")
+    parser.add_argument('--skip-distill', action='store_true', help="Passed to every job")
+    parser.add_argument('--no-stage-cache', action='store_true', help="Passed to every job")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Train the matrix and write the comparison report"""
+    args = parse_args(argv)
+    run_id = datetime.now().strftime('%Y%m%d-%H%M%S')
+    output_root = Path(args.output_root)
+    output_root.mkdir(exist_ok=True, parents=True)
+
+    print_header("🗺️  SEISMIC RISK ASSESSMENT - TRAINING MATRIX")
+    print(f"Run: {run_id}")
+
+    print_section("1. SNAPSHOTS")
+    cities = [city.strip().lower() for city in args.cities.split(',') if city.strip()]
+    years = [int(year) for year in args.years.split(',')] if args.years else None
+    jobs = plan_jobs(cities, years, output_root, run_id, args.refresh_snapshots)
+    if not jobs:
+        print(f"❌ ERROR: No rows found for the selected cities and years!")
+        return None
+
+    print_section("2. TRAINING")
+    if args.memory_gb:
+        memory_mb = args.memory_gb * 1024
+    else:
+        memory_mb = total_memory_mb() and total_memory_mb() * 0.8
+    threads = args.threads_per_job or threads_per_job(jobs, args.n_jobs, memory_mb)
+    print(f"Budget: {args.n_jobs} threads, "
+          f"{f'{memory_mb / 1024:.1f} GB' if memory_mb else 'unlimited memory'}, "
+          f"{len(jobs)} jobs x {threads} threads")
+
+    train_args = [flag for flag, enabled in (('--use-tuned', args.use_tuned),
+                                             ('--skip-distill', args.skip_distill),
+                                             ('--no-stage-cache', args.no_stage_cache)) if enabled]
+    start = time.perf_counter()
+    run_matrix(jobs, args.n_jobs, memory_mb, threads, train_args)
+    elapsed = time.perf_counter() - start
+
+    print_section("3. COMPARISON")
+    report = comparison_report(jobs, output_root, run_id)
+    columns = [col for col in ['city', 'year', 'rows', 'status', 'elapsed_s'] + METRICS['model_a'] +
+               METRICS['model_b'] + ['student_a', 'student_b'] if col in report.columns]
+    print(report[columns].to_string(index=False, float_format=lambda value: f"{value:.4f}",
+                                    formatters={'elapsed_s': lambda value: f"{value:.1f}"}))
+
+    failed = [job for job in jobs if job.report()['status'] != 'ok']
+    for job in failed:
+        print(f"\n❌ {job.name} failed, last lines of {job.output_dir / 'train.log'}:")
+        for line in job.log_tail():
+            print(f"   {line}")
+
+    print(f"\n⏱️  {len(jobs)} jobs in {elapsed:.1f}s "
+          f"(sum of job times {sum(job.elapsed or 0 for job in jobs):.1f}s)")
+    return report
+
+if __name__ == '__main__':
+    report = main()
+    sys.exit(0 if report is not None and (report['status'] == 'ok').all() else 1)
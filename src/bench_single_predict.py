@@ -0,0 +1,104 @@
+"""
+Benchmark: single-neighborhood prediction latency, pandas path vs fast path
+Usage: python bench_single_predict.py [--calls 2000] [--dtype float32]
+"""
+import argparse
+import json
+import time
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Any
+from prediction_service import PredictionService
+
+
+DEFAULT_MODELS = [
+    "src/model/final_lightgbm_regressor.pkl",
+    "src/model/final_lightgbm_classifier.pkl"
+]
+
+
+def time_calls(fn, records: List[Dict[str, Any]]) -> np.ndarray:
+    """Per-call latency in microseconds"""
+    latencies = np.empty(len(records))
+    for i, record in enumerate(records):
+        start = time.perf_counter_ns()
+        fn(record)
+        latencies[i] = (time.perf_counter_ns() - start) / 1000.0
+    return latencies
+
+
+def summarize(latencies: np.ndarray) -> Dict[str, float]:
+    return {
+        'p50_us': float(np.percentile(latencies, 50)),
+        'p99_us': float(np.percentile(latencies, 99)),
+        'mean_us': float(latencies.mean())
+    }
+
+
+def benchmark_model(model_path: str, records: List[Dict[str, Any]], dtype: str,
+                    warmup: int = 50) -> Dict[str, Any]:
+    """
+    Time predict_single before (pandas) and after (schema + compiled trees)
+    """
+    predictor = PredictionService(model_path=model_path)
+
+    for record in records[:warmup]:
+        predictor.predict_single(record)
+    baseline = time_calls(predictor.predict_single, records)
+    reference = [predictor.predict_single(record) for record in records]
+
+    predictor.enable_fast_path(dtype=dtype)
+    for record in records[:warmup]:
+        predictor.predict_single(record)
+    fast = time_calls(predictor.predict_single, records)
+    fast_results = [predictor.predict_single(record) for record in records]
+
+    max_error = max(abs(a['prediction'] - b['prediction']) for a, b in zip(reference, fast_results))
+    if 'probabilities' in reference[0]:
+        max_error = max(max_error, max(
+            float(np.abs(np.subtract(a['probabilities'], b['probabilities'])).max())
+            for a, b in zip(reference, fast_results)
+        ))
+
+    before, after = summarize(baseline), summarize(fast)
+    print(f"\n{model_path} ({len(records)} calls, {dtype} row buffer)")
+    print(f"{'':>10} {'p50 (us)':>10} {'p99 (us)':>10} {'mean (us)':>10}")
+    print(f"{'pandas':>10} {before['p50_us']:>10.1f} {before['p99_us']:>10.1f} {before['mean_us']:>10.1f}")
+    print(f"{'fast':>10} {after['p50_us']:>10.1f} {after['p99_us']:>10.1f} {after['mean_us']:>10.1f}")
+    print(f"Speedup (p50): {before['p50_us'] / after['p50_us']:.1f}x, max |difference| = {max_error:.2e}")
+
+    return {
+        'model': model_path,
+        'calls': len(records),
+        'dtype': dtype,
+        'pandas': before,
+        'fast': after,
+        'speedup_p50': before['p50_us'] / after['p50_us'],
+        'max_abs_difference': max_error
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--models', nargs='*', default=DEFAULT_MODELS)
+    parser.add_argument('--data', default="public/data/istanbul_risk_data.csv")
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--dtype', default='float32', choices=['float32', 'float64'])
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None, help="Write results as JSON")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.data)
+    index = np.random.default_rng(args.seed).integers(0, len(df), size=args.calls)
+    records = df.iloc[index].to_dict('records')
+
+    results = [benchmark_model(model_path, records, args.dtype) for model_path in args.models]
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
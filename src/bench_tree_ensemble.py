@@ -0,0 +1,108 @@
+"""
+Benchmark: compiled NumPy tree ensemble vs native LightGBM predict
+Usage: python bench_tree_ensemble.py [--sizes 1,100,10000] [--dtype float32]
+"""
+import argparse
+import json
+import time
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Any
+from model_registry import get_registry
+from tree_ensemble import CompiledTreeEnsemble, check_against_model
+
+
+DEFAULT_MODELS = [
+    "src/model/final_lightgbm_regressor.pkl",
+    "src/model/final_lightgbm_classifier.pkl"
+]
+DEFAULT_SIZES = "1,10,100,1000,10000,100000,1000000"
+
+
+def sample_rows(data_file: str, feature_columns: List[str], n_rows: int, seed: int = 42) -> np.ndarray:
+    """
+    Resample real neighborhoods (with replacement) up to n_rows
+    """
+    df = pd.read_csv(data_file)
+    rng = np.random.default_rng(seed)
+    index = rng.integers(0, len(df), size=n_rows)
+    return df[feature_columns].to_numpy(dtype=np.float64)[index]
+
+
+def best_time(fn, repeat: int) -> float:
+    """Best wall-clock time of repeat runs"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark_model(model_path: str, data_file: str, sizes: List[int], dtype: str,
+                    n_threads: int, repeat: int) -> List[Dict[str, Any]]:
+    """
+    Time native and compiled prediction for each batch size
+    """
+    entry = get_registry().get(model_path)
+    model = entry.model
+    compiled = CompiledTreeEnsemble.from_model(model)
+    native_predict = model.predict_proba if compiled.classes is not None else model.predict
+    compiled_predict = compiled.predict_proba if compiled.classes is not None else compiled.predict
+
+    # Pipelines fitted on arrays only record placeholder names; the artifact has the real ones
+    feature_columns = entry.preprocessor.feature_columns if entry.preprocessor else compiled.feature_names
+
+    X_all = sample_rows(data_file, feature_columns, max(sizes)).astype(dtype)
+
+    check = check_against_model(model, compiled, X_all[:10000].astype(np.float64))
+    print(f"\n{model_path}: {compiled.info()['num_trees']} trees, "
+          f"max |error| vs LightGBM = {check['max_abs_error']:.2e}")
+    print(f"{'rows':>10} {'native (s)':>12} {'compiled (s)':>13} {'speedup':>9}")
+
+    results = []
+    for size in sizes:
+        X = X_all[:size]
+        runs = repeat if size <= 100000 else 1
+        native = best_time(lambda: native_predict(X), runs)
+        fast = best_time(lambda: compiled_predict(X, n_threads=n_threads), runs)
+
+        print(f"{size:>10} {native:>12.6f} {fast:>13.6f} {native / fast:>8.2f}x")
+        results.append({
+            'model': model_path,
+            'rows': size,
+            'dtype': dtype,
+            'native_seconds': native,
+            'compiled_seconds': fast,
+            'speedup': native / fast,
+            'max_abs_error': check['max_abs_error']
+        })
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--models', nargs='*', default=DEFAULT_MODELS)
+    parser.add_argument('--data', default="public/data/istanbul_risk_data.csv")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES)
+    parser.add_argument('--dtype', default='float32', choices=['float32', 'float64'])
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=None, help="Write results as JSON")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    results = []
+    for model_path in args.models:
+        results.extend(benchmark_model(model_path, args.data, sizes, args.dtype,
+                                       args.threads, args.repeat))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
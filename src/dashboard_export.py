@@ -0,0 +1,278 @@
+"""
+Fused Dashboard Export
+Scores a city-year file with both the regressor and the classifier from one
+prepared feature matrix and writes the dashboard CSV / GeoJSON schema
+
+Usage:
+    python dashboard_export.py public/data/istanbul_risk_data.csv public/data/2025_istanbul.csv --city Istanbul
+    python dashboard_export.py data.csv out.csv --year 2026
+    python dashboard_export.py data.csv out.csv --thresholds 0.15,0.25,0.35,0.45
+"""
+import argparse
+import json
+import re
+import time
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+from model_registry import get_registry
+
+
+DEFAULT_REGRESSOR_PATH = "src/model/final_lightgbm_regressor.pkl"
+DEFAULT_CLASSIFIER_PATH = "src/model/final_lightgbm_classifier.pkl"
+
+DASHBOARD_COLUMNS = [
+    'mah_id', 'il', 'ilce', 'mahalle_adi',
+    'risk_score_pred', 'risk_class_5_pred', 'risk_label_pred',
+    'risk_proba_c1', 'risk_proba_c2', 'risk_proba_c3', 'risk_proba_c4', 'risk_proba_c5',
+    'vs30', 'population', 'building_count'
+]
+
+# Dashboard column -> accepted source columns, in order of preference
+SOURCE_COLUMNS = {
+    'mah_id': ['mah_id'],
+    'il': ['il'],
+    'ilce': ['ilce', 'ilce_adi'],
+    'mahalle_adi': ['mahalle_adi', 'name'],
+    'vs30': ['vs30', 'vs30_mean'],
+    'population': ['population', 'toplam_nufus'],
+    'building_count': ['building_count', 'toplam_bina']
+}
+
+# risk_score_pred boundaries between labels, per dashboard year, as used in
+# the published files; Very High above the last one
+RISK_LABEL_THRESHOLDS = {
+    2025: (0.18, 0.23, 0.30, 0.43),
+    2026: (0.15, 0.25, 0.35, 0.45)
+}
+# Years whose boundaries belong to the lower label (2025: 0.23 is Low);
+# from 2026 a score on a boundary gets the higher label (0.25 is Medium)
+UPPER_INCLUSIVE_YEARS = {2025}
+DEFAULT_LABEL_YEAR = max(RISK_LABEL_THRESHOLDS)
+RISK_LABELS = ['Very Low', 'Low', 'Medium', 'High', 'Very High']
+
+DECIMALS = 4
+
+
+def label_year(year: Optional[int] = None) -> int:
+    """
+    Label scheme year for a data year: the latest scheme not newer than it
+    (the oldest one for earlier years, the newest without a year)
+    """
+    if year is None:
+        return DEFAULT_LABEL_YEAR
+    known = [y for y in sorted(RISK_LABEL_THRESHOLDS) if y <= year]
+    return known[-1] if known else min(RISK_LABEL_THRESHOLDS)
+
+
+def label_thresholds(year: Optional[int] = None) -> Tuple[float, ...]:
+    return RISK_LABEL_THRESHOLDS[label_year(year)]
+
+
+def year_from_filename(*paths: Optional[str]) -> Optional[int]:
+    """
+    First 20xx year in the file names, e.g. 2026 for public/data/2026_ankara.csv
+    """
+    for path in paths:
+        match = re.search(r'(?<!\d)(20\d{2})(?!\d)', Path(path).name) if path else None
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def risk_labels(scores: np.ndarray, year: Optional[int] = None,
+                thresholds: Optional[Sequence[float]] = None) -> np.ndarray:
+    """
+    Map regression scores to dashboard labels with the year's boundaries,
+    or explicit thresholds (a score on a boundary gets the higher label)
+    """
+    if thresholds is None:
+        thresholds = label_thresholds(year)
+        upper_inclusive = label_year(year) in UPPER_INCLUSIVE_YEARS
+    else:
+        upper_inclusive = False
+    return np.array(RISK_LABELS, dtype=object)[np.digitize(scores, thresholds, right=upper_inclusive)]
+
+
+class FusedPredictionService:
+    """
+    Holds the regressor and classifier together and evaluates both on one
+    prepared feature matrix
+    """
+
+    def __init__(self, regressor_path: str = DEFAULT_REGRESSOR_PATH,
+                 classifier_path: str = DEFAULT_CLASSIFIER_PATH):
+        registry = get_registry()
+        self.regressor_entry = registry.get(regressor_path)
+        self.classifier_entry = registry.get(classifier_path)
+
+        regressor_prep = self.regressor_entry.preprocessor
+        classifier_prep = self.classifier_entry.preprocessor
+        if regressor_prep is None or classifier_prep is None:
+            raise ValueError("Both models need a preprocessing artifact for fused inference")
+
+        self.preprocessor = regressor_prep
+        # Artifacts fitted on the same data are interchangeable; otherwise prepare twice
+        self.shared_features = (
+            {k: v for k, v in regressor_prep.to_dict().items() if k != 'metadata'} ==
+            {k: v for k, v in classifier_prep.to_dict().items() if k != 'metadata'}
+        )
+        self.timings: Dict[str, float] = {}
+
+        print(f"Fused models: {self.regressor_entry.version} + {self.classifier_entry.version} "
+              f"({'shared' if self.shared_features else 'separate'} feature preparation)")
+
+    def predict_arrays(self, data: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns (risk scores, predicted classes, class probabilities)
+        """
+        start = time.perf_counter()
+        X = self.preprocessor.transform(data)
+        X_classifier = X if self.shared_features else self.classifier_entry.preprocessor.transform(data)
+        prepared = time.perf_counter()
+
+        scores = np.asarray(self.regressor_entry.model.predict(X))
+        regressed = time.perf_counter()
+
+        probas = np.asarray(self.classifier_entry.model.predict_proba(X_classifier))
+        classes = np.asarray(self.classifier_entry.model.classes_)[probas.argmax(axis=1)]
+        classified = time.perf_counter()
+
+        self.timings = {
+            'prepare_seconds': prepared - start,
+            'regressor_seconds': regressed - prepared,
+            'classifier_seconds': classified - regressed
+        }
+        return scores, classes, probas
+
+    def predict_frame(self, data: pd.DataFrame, city: Optional[str] = None,
+                      year: Optional[int] = None,
+                      thresholds: Optional[Sequence[float]] = None) -> pd.DataFrame:
+        """
+        Score a DataFrame and return it in the dashboard CSV schema
+        Labels use the boundaries of the given year (see risk_labels)
+        """
+        scores, classes, probas = self.predict_arrays(data)
+
+        result = pd.DataFrame(index=data.index)
+        for column in ['mah_id', 'il', 'ilce', 'mahalle_adi']:
+            result[column] = _source_column(data, column)
+        if city is not None:
+            result['il'] = city
+
+        result['risk_score_pred'] = np.round(scores, DECIMALS)
+        result['risk_class_5_pred'] = classes
+        result['risk_label_pred'] = risk_labels(result['risk_score_pred'].to_numpy(), year, thresholds)
+
+        for i in range(probas.shape[1]):
+            result[f'risk_proba_c{i + 1}'] = np.round(probas[:, i], DECIMALS)
+
+        for column in ['vs30', 'population', 'building_count']:
+            result[column] = _source_column(data, column)
+        if result['vs30'].notna().any():
+            result['vs30'] = pd.to_numeric(result['vs30'], errors='coerce').round(2)
+
+        return result[[col for col in DASHBOARD_COLUMNS if col in result.columns]].reset_index(drop=True)
+
+    def export_csv(self, input_file: str, output_file: str, city: Optional[str] = None,
+                   year: Optional[int] = None, thresholds: Optional[Sequence[float]] = None) -> str:
+        """
+        Score a CSV or GeoJSON file and write the dashboard CSV
+        """
+        data = load_input_frame(input_file)
+        result = self.predict_frame(data, city, year, thresholds)
+        result.to_csv(output_file, index=False)
+
+        self._report(len(result), output_file)
+        return output_file
+
+    def export_geojson(self, input_file: str, output_file: str, city: Optional[str] = None,
+                       year: Optional[int] = None, thresholds: Optional[Sequence[float]] = None) -> str:
+        """
+        Score a GeoJSON file and add the dashboard fields to every feature
+        """
+        with open(input_file, 'r', encoding='utf-8') as f:
+            geojson_data = json.load(f)
+
+        features = geojson_data.get('features', [])
+        data = pd.DataFrame.from_records([feature.get('properties') or {} for feature in features])
+        result = self.predict_frame(data, city, year, thresholds)
+
+        # to_json turns numpy scalars and NaN into plain JSON values
+        rows = json.loads(result.to_json(orient='records', force_ascii=False))
+        for feature, row in zip(features, rows):
+            feature['properties'] = {**(feature.get('properties') or {}), **row}
+
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(geojson_data, f, ensure_ascii=False)
+
+        self._report(len(features), output_file)
+        return output_file
+
+    def _report(self, rows: int, output_file: str):
+        t = self.timings
+        print(f"Scored {rows} neighborhoods -> {output_file} "
+              f"(prepare {t['prepare_seconds'] * 1000:.1f} ms, "
+              f"regressor {t['regressor_seconds'] * 1000:.1f} ms, "
+              f"classifier {t['classifier_seconds'] * 1000:.1f} ms)")
+
+
+def _source_column(data: pd.DataFrame, column: str):
+    for source in SOURCE_COLUMNS.get(column, [column]):
+        if source in data.columns:
+            return data[source].to_numpy()
+    return None
+
+
+def load_input_frame(input_file: str) -> pd.DataFrame:
+    """
+    Read neighborhood rows from a CSV or the properties of a GeoJSON file
+    """
+    if input_file.endswith(('.geojson', '.json')):
+        with open(input_file, 'r', encoding='utf-8') as f:
+            features = json.load(f).get('features', [])
+        return pd.DataFrame.from_records([feature.get('properties') or {} for feature in features])
+    return pd.read_csv(input_file)
+
+
+def export_dashboard_file(input_file: str, output_file: str, city: Optional[str] = None,
+                          regressor_path: str = DEFAULT_REGRESSOR_PATH,
+                          classifier_path: str = DEFAULT_CLASSIFIER_PATH,
+                          year: Optional[int] = None,
+                          thresholds: Optional[Sequence[float]] = None) -> str:
+    """
+    Quick helper: pick CSV or GeoJSON output by the output file extension
+    Without year or thresholds, the label year is taken from the output
+    (then input) file name, e.g. 2026_istanbul.csv
+    """
+    if year is None and thresholds is None:
+        year = year_from_filename(output_file, input_file)
+    if thresholds is None:
+        print(f"Risk labels: {label_year(year)} boundaries {label_thresholds(year)}")
+
+    service = FusedPredictionService(regressor_path, classifier_path)
+    if output_file.endswith(('.geojson', '.json')):
+        return service.export_geojson(input_file, output_file, city, year, thresholds)
+    return service.export_csv(input_file, output_file, city, year, thresholds)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write dashboard predictions with both models")
+    parser.add_argument('input_file', help="CSV or GeoJSON with model features")
+    parser.add_argument('output_file', help="Dashboard .csv or .geojson")
+    parser.add_argument('--city', default=None, help="Value for the 'il' column")
+    parser.add_argument('--regressor', default=DEFAULT_REGRESSOR_PATH)
+    parser.add_argument('--classifier', default=DEFAULT_CLASSIFIER_PATH)
+    parser.add_argument('--year', type=int, default=None,
+                        help="Label boundaries of this dashboard year (default: from the file name)")
+    parser.add_argument('--thresholds', default=None,
+                        help="Comma-separated label boundaries, overriding --year")
+    args = parser.parse_args()
+
+    thresholds = [float(value) for value in args.thresholds.split(',')] if args.thresholds else None
+    if thresholds is not None and len(thresholds) != len(RISK_LABELS) - 1:
+        parser.error(f"--thresholds needs {len(RISK_LABELS) - 1} values")
+
+    export_dashboard_file(args.input_file, args.output_file, args.city,
+                          args.regressor, args.classifier, args.year, thresholds)
@@ -9,7 +9,7 @@ from datetime import datetime
 from pathlib import Path
 from database_config import SessionLocal, init_db
 from etl_service import ETLService
-from prediction_service import PredictionService
+from prediction_service import PredictionService, fork_available, run_forked
 
 
 class DataPipeline:
@@ -17,12 +17,16 @@ class DataPipeline:
     Orchestrates ETL and prediction workflows
     """
 
-    def __init__(self, model_path: Optional[str] = None):
+    def __init__(self, model_path: Optional[str] = None, cache_path: Optional[str] = None):
         self.db = SessionLocal()
         self.etl = ETLService(self.db)
         self.predictor = PredictionService(model_path, self.db) if model_path else None
         self.results = []
 
+        # Unchanged neighborhoods are not re-scored; cache_path keeps them across runs
+        if self.predictor:
+            self.predictor.enable_cache(db_path=cache_path)
+
     def __enter__(self):
         return self
 
@@ -82,7 +86,8 @@ class DataPipeline:
                         'step': 'prediction',
                         'success': True,
                         'output_file': output_file,
-                        'predictions_count': len(predicted_data['features'])
+                        'predictions_count': len(predicted_data['features']),
+                        'cache_hit_rate': predicted_data['metadata'].get('cache_hit_rate')
                     })
                     print(f"✓ Predictions saved to: {output_file}\n")
                 else:
@@ -115,9 +120,12 @@ class DataPipeline:
         return pipeline_result
 
     def batch_process_directory(self, input_dir: str, output_dir: str = None,
-                                year: int = None, pattern: str = "*.geojson") -> List[Dict[str, Any]]:
+                                year: int = None, pattern: str = "*.geojson",
+                                workers: int = 1) -> List[Dict[str, Any]]:
         """
         Process all files in directory through pipeline
+        With workers > 1 files run in a forked process pool that shares the
+        loaded model copy-on-write; each worker opens its own database session
         """
         input_path = Path(input_dir)
         files = list(input_path.glob(pattern))
@@ -128,30 +136,34 @@ class DataPipeline:
             output_path = Path(output_dir)
             output_path.mkdir(parents=True, exist_ok=True)
 
-        results = []
-
-        for i, file_path in enumerate(files, 1):
-            print(f"\n[{i}/{len(files)}] Processing {file_path.name}")
-
+        def process(pipeline, file_path: Path) -> Dict[str, Any]:
             output_file = None
             if output_dir:
                 output_file = str(Path(output_dir) / f"predicted_{file_path.name}")
 
             try:
-                result = self.run_full_pipeline(
+                return pipeline.run_full_pipeline(
                     str(file_path),
                     output_file,
                     year,
-                    make_predictions=bool(self.predictor)
+                    make_predictions=bool(pipeline.predictor)
                 )
-                results.append(result)
             except Exception as e:
                 print(f"Error processing {file_path}: {e}")
-                results.append({
+                return {
                     'input_file': str(file_path),
                     'success': False,
                     'error': str(e)
-                })
+                }
+
+        if workers > 1 and len(files) > 1 and fork_available():
+            cache = self.predictor.cache if self.predictor else None
+            results = run_forked(self, files, process, workers, cache=cache)
+        else:
+            results = []
+            for i, file_path in enumerate(files, 1):
+                print(f"\n[{i}/{len(files)}] Processing {file_path.name}")
+                results.append(process(self, file_path))
 
         # Summary
         print(f"\n{'='*80}")
@@ -160,10 +172,21 @@ class DataPipeline:
         print(f"Total files: {len(files)}")
         print(f"Successful: {sum(1 for r in results if r.get('success'))}")
         print(f"Failed: {sum(1 for r in results if not r.get('success'))}")
+        if self.predictor and self.predictor.cache is not None:
+            print(f"Prediction cache hit rate: {self.predictor.cache_stats()['hit_rate']:.1%}")
         print(f"{'='*80}\n")
 
         return results
 
+    def after_fork(self):
+        """
+        Give a forked copy of this pipeline its own database session
+        """
+        self.db = SessionLocal()
+        self.etl = ETLService(self.db)
+        if self.predictor:
+            self.predictor.after_fork(self.db)
+
     def incremental_update(self, new_data_file: str, year: int = None) -> Dict[str, Any]:
         """
         Incremental update: only process new/changed data
@@ -200,20 +223,23 @@ class DataPipeline:
             'total_processed': len(features)
         }
 
-    def export_predictions_to_csv(self, output_file: str, district: str = None) -> str:
+    def export_predictions_to_csv(self, output_file: str, district: str = None,
+                                  chunk_size: int = 5000) -> str:
         """
         Export predictions from database to CSV
+        Streams chunks straight to the file, so there is no row cap
         """
         print(f"Exporting predictions to CSV: {output_file}")
 
         filter_params = {'district': district} if district else None
-        predictions = self.predictor.predict_from_database(filter_params, limit=10000)
+        total = 0
 
-        import pandas as pd
-        df = pd.DataFrame(predictions)
-        df.to_csv(output_file, index=False)
+        for i, result_df in enumerate(self.predictor.stream_predictions_from_database(
+                filter_params, chunk_size=chunk_size, limit=None)):
+            result_df.to_csv(output_file, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+            total += len(result_df)
 
-        print(f"Exported {len(df)} records to {output_file}")
+        print(f"Exported {total} records to {output_file}")
         return output_file
 
     def generate_report(self, output_file: str = "pipeline_report.json"):
@@ -223,7 +249,8 @@ class DataPipeline:
         report = {
             'generated_at': datetime.now().isoformat(),
             'database_statistics': self.etl.get_etl_statistics(),
-            'pipeline_runs': self.results
+            'pipeline_runs': self.results,
+            'prediction_cache': self.predictor.cache_stats() if self.predictor else None
         }
 
         with open(output_file, 'w', encoding='utf-8') as f:
@@ -241,12 +268,13 @@ def quick_pipeline(input_file: str, output_file: str = None, model_path: str = N
         return pipeline.run_full_pipeline(input_file, output_file, year)
 
 
-def quick_batch_pipeline(input_dir: str, output_dir: str = None, model_path: str = None):
+def quick_batch_pipeline(input_dir: str, output_dir: str = None, model_path: str = None,
+                         cache_path: str = None, workers: int = 1):
     """
     Quick helper to run pipeline on directory
     """
-    with DataPipeline(model_path=model_path) as pipeline:
-        return pipeline.batch_process_directory(input_dir, output_dir)
+    with DataPipeline(model_path=model_path, cache_path=cache_path) as pipeline:
+        return pipeline.batch_process_directory(input_dir, output_dir, workers=workers)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,160 @@
+"""
+Fitted feature preprocessing artifact
+Stores column order, dtypes and train-time imputation values next to a model
+so every batch is prepared identically, whatever its size
+"""
+import hashlib
+import json
+import math
+import pandas as pd
+from typing import Dict, List, Any, Optional, Union
+from datetime import datetime
+from pathlib import Path
+
+
+ARTIFACT_SUFFIX = '.preprocessing.json'
+ARTIFACT_VERSION = 1
+
+
+class FeaturePreprocessor:
+    """
+    Column selection, numeric coercion and imputation with fixed,
+    train-time statistics
+    """
+
+    def __init__(self, feature_columns: List[str],
+                 dtypes: Optional[Dict[str, str]] = None,
+                 fill_values: Optional[Dict[str, Optional[float]]] = None,
+                 metadata: Optional[Dict[str, Any]] = None):
+        self.feature_columns = list(feature_columns)
+        self.dtypes = dtypes or {col: 'float64' for col in self.feature_columns}
+        self.fill_values = fill_values or {}
+        self.metadata = metadata or {}
+
+        # Precomputed for transform()
+        self._fill_series = pd.Series(
+            {col: self.fill_values.get(col) for col in self.feature_columns},
+            dtype='float64'
+        )
+
+    @classmethod
+    def fit(cls, data: pd.DataFrame, feature_columns: List[str],
+            strategy: str = 'mean') -> 'FeaturePreprocessor':
+        """
+        Fit imputation values on training data
+        """
+        missing = [col for col in feature_columns if col not in data.columns]
+        if missing:
+            raise ValueError(f"Training data is missing feature columns: {missing}")
+
+        X = data[feature_columns].apply(pd.to_numeric, errors='coerce')
+
+        if strategy == 'mean':
+            stats = X.mean()
+        elif strategy == 'median':
+            stats = X.median()
+        else:
+            raise ValueError(f"Unsupported imputation strategy: {strategy}")
+
+        fill_values = {col: (None if pd.isna(stats[col]) else float(stats[col]))
+                       for col in feature_columns}
+        dtypes = {col: str(data[col].dtype) for col in feature_columns}
+
+        metadata = {
+            'strategy': strategy,
+            'n_samples': int(len(X)),
+            'fitted_at': datetime.now().isoformat()
+        }
+
+        return cls(feature_columns, dtypes, fill_values, metadata)
+
+    def transform(self, data: Union[pd.DataFrame, Dict[str, Any]]) -> pd.DataFrame:
+        """
+        Prepare a feature matrix in training column order
+        Missing columns are added and imputed; no statistics are computed from the batch
+        """
+        if isinstance(data, dict):
+            df = pd.DataFrame([data])
+        else:
+            df = data
+
+        X = df.reindex(columns=self.feature_columns)
+        X = X.apply(pd.to_numeric, errors='coerce')
+
+        # Integer columns are served as float64 so imputed values are not truncated
+        X = X.astype({col: (dtype if dtype.startswith('float') else 'float64')
+                      for col, dtype in self.dtypes.items() if col in X.columns})
+
+        return X.fillna(self._fill_series)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize artifact as dictionary"""
+        return {
+            'version': ARTIFACT_VERSION,
+            'feature_columns': self.feature_columns,
+            'dtypes': self.dtypes,
+            'fill_values': self.fill_values,
+            'metadata': self.metadata
+        }
+
+    def fingerprint(self) -> str:
+        """
+        Hash of everything that affects the prepared features (columns, dtypes,
+        fill values), not of the fit metadata
+        """
+        payload = json.dumps({'feature_columns': self.feature_columns, 'dtypes': self.dtypes,
+                              'fill_values': self.fill_values}, sort_keys=True)
+        return hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+    def save(self, file_path: str) -> str:
+        """
+        Save artifact as JSON
+        """
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        return file_path
+
+    @classmethod
+    def load(cls, file_path: str) -> 'FeaturePreprocessor':
+        """
+        Load artifact from JSON
+        """
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        if data.get('version') != ARTIFACT_VERSION:
+            raise ValueError(f"Unsupported preprocessing artifact version: {data.get('version')}")
+
+        fill_values = {col: (None if value is None or (isinstance(value, float) and math.isnan(value))
+                             else float(value))
+                       for col, value in data.get('fill_values', {}).items()}
+
+        return cls(data['feature_columns'], data.get('dtypes'), fill_values, data.get('metadata'))
+
+
+def artifact_path_for(model_path: str) -> str:
+    """
+    Artifact location for a model file, e.g.
+    'model/final_lightgbm_regressor.pkl' -> 'model/final_lightgbm_regressor.preprocessing.json'
+    """
+    path = Path(model_path)
+    return str(path.with_name(path.stem + ARTIFACT_SUFFIX))
+
+
+def model_feature_names(model) -> Optional[List[str]]:
+    """
+    Feature names recorded on a fitted model or pipeline, if any
+    """
+    estimator = model
+    if hasattr(estimator, 'steps'):
+        estimator = estimator.steps[-1][1]
+
+    for attr in ('feature_name_', 'feature_names_in_'):
+        names = getattr(estimator, attr, None)
+        if names is not None and len(names):
+            names = [str(name) for name in names]
+            # sklearn pipelines fitted on arrays record placeholder names
+            if not all(name.startswith('Column_') for name in names):
+                return names
+
+    return None
@@ -0,0 +1,91 @@
+"""
+Precompiled Feature Schema
+Maps dict records or structured NumPy records straight into a preallocated
+row buffer in model column order, without building DataFrames
+"""
+import numpy as np
+from typing import Dict, List, Any, Optional
+from feature_preprocessor import FeaturePreprocessor
+
+
+class FeatureSchema:
+    """
+    Fixed column order and imputation values resolved once, reused per call
+    """
+
+    def __init__(self, feature_columns: List[str], fill_values: Optional[Dict[str, float]] = None,
+                 dtype=np.float32):
+        self.feature_columns = list(feature_columns)
+        self.dtype = np.dtype(dtype)
+        fill_values = fill_values or {}
+        self.fill_values = np.array([fill_values.get(col, np.nan) for col in self.feature_columns],
+                                    dtype=self.dtype)
+        self._slots = list(enumerate(self.feature_columns))
+
+    @classmethod
+    def from_preprocessor(cls, preprocessor: FeaturePreprocessor, dtype=np.float32) -> 'FeatureSchema':
+        """
+        Schema with the same columns and imputation as a fitted artifact
+        """
+        return cls(preprocessor.feature_columns, preprocessor.fill_values, dtype)
+
+    def row_buffer(self) -> np.ndarray:
+        """A new (1, features) buffer, e.g. to reuse across fill_row calls in one thread"""
+        return np.empty((1, len(self.feature_columns)), dtype=self.dtype)
+
+    def has_features(self, record: Dict[str, Any]) -> bool:
+        """True if the record contains at least one schema column"""
+        return any(col in record for col in self.feature_columns)
+
+    def fill_row(self, record: Dict[str, Any], out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Write one record into a (1, features) buffer
+        Missing, None, NaN or unparseable values take the fill value
+        A new buffer is allocated when out is not given, so concurrent calls
+        never share one
+        """
+        row = self.row_buffer() if out is None else out
+        values = row[0]
+        fill = self.fill_values
+
+        for i, col in self._slots:
+            value = record.get(col)
+            if value is None:
+                values[i] = fill[i]
+                continue
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                value = fill[i]
+            values[i] = fill[i] if value != value else value
+
+        return row
+
+    def fill_matrix(self, records: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Write many records into a (rows, features) matrix
+        """
+        matrix = np.empty((len(records), len(self.feature_columns)), dtype=self.dtype)
+        for r, record in enumerate(records):
+            self.fill_row(record, matrix[r:r + 1])
+        return matrix
+
+    def from_structured(self, records: np.ndarray) -> np.ndarray:
+        """
+        Convert a structured NumPy array (named fields) to a feature matrix
+        Fields missing from the array and NaN values take the fill value
+        """
+        records = np.atleast_1d(records)
+        names = records.dtype.names or ()
+        matrix = np.empty((len(records), len(self.feature_columns)), dtype=self.dtype)
+
+        for i, col in self._slots:
+            if col in names:
+                matrix[:, i] = records[col]
+            else:
+                matrix[:, i] = self.fill_values[i]
+
+        missing = np.isnan(matrix)
+        if missing.any():
+            matrix[missing] = np.broadcast_to(self.fill_values, matrix.shape)[missing]
+        return matrix
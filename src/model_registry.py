@@ -0,0 +1,232 @@
+"""
+Process-wide Model Registry
+Caches loaded models by path and file version, shares them across service
+instances and hot-swaps new versions without blocking in-flight predictions
+"""
+import hashlib
+import io
+import os
+import threading
+import time
+import joblib
+from typing import Dict, Any, Optional
+from datetime import datetime
+from pathlib import Path
+from feature_preprocessor import FeaturePreprocessor, artifact_path_for
+
+
+SUPPORTED_MODEL_SUFFIXES = ('.pkl', '.joblib')
+
+
+class ModelEntry:
+    """
+    A loaded model version with its preprocessing artifact and load statistics
+    Entries are immutable; a reload publishes a new entry
+    """
+
+    def __init__(self, path: str, model, preprocessor: Optional[FeaturePreprocessor],
+                 content_hash: str, mtime_ns: int, size_bytes: int,
+                 artifact_mtime_ns: Optional[int], load_seconds: float,
+                 memory_bytes: Optional[int]):
+        self.path = path
+        self.model = model
+        self.preprocessor = preprocessor
+        self.content_hash = content_hash
+        self.mtime_ns = mtime_ns
+        self.size_bytes = size_bytes
+        self.artifact_mtime_ns = artifact_mtime_ns
+        self.load_seconds = load_seconds
+        self.memory_bytes = memory_bytes
+        self.loaded_at = datetime.now()
+        # The preprocessing artifact changes predictions too, so it is part of the version
+        self.version = f"{Path(path).stem}@{content_hash[:12]}"
+        if preprocessor is not None:
+            self.version += f"+{preprocessor.fingerprint()[:8]}"
+
+    def info(self) -> Dict[str, Any]:
+        """Load statistics for this entry"""
+        return {
+            'path': self.path,
+            'version': self.version,
+            'model_type': type(self.model).__name__,
+            'has_preprocessor': self.preprocessor is not None,
+            'file_size_bytes': self.size_bytes,
+            'memory_bytes': self.memory_bytes,
+            'load_seconds': self.load_seconds,
+            'loaded_at': self.loaded_at.isoformat()
+        }
+
+
+class ModelRegistry:
+    """
+    Thread-safe cache of loaded models keyed by resolved path
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, ModelEntry] = {}
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+
+    def get(self, model_path: str, check_for_updates: bool = True) -> ModelEntry:
+        """
+        Get the current entry for a model file, loading or reloading it if the
+        file (or its preprocessing artifact) changed on disk
+        """
+        key = os.path.realpath(model_path)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        if entry is not None and (not check_for_updates or not self._is_stale(entry)):
+            with self._lock:
+                self.hits += 1
+            return entry
+
+        if entry is not None:
+            # Another thread is already loading the new version: keep serving the old one
+            if not load_lock.acquire(blocking=False):
+                return entry
+        else:
+            load_lock.acquire()
+
+        try:
+            with self._lock:
+                current = self._entries.get(key)
+            if current is not None and current is not entry and not self._is_stale(current):
+                return current
+
+            return self._load_and_publish(key)
+        finally:
+            load_lock.release()
+
+    def reload(self, model_path: str) -> ModelEntry:
+        """
+        Force a reload and atomically publish the new version
+        """
+        key = os.path.realpath(model_path)
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            return self._load_and_publish(key)
+
+    def evict(self, model_path: str) -> bool:
+        """Drop a model from the cache"""
+        key = os.path.realpath(model_path)
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self):
+        """Drop all cached models"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Load time and memory footprint for every cached model
+        """
+        with self._lock:
+            entries = list(self._entries.values())
+            return {
+                'cache_hits': self.hits,
+                'loads': self.loads,
+                'models': [entry.info() for entry in entries]
+            }
+
+    def _is_stale(self, entry: ModelEntry) -> bool:
+        try:
+            stat = os.stat(entry.path)
+        except FileNotFoundError:
+            # Keep serving the loaded version if the file is being replaced
+            return False
+
+        if (stat.st_mtime_ns, stat.st_size) != (entry.mtime_ns, entry.size_bytes):
+            return True
+
+        return _artifact_mtime(entry.path) != entry.artifact_mtime_ns
+
+    def _load_and_publish(self, key: str) -> ModelEntry:
+        entry = _load_entry(key)
+        with self._lock:
+            self._entries[key] = entry
+            self.loads += 1
+        return entry
+
+
+def _artifact_mtime(model_path: str) -> Optional[int]:
+    try:
+        return os.stat(artifact_path_for(model_path)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _current_rss_bytes() -> Optional[int]:
+    """Resident set size of this process (Linux), None elsewhere"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _load_entry(path: str) -> ModelEntry:
+    """
+    Read, hash and deserialize a model file
+    """
+    if not path.endswith(SUPPORTED_MODEL_SUFFIXES):
+        raise ValueError(f"Unsupported model format: {path}")
+
+    start = time.perf_counter()
+    rss_before = _current_rss_bytes()
+
+    stat = os.stat(path)
+    with open(path, 'rb') as f:
+        payload = f.read()
+    content_hash = hashlib.sha256(payload).hexdigest()
+
+    # joblib reads plain pickles as well as joblib dumps with numpy payloads
+    model = joblib.load(io.BytesIO(payload))
+    del payload
+
+    artifact_mtime = _artifact_mtime(path)
+    preprocessor = None
+    if artifact_mtime is not None:
+        preprocessor = FeaturePreprocessor.load(artifact_path_for(path))
+
+    load_seconds = time.perf_counter() - start
+    rss_after = _current_rss_bytes()
+    memory_bytes = None
+    if rss_before is not None and rss_after is not None:
+        memory_bytes = max(rss_after - rss_before, 0)
+
+    return ModelEntry(path, model, preprocessor, content_hash, stat.st_mtime_ns,
+                      stat.st_size, artifact_mtime, load_seconds, memory_bytes)
+
+
+_registry = ModelRegistry()
+
+
+def get_registry() -> ModelRegistry:
+    """
+    Shared registry for this process
+    """
+    return _registry
+
+
+def get_model(model_path: str):
+    """
+    Quick helper returning only the cached model object
+    """
+    return _registry.get(model_path).model
+
+
+def registry_stats() -> Dict[str, Any]:
+    """
+    Quick helper for registry load statistics
+    """
+    return _registry.stats()
@@ -0,0 +1,354 @@
+"""
+Monte Carlo Probabilistic Risk Engine
+Samples realizations of the uncertain inputs (earthquake magnitude, Rjb
+distance, vs30) per neighborhood, scores them in vectorized chunks and keeps
+only streaming aggregates, so memory does not grow with the realization count
+
+Usage:
+    python monte_carlo.py --data public/data/istanbul_risk_data.csv --realizations 10000 --workers 4
+"""
+import argparse
+import multiprocessing as mp
+import time
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+from prediction_service import PredictionService, fork_available, limit_model_threads
+from dashboard_export import label_thresholds
+
+
+DEFAULT_QUANTILES = (0.05, 0.5, 0.95)
+# Dashboard label boundaries of the latest year
+DEFAULT_THRESHOLDS = label_thresholds()
+
+
+class UncertaintyModel:
+    """
+    Input uncertainty applied to each realization:
+    - magnitude: dM ~ N(0, magnitude_sigma), PGA scaled by exp(pga_per_magnitude * dM)
+    - ground motion: extra lognormal PGA scatter (pga_log_sigma)
+    - Rjb distance and vs30: multiplicative lognormal noise
+    """
+
+    def __init__(self, magnitude_sigma: float = 0.2, pga_per_magnitude: float = 1.1,
+                 pga_log_sigma: float = 0.0, rjb_log_sigma: float = 0.1,
+                 vs30_log_sigma: float = 0.15,
+                 pga_columns: Sequence[str] = ('pga_scenario_mw72', 'pga_scenario_mw75'),
+                 rjb_columns: Sequence[str] = ('rjb_distance_km', 'rjb_km'),
+                 vs30_columns: Sequence[str] = ('vs30_mean', 'vs30')):
+        self.magnitude_sigma = magnitude_sigma
+        self.pga_per_magnitude = pga_per_magnitude
+        self.pga_log_sigma = pga_log_sigma
+        self.rjb_log_sigma = rjb_log_sigma
+        self.vs30_log_sigma = vs30_log_sigma
+        self.pga_columns = list(pga_columns)
+        self.rjb_columns = list(rjb_columns)
+        self.vs30_columns = list(vs30_columns)
+
+    def apply(self, X: np.ndarray, columns: List[str], rng: np.random.Generator):
+        """
+        Perturb a (realizations, neighborhoods, features) block in place
+        Magnitude is shared by all neighborhoods of a realization (one event);
+        site terms (Rjb, vs30, PGA scatter) vary per neighborhood
+        """
+        index = {col: i for i, col in enumerate(columns)}
+        k, n, _ = X.shape
+
+        pga = [index[col] for col in self.pga_columns if col in index]
+        if pga and (self.magnitude_sigma or self.pga_log_sigma):
+            log_factor = self.pga_per_magnitude * rng.normal(0.0, self.magnitude_sigma, size=(k, 1))
+            if self.pga_log_sigma:
+                log_factor = log_factor + rng.normal(0.0, self.pga_log_sigma, size=(k, n))
+            X[:, :, pga] *= np.exp(log_factor)[:, :, None]
+
+        for cols, sigma in ((self.rjb_columns, self.rjb_log_sigma),
+                            (self.vs30_columns, self.vs30_log_sigma)):
+            idx = [index[col] for col in cols if col in index]
+            if idx and sigma:
+                X[:, :, idx] *= np.exp(rng.normal(0.0, sigma, size=(k, n, 1)))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+
+class StreamingAggregate:
+    """
+    Per-neighborhood running count/mean/M2 (Welford, merged with Chan's
+    formula), a fixed-bin histogram for quantiles and exceedance counts
+    """
+
+    def __init__(self, n_rows: int, value_range: Tuple[float, float] = (0.0, 1.0),
+                 bins: int = 1000, thresholds: Sequence[float] = DEFAULT_THRESHOLDS):
+        self.value_range = value_range
+        self.bins = bins
+        self.thresholds = np.asarray(thresholds, dtype=np.float64)
+        self.count = 0
+        self.mean = np.zeros(n_rows)
+        self.m2 = np.zeros(n_rows)
+        self.minimum = np.full(n_rows, np.inf)
+        self.maximum = np.full(n_rows, -np.inf)
+        self.histogram = np.zeros((n_rows, bins), dtype=np.int64)
+        self.exceed = np.zeros((n_rows, len(self.thresholds)), dtype=np.int64)
+
+    def update(self, values: np.ndarray):
+        """
+        Add a (realizations, neighborhoods) block
+        """
+        k, n = values.shape
+        chunk_mean = values.mean(axis=0)
+        chunk_m2 = ((values - chunk_mean) ** 2).sum(axis=0)
+        self._merge_moments(k, chunk_mean, chunk_m2)
+
+        np.minimum(self.minimum, values.min(axis=0), out=self.minimum)
+        np.maximum(self.maximum, values.max(axis=0), out=self.maximum)
+
+        low, high = self.value_range
+        bin_index = ((values - low) * (self.bins / (high - low))).astype(np.int64)
+        np.clip(bin_index, 0, self.bins - 1, out=bin_index)
+        # One bincount over (neighborhood, bin) pairs instead of a per-row loop
+        flat = (bin_index + np.arange(n)[None, :] * self.bins).ravel()
+        self.histogram += np.bincount(flat, minlength=n * self.bins).reshape(n, self.bins)
+
+        self.exceed += (values[:, :, None] > self.thresholds[None, None, :]).sum(axis=0)
+
+    def merge(self, other: 'StreamingAggregate'):
+        """
+        Combine with an aggregate built from other realizations
+        """
+        self._merge_moments(other.count, other.mean, other.m2)
+        np.minimum(self.minimum, other.minimum, out=self.minimum)
+        np.maximum(self.maximum, other.maximum, out=self.maximum)
+        self.histogram += other.histogram
+        self.exceed += other.exceed
+
+    def _merge_moments(self, count: int, mean: np.ndarray, m2: np.ndarray):
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / total)
+        self.m2 = self.m2 + m2 + delta ** 2 * (self.count * count / total)
+        self.count = total
+
+    def variance(self) -> np.ndarray:
+        return self.m2 / (self.count - 1) if self.count > 1 else np.zeros_like(self.m2)
+
+    def quantiles(self, qs: Sequence[float]) -> np.ndarray:
+        """
+        Quantiles from the histogram, linearly interpolated inside each bin
+        Returns (neighborhoods, len(qs))
+        """
+        low, high = self.value_range
+        width = (high - low) / self.bins
+        cumulative = np.cumsum(self.histogram, axis=1)
+        result = np.empty((self.histogram.shape[0], len(qs)))
+
+        for j, q in enumerate(qs):
+            target = q * self.count
+            b = np.minimum((cumulative < target).sum(axis=1), self.bins - 1)
+            rows = np.arange(len(b))
+            before = np.where(b > 0, cumulative[rows, np.maximum(b - 1, 0)], 0)
+            in_bin = np.maximum(self.histogram[rows, b], 1)
+            result[:, j] = low + (b + np.clip((target - before) / in_bin, 0.0, 1.0)) * width
+
+        # Values outside value_range are clamped into the edge bins
+        return np.clip(result, self.minimum[:, None], self.maximum[:, None])
+
+    def exceedance_probabilities(self) -> np.ndarray:
+        return self.exceed / max(self.count, 1)
+
+
+class MonteCarloResult:
+    """
+    Per-neighborhood distribution summary
+    """
+
+    def __init__(self, neighborhood_ids: np.ndarray, aggregate: StreamingAggregate,
+                 point_estimate: np.ndarray, quantile_levels: Sequence[float],
+                 seed: Optional[int], elapsed_seconds: float):
+        self.neighborhood_ids = neighborhood_ids
+        self.aggregate = aggregate
+        self.point_estimate = point_estimate
+        self.quantile_levels = list(quantile_levels)
+        self.seed = seed
+        self.elapsed_seconds = elapsed_seconds
+
+    @property
+    def realizations(self) -> int:
+        return self.aggregate.count
+
+    def to_frame(self) -> pd.DataFrame:
+        agg = self.aggregate
+        frame = pd.DataFrame({
+            'mah_id': self.neighborhood_ids,
+            'point_estimate': self.point_estimate,
+            'mean': agg.mean,
+            'std': np.sqrt(agg.variance()),
+            'min': agg.minimum,
+            'max': agg.maximum
+        })
+
+        quantiles = agg.quantiles(self.quantile_levels)
+        for j, q in enumerate(self.quantile_levels):
+            frame[f'q{int(round(q * 100)):02d}'] = quantiles[:, j]
+
+        exceedance = agg.exceedance_probabilities()
+        for j, threshold in enumerate(agg.thresholds):
+            frame[f'p_exceed_{threshold:g}'] = exceedance[:, j]
+
+        return frame
+
+    def save(self, file_path: str) -> str:
+        self.to_frame().to_csv(file_path, index=False)
+        return file_path
+
+
+class MonteCarloEngine:
+    """
+    Runs seeded Monte Carlo realizations through the loaded model
+    Each chunk draws from its own child of one SeedSequence, so a run is
+    reproducible for a given seed whatever the number of worker processes
+    """
+
+    def __init__(self, predictor: PredictionService,
+                 uncertainty: Optional[UncertaintyModel] = None,
+                 chunk_rows: int = 250000, value_range: Tuple[float, float] = (0.0, 1.0),
+                 bins: int = 1000, thresholds: Sequence[float] = DEFAULT_THRESHOLDS):
+        if predictor.model is None:
+            raise ValueError("Model not loaded. Use load_model() first.")
+
+        self.predictor = predictor
+        self.uncertainty = uncertainty or UncertaintyModel()
+        self.chunk_rows = chunk_rows
+        self.value_range = value_range
+        self.bins = bins
+        self.thresholds = thresholds
+        self.base = None
+        self.columns: List[str] = []
+        self.neighborhood_ids = None
+
+    def set_base(self, data: pd.DataFrame, id_column: str = 'mah_id') -> 'MonteCarloEngine':
+        """
+        Prepare the base feature matrix for all neighborhoods
+        """
+        X = self.predictor.prepare_features(data)
+        self.columns = list(X.columns)
+        self.base = X.to_numpy(dtype=np.float64)
+        self.neighborhood_ids = (data[id_column].to_numpy() if id_column in data.columns
+                                 else np.arange(len(data)))
+        return self
+
+    def _predict(self, X: np.ndarray) -> np.ndarray:
+        return np.asarray(self.predictor.model.predict(pd.DataFrame(X, columns=self.columns, copy=False)),
+                          dtype=np.float64)
+
+    def _new_aggregate(self) -> StreamingAggregate:
+        return StreamingAggregate(len(self.base), self.value_range, self.bins, self.thresholds)
+
+    def _chunk_sizes(self, realizations: int) -> List[int]:
+        per_chunk = max(1, self.chunk_rows // max(len(self.base), 1))
+        return [min(per_chunk, realizations - start) for start in range(0, realizations, per_chunk)]
+
+    def run_chunks(self, chunk_seeds: List[np.random.SeedSequence],
+                   chunk_sizes: List[int]) -> StreamingAggregate:
+        """
+        Evaluate a contiguous range of chunks into one aggregate
+        """
+        aggregate = self._new_aggregate()
+        n_rows, n_features = self.base.shape
+
+        for seed_seq, k in zip(chunk_seeds, chunk_sizes):
+            rng = np.random.default_rng(seed_seq)
+            X = np.broadcast_to(self.base, (k, n_rows, n_features)).copy()
+            self.uncertainty.apply(X, self.columns, rng)
+            values = self._predict(X.reshape(-1, n_features)).reshape(k, n_rows)
+            aggregate.update(values)
+
+        return aggregate
+
+    def run(self, realizations: int = 1000, seed: Optional[int] = 42, workers: int = 1,
+            quantiles: Sequence[float] = DEFAULT_QUANTILES) -> MonteCarloResult:
+        """
+        Sample and score realizations per neighborhood
+        """
+        if self.base is None:
+            raise ValueError("Base data not set. Use set_base() first.")
+
+        start = time.perf_counter()
+        sizes = self._chunk_sizes(realizations)
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+        if workers > 1 and len(sizes) > 1 and fork_available():
+            aggregate = self._run_forked(seeds, sizes, workers)
+        else:
+            aggregate = self.run_chunks(seeds, sizes)
+
+        point_estimate = self._predict(self.base)
+        elapsed = time.perf_counter() - start
+        print(f"{realizations} realizations x {len(self.base)} neighborhoods "
+              f"in {len(sizes)} chunks: {elapsed:.2f} seconds")
+
+        return MonteCarloResult(self.neighborhood_ids, aggregate, point_estimate,
+                                quantiles, seed, elapsed)
+
+    def _run_forked(self, seeds, sizes, workers: int) -> StreamingAggregate:
+        # Contiguous chunk ranges per task, merged back in order
+        bounds = np.linspace(0, len(sizes), min(workers, len(sizes)) + 1).astype(int)
+        tasks = [(seeds[a:b], sizes[a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
+
+        _worker_state['engine'] = self
+        try:
+            with mp.get_context('fork').Pool(len(tasks), initializer=_init_worker) as pool:
+                partials = pool.map(_run_worker_task, tasks)
+        finally:
+            _worker_state.clear()
+
+        aggregate = partials[0]
+        for partial in partials[1:]:
+            aggregate.merge(partial)
+        return aggregate
+
+
+_worker_state: Dict[str, Any] = {}
+
+
+def _init_worker():
+    limit_model_threads(_worker_state['engine'].predictor.model)
+
+
+def _run_worker_task(task):
+    chunk_seeds, chunk_sizes = task
+    return _worker_state['engine'].run_chunks(chunk_seeds, chunk_sizes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte Carlo risk distributions per neighborhood")
+    parser.add_argument('--data', default="public/data/istanbul_risk_data.csv")
+    parser.add_argument('--model', default="src/model/final_lightgbm_regressor.pkl")
+    parser.add_argument('--realizations', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--chunk-rows', type=int, default=250000)
+    parser.add_argument('--magnitude-sigma', type=float, default=0.2)
+    parser.add_argument('--rjb-log-sigma', type=float, default=0.1)
+    parser.add_argument('--vs30-log-sigma', type=float, default=0.15)
+    parser.add_argument('--label-year', type=int, default=None,
+                        help="Exceedance thresholds from this year's dashboard labels (default: latest)")
+    parser.add_argument('--output', default=None, help="Write per-neighborhood summary CSV")
+    args = parser.parse_args()
+
+    uncertainty = UncertaintyModel(magnitude_sigma=args.magnitude_sigma,
+                                   rjb_log_sigma=args.rjb_log_sigma,
+                                   vs30_log_sigma=args.vs30_log_sigma)
+
+    with PredictionService(model_path=args.model) as service:
+        engine = MonteCarloEngine(service, uncertainty, args.chunk_rows,
+                                  thresholds=label_thresholds(args.label_year))
+        engine.set_base(pd.read_csv(args.data))
+        result = engine.run(args.realizations, args.seed, args.workers)
+
+    summary = result.to_frame()
+    print(summary.describe().T[['mean', 'min', 'max']].to_string())
+
+    if args.output:
+        print(f"Summary saved to {result.save(args.output)}")
@@ -0,0 +1,309 @@
+"""
+Prediction Cache
+Caches model outputs keyed on a hash of the prepared feature vector and the
+model version, so unchanged neighborhoods are not re-scored on repeated runs
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+
+def feature_hashes(X: pd.DataFrame) -> List[str]:
+    """
+    Stable per-row hash of a prepared feature matrix
+    Column names and order are part of the key, so a different feature layout
+    never shares entries with another one
+    """
+    layout = hashlib.md5('|'.join(map(str, X.columns)).encode('utf-8')).hexdigest()[:8]
+    row_hashes = pd.util.hash_pandas_object(X, index=False).to_numpy()
+    return [f"{layout}{value:016x}" for value in row_hashes]
+
+
+class PredictionCache:
+    """
+    In-memory LRU of predictions with an optional SQLite store on disk
+    Values are (prediction, probabilities or None); the SQLite prediction
+    column has no type affinity so class labels stay integers
+    """
+
+    def __init__(self, max_entries: int = 100000, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._journal = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if db_path:
+            self._connect()
+
+    def _connect(self):
+        # Forked workers share the file: WAL lets readers run alongside a writer,
+        # and the timeout waits out another process's write lock instead of failing
+        self._conn = sqlite3.connect(self.db_path, timeout=30.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            "model_version TEXT NOT NULL, "
+            "feature_hash TEXT NOT NULL, "
+            "prediction NOT NULL, "
+            "probabilities TEXT, "
+            "PRIMARY KEY (model_version, feature_hash))"
+        )
+        self._conn.commit()
+
+    def after_fork(self):
+        """
+        Make a forked copy usable in the child: own lock and SQLite
+        connection, counters from zero, and a journal of new entries that
+        take_journal() hands back to the parent
+        Inherited in-memory entries are kept
+        """
+        self._lock = threading.Lock()
+        self._journal = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.db_path:
+            self._connect()
+
+    def take_journal(self) -> Optional[Dict[str, Any]]:
+        """
+        Counters and new entries since the last call, then reset them
+        None unless after_fork() started a journal
+        """
+        if self._journal is None:
+            return None
+
+        with self._lock:
+            journal = {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'entries': list(self._journal.items())
+            }
+            self._journal = {}
+            self.hits = 0
+            self.disk_hits = 0
+            self.misses = 0
+        return journal
+
+    def merge_journal(self, journal: Optional[Dict[str, Any]]):
+        """
+        Add a forked worker's counters and new entries to this cache
+        The worker already wrote its entries to the SQLite store, if any
+        """
+        if not journal:
+            return
+
+        with self._lock:
+            self.hits += journal['hits']
+            self.disk_hits += journal['disk_hits']
+            self.misses += journal['misses']
+            for key, value in journal['entries']:
+                self._remember(tuple(key), value)
+
+    def get_many(self, model_version: str, hashes: List[str]) -> Dict[str, Tuple[float, Optional[list]]]:
+        """
+        Look up cached predictions; returns only the hashes that were found
+        """
+        found = {}
+        missing = []
+
+        with self._lock:
+            for h in hashes:
+                key = (model_version, h)
+                value = self._entries.get(key)
+                if value is not None:
+                    self._entries.move_to_end(key)
+                    found[h] = value
+                elif h not in found:
+                    missing.append(h)
+
+            if missing and self._conn is not None:
+                for h, value in self._read_disk(model_version, missing).items():
+                    found[h] = value
+                    self._remember((model_version, h), value)
+                    self.disk_hits += 1
+
+            hit_count = sum(1 for h in hashes if h in found)
+            self.hits += hit_count
+            self.misses += len(hashes) - hit_count
+
+        return found
+
+    def put_many(self, model_version: str, items: Dict[str, Tuple[float, Optional[list]]]):
+        """
+        Store freshly computed predictions
+        """
+        if not items:
+            return
+
+        with self._lock:
+            for h, value in items.items():
+                self._remember((model_version, h), value)
+                if self._journal is not None:
+                    self._journal[(model_version, h)] = value
+
+            if self._conn is not None:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?)",
+                    [(model_version, h, prediction,
+                      json.dumps(probas) if probas is not None else None)
+                     for h, (prediction, probas) in items.items()]
+                )
+                self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Hit rate and size of the cache
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'db_path': self.db_path
+            }
+
+    def clear(self, model_version: Optional[str] = None):
+        """
+        Drop cached predictions, for one model version or all of them
+        """
+        with self._lock:
+            if model_version is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[0] == model_version]:
+                    del self._entries[key]
+
+            if self._conn is not None:
+                if model_version is None:
+                    self._conn.execute("DELETE FROM predictions")
+                else:
+                    self._conn.execute("DELETE FROM predictions WHERE model_version = ?", (model_version,))
+                self._conn.commit()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _remember(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _read_disk(self, model_version: str, hashes: List[str]) -> Dict[str, Tuple[float, Optional[list]]]:
+        found = {}
+        # Stay below SQLite's bound-parameter limit
+        for start in range(0, len(hashes), 500):
+            batch = hashes[start:start + 500]
+            rows = self._conn.execute(
+                "SELECT feature_hash, prediction, probabilities FROM predictions "
+                f"WHERE model_version = ? AND feature_hash IN ({','.join('?' * len(batch))})",
+                [model_version, *batch]
+            ).fetchall()
+            for h, prediction, probas in rows:
+                found[h] = (prediction, json.loads(probas) if probas is not None else None)
+        return found
+
+
+class ContributionCache:
+    """
+    In-memory LRU of per-row feature contribution vectors (float32)
+    """
+
+    def __init__(self, max_entries: int = 50000):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, model_version: str, X: pd.DataFrame, compute_fn) -> np.ndarray:
+        """
+        Contributions for every row of X; compute_fn(X_missing) is called
+        once for the rows not cached and must return a 2-D array
+        """
+        hashes = feature_hashes(X)
+
+        with self._lock:
+            found = {}
+            for h in hashes:
+                value = self._entries.get((model_version, h))
+                if value is not None:
+                    self._entries.move_to_end((model_version, h))
+                    found[h] = value
+            hit_count = sum(1 for h in hashes if h in found)
+            self.hits += hit_count
+            self.misses += len(hashes) - hit_count
+
+        miss_rows = [i for i, h in enumerate(hashes) if h not in found]
+        if miss_rows:
+            computed = np.asarray(compute_fn(X.iloc[miss_rows]), dtype=np.float32)
+            with self._lock:
+                for row, i in enumerate(miss_rows):
+                    found[hashes[i]] = computed[row]
+                    self._entries[(model_version, hashes[i])] = computed[row]
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        return np.stack([found[h] for h in hashes]) if hashes else np.empty((0, 0), dtype=np.float32)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries)
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def predict_with_cache(cache: PredictionCache, model_version: str, X: pd.DataFrame, predict_fn):
+    """
+    Evaluate predict_fn only on rows missing from the cache
+    predict_fn(X) must return (predictions, probabilities or None);
+    the result has the same shape as predict_fn(X)
+    """
+    hashes = feature_hashes(X)
+    cached = cache.get_many(model_version, hashes)
+
+    miss_rows = [i for i, h in enumerate(hashes) if h not in cached]
+    if miss_rows:
+        miss_predictions, miss_probas = predict_fn(X.iloc[miss_rows])
+        fresh = {}
+        for row, i in enumerate(miss_rows):
+            probas = miss_probas[row].tolist() if miss_probas is not None else None
+            # .item() keeps integer class labels as integers
+            fresh[hashes[i]] = (np.asarray(miss_predictions[row]).item(), probas)
+        cache.put_many(model_version, fresh)
+        cached.update(fresh)
+
+    values = [cached[h] for h in hashes]
+    predictions = np.array([value[0] for value in values])
+
+    probas = None
+    if values and values[0][1] is not None:
+        probas = np.array([value[1] for value in values])
+
+    return predictions, probas
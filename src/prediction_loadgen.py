@@ -0,0 +1,185 @@
+"""
+Load Generator for the Micro-batching Prediction Server
+Sends concurrent single-neighborhood requests over keep-alive connections
+and reports client-side latency and throughput
+
+Usage:
+    python prediction_loadgen.py --spawn-server --model src/model/final_lightgbm_regressor.pkl
+    python prediction_loadgen.py --port 8080 --concurrency 64 --requests 20000
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import pandas as pd
+from typing import Dict, List, Any, Tuple
+
+
+def load_sample_records(data_file: str, limit: int = 5000) -> List[Dict[str, Any]]:
+    """
+    Sample request bodies from a CSV or GeoJSON file
+    """
+    if data_file.endswith(('.geojson', '.json')):
+        with open(data_file, 'r', encoding='utf-8') as f:
+            features = json.load(f).get('features', [])
+        records = [feature.get('properties', {}) for feature in features[:limit]]
+    else:
+        df = pd.read_csv(data_file, nrows=limit)
+        df = df.select_dtypes(include='number')
+        records = df.where(pd.notnull(df), None).to_dict('records')
+
+    if not records:
+        raise ValueError(f"No records found in {data_file}")
+    return records
+
+
+async def _request(reader, writer, host: str, method: str, path: str,
+                   payload: Dict[str, Any] = None) -> Tuple[int, Dict[str, Any]]:
+    body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: {host}\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode('latin-1') + body
+    )
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Server closed connection")
+    status = int(status_line.split()[1])
+
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value.strip())
+
+    data = await reader.readexactly(length) if length else b'{}'
+    return status, json.loads(data)
+
+
+async def _client(host: str, port: int, records: List[Dict[str, Any]], counter: Dict[str, int],
+                  total: int, latencies: List[float], errors: List[int], seed: int):
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while counter['sent'] < total:
+            counter['sent'] += 1
+            record = rng.choice(records)
+            start = time.perf_counter()
+            status, _ = await _request(reader, writer, host, 'POST', '/predict', record)
+            latencies.append((time.perf_counter() - start) * 1000.0)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+async def run_load(host: str, port: int, records: List[Dict[str, Any]],
+                   total_requests: int = 10000, concurrency: int = 32,
+                   seed: int = 42) -> Dict[str, Any]:
+    """
+    Run the load test and return client-side statistics plus server /metrics
+    """
+    counter = {'sent': 0}
+    latencies: List[float] = []
+    errors: List[int] = []
+
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        _client(host, port, records, counter, total_requests, latencies, errors, seed + i)
+        for i in range(concurrency)
+    ])
+    elapsed = time.perf_counter() - start
+
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        _, server_metrics = await _request(reader, writer, host, 'GET', '/metrics')
+    finally:
+        writer.close()
+
+    values = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'concurrency': concurrency,
+        'elapsed_seconds': elapsed,
+        'requests_per_second': len(latencies) / elapsed if elapsed else 0.0,
+        'client_latency_ms': {
+            'p50': _percentile(values, 0.50),
+            'p90': _percentile(values, 0.90),
+            'p99': _percentile(values, 0.99),
+            'max': values[-1] if values else 0.0
+        },
+        'server': server_metrics
+    }
+
+
+async def _run_with_local_server(args, records):
+    from prediction_service import PredictionService
+    from prediction_server import PredictionServer
+
+    predictor = PredictionService(model_path=args.model)
+    server = PredictionServer(predictor, args.host, args.port,
+                              args.max_batch_size, args.max_latency_ms)
+    await server.start()
+    try:
+        return await run_load(args.host, args.port, records, args.requests, args.concurrency)
+    finally:
+        await server.stop()
+        predictor.__exit__(None, None, None)
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"\n{'='*60}")
+    print("LOAD TEST RESULTS")
+    print(f"{'='*60}")
+    print(f"Requests:     {report['requests']} ({report['errors']} errors)")
+    print(f"Concurrency:  {report['concurrency']}")
+    print(f"Throughput:   {report['requests_per_second']:.1f} req/s")
+    client = report['client_latency_ms']
+    print(f"Client p50/p99: {client['p50']:.2f} / {client['p99']:.2f} ms")
+    server = report['server']
+    print(f"Server p50/p99: {server['latency_ms']['p50']:.2f} / {server['latency_ms']['p99']:.2f} ms")
+    print(f"Batches: {server['batches']} (mean size {server['mean_batch_size']:.1f})")
+    print(f"Batch-size histogram: {server['batch_size_histogram']}")
+    print(f"{'='*60}\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prediction server load generator")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--data', default="public/data/istanbul_risk_data.csv")
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--spawn-server', action='store_true',
+                        help="Start a server in this process on host:port")
+    parser.add_argument('--model', default="src/model/final_lightgbm_regressor.pkl")
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-latency-ms', type=float, default=5.0)
+    parser.add_argument('--output', default=None, help="Write report as JSON")
+    args = parser.parse_args()
+
+    sample = load_sample_records(args.data)
+
+    if args.spawn_server:
+        result = asyncio.run(_run_with_local_server(args, sample))
+    else:
+        result = asyncio.run(run_load(args.host, args.port, sample, args.requests, args.concurrency))
+
+    print_report(result)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f"Report saved to {args.output}")
@@ -0,0 +1,318 @@
+"""
+Micro-batching Prediction Server
+Long-running asyncio HTTP service on top of PredictionService that merges
+concurrent single-neighborhood requests into one model call
+
+Endpoints:
+    POST /predict   body: JSON object with feature values
+    GET  /metrics   latency percentiles and batch-size histogram
+    GET  /health    model version and queue depth
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple
+from prediction_service import PredictionService
+
+
+MAX_BODY_BYTES = 1 << 20
+
+
+class ServerMetrics:
+    """
+    Rolling request latency window and batch-size histogram
+    """
+
+    def __init__(self, window: int = 10000):
+        self.latencies_ms = deque(maxlen=window)
+        self.batch_sizes: Dict[int, int] = {}
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.started_at = time.time()
+
+    def record_request(self, latency_ms: float, ok: bool = True):
+        self.requests += 1
+        if not ok:
+            self.errors += 1
+        self.latencies_ms.append(latency_ms)
+
+    def record_batch(self, size: int):
+        self.batches += 1
+        self.batch_sizes[size] = self.batch_sizes.get(size, 0) + 1
+
+    @staticmethod
+    def _percentile(sorted_values: List[float], q: float) -> float:
+        if not sorted_values:
+            return 0.0
+        index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+        return sorted_values[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        values = sorted(self.latencies_ms)
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'batches': self.batches,
+            'requests_per_second': self.requests / elapsed,
+            'mean_batch_size': (sum(k * v for k, v in self.batch_sizes.items()) / self.batches
+                                if self.batches else 0.0),
+            'latency_ms': {
+                'p50': self._percentile(values, 0.50),
+                'p90': self._percentile(values, 0.90),
+                'p99': self._percentile(values, 0.99),
+                'max': values[-1] if values else 0.0
+            },
+            'batch_size_histogram': {str(k): v for k, v in sorted(self.batch_sizes.items())}
+        }
+
+
+class MicroBatcher:
+    """
+    Queues single records and flushes them as one batch when the batch is
+    full or the oldest request has waited max_latency_ms
+    """
+
+    def __init__(self, predictor: PredictionService, max_batch_size: int = 64,
+                 max_latency_ms: float = 5.0, metrics: Optional[ServerMetrics] = None):
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000.0
+        self.metrics = metrics or ServerMetrics()
+        self.queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # One model thread: batches are evaluated in order, the event loop stays free
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='predict')
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Queue one record and wait for its prediction
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((record, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[Dict[str, Any], asyncio.Future]]:
+        first = await self.queue.get()
+        batch = [first]
+        deadline = time.perf_counter() + self.max_latency
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # Take whatever else is already waiting without extending the deadline
+        while len(batch) < self.max_batch_size and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+
+        return batch
+
+    def _predict(self, records: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        # Pick up a hot-swapped model version between batches
+        self.predictor.refresh_model()
+        return self.predictor.predict_records(records)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            records = [record for record, _ in batch]
+            self.metrics.record_batch(len(batch))
+
+            try:
+                results = await loop.run_in_executor(self._executor, self._predict, records)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+class PredictionServer:
+    """
+    Minimal HTTP/1.1 server (keep-alive, JSON bodies) using asyncio streams
+    """
+
+    def __init__(self, predictor: PredictionService, host: str = '127.0.0.1', port: int = 8080,
+                 max_batch_size: int = 64, max_latency_ms: float = 5.0):
+        self.predictor = predictor
+        self.host = host
+        self.port = port
+        self.metrics = ServerMetrics()
+        self.batcher = MicroBatcher(predictor, max_batch_size, max_latency_ms, self.metrics)
+        self._server = None
+
+    async def start(self):
+        self.batcher.start()
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        print(f"Prediction server listening on http://{self.host}:{self.port} "
+              f"(batch <= {self.batcher.max_batch_size}, "
+              f"deadline {self.batcher.max_latency * 1000:.1f} ms)")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        await self.batcher.stop()
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+
+                method, path, headers, body = request
+                status, payload = await self._route(method, path, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                _write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        if method == 'POST' and path == '/predict':
+            return await self._predict(body)
+        if method == 'GET' and path == '/metrics':
+            return 200, self.metrics.snapshot()
+        if method == 'GET' and path == '/health':
+            return 200, {
+                'status': 'ok',
+                'model_version': self.predictor.model_version,
+                'queue_depth': self.batcher.queue.qsize()
+            }
+        return 404, {'error': f"Not found: {method} {path}"}
+
+    async def _predict(self, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        start = time.perf_counter()
+        try:
+            record = json.loads(body or b'{}')
+            if not isinstance(record, dict):
+                raise ValueError("Request body must be a JSON object")
+        except ValueError as e:
+            self.metrics.record_request((time.perf_counter() - start) * 1000.0, ok=False)
+            return 400, {'error': str(e)}
+
+        try:
+            result = await self.batcher.submit(record)
+        except Exception as e:
+            self.metrics.record_request((time.perf_counter() - start) * 1000.0, ok=False)
+            return 500, {'error': str(e)}
+
+        latency_ms = (time.perf_counter() - start) * 1000.0
+        if result is None:
+            self.metrics.record_request(latency_ms, ok=False)
+            return 422, {'error': "No usable feature values in request"}
+
+        self.metrics.record_request(latency_ms)
+        return 200, {**result, 'model_version': self.predictor.model_version}
+
+
+async def _read_request(reader: asyncio.StreamReader):
+    """
+    Parse one HTTP request; returns None on a cleanly closed connection
+    """
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+
+    parts = request_line.decode('latin-1').split()
+    if len(parts) < 2:
+        raise ValueError("Malformed request line")
+    method, path = parts[0].upper(), parts[1].split('?', 1)[0]
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get('content-length', '0') or 0)
+    if length > MAX_BODY_BYTES:
+        raise ValueError("Request body too large")
+    body = await reader.readexactly(length) if length else b''
+
+    return method, path, headers, body
+
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+            422: 'Unprocessable Entity', 500: 'Internal Server Error'}
+
+
+def _write_response(writer: asyncio.StreamWriter, status: int, payload: Dict[str, Any], keep_alive: bool):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    head = (
+        f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode('latin-1') + body)
+
+
+def run_server(model_path: str, host: str = '127.0.0.1', port: int = 8080,
+               max_batch_size: int = 64, max_latency_ms: float = 5.0):
+    """
+    Quick helper to run the server until interrupted
+    """
+    predictor = PredictionService(model_path=model_path)
+    server = PredictionServer(predictor, host, port, max_batch_size, max_latency_ms)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print("\nServer stopped")
+        print(json.dumps(server.metrics.snapshot(), indent=2))
+    finally:
+        predictor.__exit__(None, None, None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-batching prediction server")
+    parser.add_argument('--model', default="src/model/final_lightgbm_regressor.pkl")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-latency-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    run_server(args.model, args.host, args.port, args.max_batch_size, args.max_latency_ms)
@@ -5,14 +5,44 @@ Fast prediction service for new data and updated GeoJSON files
 import pandas as pd
 import numpy as np
 import json
-import pickle
-import joblib
+import gc
+import multiprocessing as mp
 from typing import Dict, List, Any, Optional, Union
 from datetime import datetime
 from pathlib import Path
-from database_config import SessionLocal
-from geo_repository import GeoSpatialRepository
+from sqlalchemy import select, func, cast, case, or_, Float, Text
+from database_config import SessionLocal, engine
+from geo_repository import GeoSpatialRepository, PREDICTION_COLUMNS
 from geo_models import MahalleRiskData
+from feature_preprocessor import FeaturePreprocessor, artifact_path_for, model_feature_names
+from model_registry import get_registry
+from prediction_cache import PredictionCache, ContributionCache, predict_with_cache
+from feature_schema import FeatureSchema
+from tree_ensemble import CompiledTreeEnsemble
+
+
+# Default model input columns when none are set explicitly
+DEFAULT_FEATURE_COLUMNS = [
+    # Earthquake features
+    'rjb_km', 'earthquake_min_distance_km', 'earthquake_mean_distance_km',
+    'earthquake_count_5km', 'earthquake_count_10km', 'earthquake_count_20km',
+    'earthquake_count_50km', 'max_magnitude_nearby_20km',
+    'mean_magnitude_nearby_20km', 'strong_earthquakes_20km',
+    'moderate_earthquakes_20km', 'seismic_intensity_factor',
+
+    # PGA features
+    'pga_scenario_mw72', 'pga_scenario_mw75',
+
+    # Soil features
+    'vs30', 'vs30_mean',
+
+    # Population and building features
+    'toplam_nufus', 'toplam_bina', 'population_density', 'building_density',
+
+    # Distance features
+    'distance_to_city_center_km', 'distance_to_bosphorus_km',
+    'distance_to_marmara_km'
+]
 
 
 class PredictionService:
@@ -20,11 +50,18 @@ class PredictionService:
     Service for making risk predictions on new and updated data
     """
 
-    def __init__(self, model_path: Optional[str] = None, db_session=None):
+    def __init__(self, model_path: Optional[str] = None, db_session=None,
+                 cache: Optional[PredictionCache] = None):
         self.db = db_session or SessionLocal()
         self.repo = GeoSpatialRepository(self.db)
         self.model = None
+        self.model_path = None
+        self.model_version = None
         self.feature_columns = None
+        self.preprocessor = None
+        self.cache = cache
+        self.explanation_cache = ContributionCache()
+        self._fast_path = None
 
         if model_path:
             self.load_model(model_path)
@@ -39,29 +76,104 @@ class PredictionService:
     def load_model(self, model_path: str):
         """
         Load trained model from file
+        Models are shared through the process-wide registry, so repeated loads
+        of an unchanged file do not touch the disk again
         """
         print(f"Loading model from {model_path}")
 
-        if model_path.endswith('.pkl'):
-            with open(model_path, 'rb') as f:
-                self.model = pickle.load(f)
-        elif model_path.endswith('.joblib'):
-            self.model = joblib.load(model_path)
-        else:
-            raise ValueError(f"Unsupported model format: {model_path}")
+        entry = get_registry().get(model_path)
+        self._use_model_entry(entry)
+
+        print(f"Model loaded: {type(self.model).__name__} ({entry.version})")
+
+    def refresh_model(self) -> bool:
+        """
+        Switch to a newer version of the loaded model file, if one was published
+        Returns True when the model changed
+        """
+        if not self.model_path:
+            return False
+
+        entry = get_registry().get(self.model_path)
+        if entry.version == self.model_version:
+            return False
+
+        self._use_model_entry(entry)
+        print(f"Model updated to {entry.version}")
+        return True
+
+    def _use_model_entry(self, entry):
+        self.model = entry.model
+        self.model_path = entry.path
+        self.model_version = entry.version
+
+        # Fitted preprocessing artifact saved next to the model
+        if entry.preprocessor is not None:
+            self.preprocessor = entry.preprocessor
+            self.feature_columns = list(entry.preprocessor.feature_columns)
+        elif self.feature_columns is None:
+            self.feature_columns = model_feature_names(self.model)
+
+        if self._fast_path is not None:
+            self.enable_fast_path(self._fast_path[1].dtype)
+
+    def load_preprocessor(self, artifact_path: str):
+        """
+        Load fitted preprocessing artifact (column order, dtypes, imputation values)
+        """
+        self.preprocessor = FeaturePreprocessor.load(artifact_path)
+        self.feature_columns = list(self.preprocessor.feature_columns)
+        print(f"Preprocessing artifact loaded: {artifact_path}")
+
+    def fit_preprocessor(self, training_data: pd.DataFrame, strategy: str = 'mean',
+                         save: bool = True) -> FeaturePreprocessor:
+        """
+        Fit preprocessing artifact on training data and save it next to the model
+        """
+        if self.feature_columns is None:
+            self.feature_columns = list(DEFAULT_FEATURE_COLUMNS)
+
+        columns = [col for col in self.feature_columns if col in training_data.columns]
+        self.preprocessor = FeaturePreprocessor.fit(training_data, columns, strategy)
+        self.feature_columns = columns
+
+        if save and self.model_path:
+            artifact_path = self.preprocessor.save(artifact_path_for(self.model_path))
+            print(f"Preprocessing artifact saved: {artifact_path}")
+
+        return self.preprocessor
+
+    def enable_cache(self, max_entries: int = 100000, db_path: Optional[str] = None) -> PredictionCache:
+        """
+        Cache predictions by feature hash and model version
+        With db_path the cache persists across runs in a SQLite file
+        """
+        self.cache = PredictionCache(max_entries, db_path)
+        return self.cache
 
-        print(f"Model loaded: {type(self.model).__name__}")
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """
+        Prediction cache hit rate, None when caching is disabled
+        """
+        return self.cache.stats() if self.cache is not None else None
 
     def set_feature_columns(self, columns: List[str]):
         """
         Set feature columns for prediction
         """
+        if self.preprocessor is not None and list(columns) != self.preprocessor.feature_columns:
+            raise ValueError("Feature columns are fixed by the loaded preprocessing artifact")
         self.feature_columns = columns
 
     def prepare_features(self, data: Union[pd.DataFrame, Dict[str, Any]]) -> pd.DataFrame:
         """
         Prepare features for prediction
+        Uses the fitted preprocessing artifact when loaded, so results do not
+        depend on batch size; otherwise imputes from the batch mean
         """
+        if self.preprocessor is not None:
+            return self.preprocessor.transform(data)
+
         if isinstance(data, dict):
             df = pd.DataFrame([data])
         else:
@@ -69,27 +181,7 @@ class PredictionService:
 
         # Default feature columns if not set
         if self.feature_columns is None:
-            self.feature_columns = [
-                # Earthquake features
-                'rjb_km', 'earthquake_min_distance_km', 'earthquake_mean_distance_km',
-                'earthquake_count_5km', 'earthquake_count_10km', 'earthquake_count_20km',
-                'earthquake_count_50km', 'max_magnitude_nearby_20km',
-                'mean_magnitude_nearby_20km', 'strong_earthquakes_20km',
-                'moderate_earthquakes_20km', 'seismic_intensity_factor',
-
-                # PGA features
-                'pga_scenario_mw72', 'pga_scenario_mw75',
-
-                # Soil features
-                'vs30', 'vs30_mean',
-
-                # Population and building features
-                'toplam_nufus', 'toplam_bina', 'population_density', 'building_density',
-
-                # Distance features
-                'distance_to_city_center_km', 'distance_to_bosphorus_km',
-                'distance_to_marmara_km'
-            ]
+            self.feature_columns = list(DEFAULT_FEATURE_COLUMNS)
 
         # Select and prepare features
         available_cols = [col for col in self.feature_columns if col in df.columns]
@@ -97,13 +189,88 @@ class PredictionService:
         if not available_cols:
             raise ValueError("No feature columns found in data")
 
-        X = df[available_cols].copy()
+        X = df[available_cols].apply(pd.to_numeric, errors='coerce')
 
         # Handle missing values
         X = X.fillna(X.mean())
 
         return X
 
+    def _predict_matrix(self, X: pd.DataFrame):
+        """
+        Run the model once over a prepared feature matrix
+        Returns (predictions, probabilities or None)
+        """
+        if self.cache is not None and self.model_version:
+            return predict_with_cache(self.cache, self.model_version, X, self._evaluate_model)
+        return self._evaluate_model(X)
+
+    def _evaluate_model(self, X: pd.DataFrame):
+        predictions = np.asarray(self.model.predict(X))
+
+        probas = None
+        if hasattr(self.model, 'predict_proba'):
+            probas = np.asarray(self.model.predict_proba(X))
+
+        return predictions, probas
+
+    def _valid_feature_mask(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Mask rows that can be scored: at least one feature present and
+        no non-numeric feature values
+        """
+        available_cols = [col for col in self.feature_columns if col in df.columns]
+        if not available_cols:
+            return np.zeros(len(df), dtype=bool)
+
+        raw = df[available_cols]
+        numeric = raw.apply(pd.to_numeric, errors='coerce')
+        unparseable = (numeric.isna() & raw.notna()).any(axis=1)
+        empty = numeric.isna().all(axis=1)
+
+        return (~(unparseable | empty)).to_numpy()
+
+    def enable_fast_path(self, dtype=np.float32):
+        """
+        Compile the model and feature schema for pandas-free single predictions
+        predict_single uses it from then on; it is rebuilt on model reloads
+        Unlike predict_batch it does not use the prediction cache: a compiled
+        single-row prediction costs less than hashing the row
+        """
+        if self.model is None:
+            raise ValueError("Model not loaded. Use load_model() first.")
+
+        if self.preprocessor is not None:
+            schema = FeatureSchema.from_preprocessor(self.preprocessor, dtype)
+        else:
+            schema = FeatureSchema(self.feature_columns or DEFAULT_FEATURE_COLUMNS, dtype=dtype)
+
+        self._fast_path = (self.model_version, schema, CompiledTreeEnsemble.from_model(self.model))
+
+    def predict_single_fast(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Single prediction straight from a dict: row buffer + compiled trees
+        """
+        if self._fast_path is None:
+            self.enable_fast_path()
+
+        _, schema, compiled = self._fast_path
+        # Same check as prepare_features without a preprocessing artifact
+        if self.preprocessor is None and not schema.has_features(data):
+            raise ValueError("No feature columns found in data")
+        predictions, probas = compiled.predict_outputs(schema.fill_row(data))
+
+        result = {
+            'prediction': float(predictions[0]),
+            'timestamp': datetime.now().isoformat()
+        }
+
+        if probas is not None:
+            result['probabilities'] = probas[0].tolist()
+            result['confidence'] = float(probas[0].max())
+
+        return result
+
     def predict_single(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Make prediction for single data point
@@ -111,25 +278,23 @@ class PredictionService:
         if self.model is None:
             raise ValueError("Model not loaded. Use load_model() first.")
 
+        if self._fast_path is not None:
+            return self.predict_single_fast(data)
+
         # Prepare features
         X = self.prepare_features(data)
 
         # Make prediction
-        prediction = self.model.predict(X)[0]
-
-        # Get prediction probabilities if available
-        proba = None
-        if hasattr(self.model, 'predict_proba'):
-            proba = self.model.predict_proba(X)[0]
+        predictions, probas = self._predict_matrix(X)
 
         result = {
-            'prediction': float(prediction),
+            'prediction': float(predictions[0]),
             'timestamp': datetime.now().isoformat()
         }
 
-        if proba is not None:
-            result['probabilities'] = proba.tolist()
-            result['confidence'] = float(max(proba))
+        if probas is not None:
+            result['probabilities'] = probas[0].tolist()
+            result['confidence'] = float(probas[0].max())
 
         return result
 
@@ -144,21 +309,166 @@ class PredictionService:
         X = self.prepare_features(data)
 
         # Make predictions
-        predictions = self.model.predict(X)
+        predictions, probas = self._predict_matrix(X)
 
         # Add predictions to dataframe
         result_df = data.copy()
         result_df['predicted_risk'] = predictions
 
         # Add probabilities if available
-        if hasattr(self.model, 'predict_proba'):
-            probas = self.model.predict_proba(X)
+        if probas is not None:
             result_df['prediction_confidence'] = probas.max(axis=1)
 
         result_df['prediction_timestamp'] = datetime.now()
 
         return result_df
 
+    def predict_records(self, records: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Make predictions for many records with one model call
+        Returns one result per record, None where the record could not be scored
+        """
+        if self.model is None:
+            raise ValueError("Model not loaded. Use load_model() first.")
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(records)
+        if not records:
+            return results
+
+        positions = [i for i, record in enumerate(records) if isinstance(record, dict)]
+        if not positions:
+            return results
+
+        df = pd.DataFrame.from_records([records[i] for i in positions])
+
+        if self.feature_columns is None:
+            self.feature_columns = list(DEFAULT_FEATURE_COLUMNS)
+
+        valid = self._valid_feature_mask(df)
+        if not valid.any():
+            return results
+
+        X = self.prepare_features(df[valid])
+        predictions, probas = self._predict_matrix(X)
+
+        timestamp = datetime.now().isoformat()
+        valid_positions = [pos for pos, ok in zip(positions, valid) if ok]
+
+        for row, pos in enumerate(valid_positions):
+            result = {
+                'prediction': float(predictions[row]),
+                'timestamp': timestamp
+            }
+            if probas is not None:
+                result['probabilities'] = probas[row].tolist()
+                result['confidence'] = float(probas[row].max())
+            results[pos] = result
+
+        return results
+
+    def feature_contributions(self, X: pd.DataFrame) -> np.ndarray:
+        """
+        Per-feature TreeSHAP contributions from LightGBM (pred_contrib)
+        Shape (rows, features + 1) for regressors, the last column being the
+        expected value; (rows, classes * (features + 1)) for classifiers
+        Cached by feature hash and model version
+        """
+        if self.model is None:
+            raise ValueError("Model not loaded. Use load_model() first.")
+
+        estimator, transform = _final_estimator(self.model)
+
+        def compute(X_missing: pd.DataFrame) -> np.ndarray:
+            return np.asarray(estimator.predict(transform(X_missing), pred_contrib=True))
+
+        return self.explanation_cache.get_or_compute(self.model_version or '', X, compute)
+
+    def _explain_matrix(self, X: pd.DataFrame, top_k: int) -> List[Dict[str, Any]]:
+        contributions = self.feature_contributions(X).astype(np.float64)
+        n_rows, n_features = X.shape
+        estimator, _ = _final_estimator(self.model)
+        classes = getattr(estimator, 'classes_', None)
+
+        if classes is not None and len(classes) > 2:
+            # Explain the predicted class: the one with the largest raw score
+            per_class = contributions.reshape(n_rows, len(classes), n_features + 1)
+            predicted = per_class.sum(axis=2).argmax(axis=1)
+            contributions = per_class[np.arange(n_rows), predicted]
+        else:
+            predicted = None
+
+        values = X.to_numpy()
+        order = np.argsort(-np.abs(contributions[:, :n_features]), axis=1)[:, :top_k]
+
+        explanations = []
+        for row in range(n_rows):
+            explanation = {
+                'base_value': float(contributions[row, -1]),
+                'raw_score': float(contributions[row].sum()),
+                'drivers': [{
+                    'feature': X.columns[j],
+                    'value': None if pd.isna(values[row, j]) else float(values[row, j]),
+                    'contribution': float(contributions[row, j])
+                } for j in order[row]]
+            }
+            if predicted is not None:
+                explanation['explained_class'] = classes[predicted[row]].item()
+            explanations.append(explanation)
+
+        return explanations
+
+    def explain_batch(self, data: pd.DataFrame, top_k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Top-k feature drivers for every row of a DataFrame
+        """
+        if self.model is None:
+            raise ValueError("Model not loaded. Use load_model() first.")
+
+        return self._explain_matrix(self.prepare_features(data), top_k)
+
+    def explain_records(self, records: List[Dict[str, Any]], top_k: int = 5) -> List[Optional[Dict[str, Any]]]:
+        """
+        Top-k feature drivers per record, None where the record could not be scored
+        """
+        if self.model is None:
+            raise ValueError("Model not loaded. Use load_model() first.")
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(records)
+        positions = [i for i, record in enumerate(records) if isinstance(record, dict)]
+        if not positions:
+            return results
+
+        df = pd.DataFrame.from_records([records[i] for i in positions])
+        if self.feature_columns is None:
+            self.feature_columns = list(DEFAULT_FEATURE_COLUMNS)
+
+        valid = self._valid_feature_mask(df)
+        if not valid.any():
+            return results
+
+        explanations = self._explain_matrix(self.prepare_features(df[valid]), top_k)
+        valid_positions = [pos for pos, ok in zip(positions, valid) if ok]
+        for pos, explanation in zip(valid_positions, explanations):
+            results[pos] = explanation
+
+        return results
+
+    def explain_from_database(self, filter_params: Dict[str, Any] = None, top_k: int = 5,
+                              limit: Optional[int] = None,
+                              chunk_size: int = 5000) -> List[Dict[str, Any]]:
+        """
+        Top-k drivers for neighborhoods from the database, e.g. a whole district
+        """
+        if self.model is None:
+            raise ValueError("Model not loaded. Use load_model() first.")
+
+        results = []
+        for chunk in self.iter_database_chunks(filter_params, chunk_size, limit):
+            for meta, explanation in zip(chunk[['id', 'name', 'ilce_adi']].to_dict('records'),
+                                         self.explain_batch(chunk, top_k)):
+                results.append({**meta, **explanation})
+        return results
+
     def predict_from_geojson(self, geojson_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Make predictions for GeoJSON data
@@ -166,88 +476,250 @@ class PredictionService:
         features = geojson_data.get('features', [])
         print(f"Making predictions for {len(features)} features...")
 
+        properties_list = [feature.get('properties', {}) for feature in features]
+        cache_before = self.cache_stats()
+
+        try:
+            pred_results = self.predict_records(properties_list)
+        except Exception as e:
+            print(f"Error predicting features: {e}")
+            pred_results = [None] * len(features)
+
         predicted_features = []
+        successful = 0
 
-        for feature in features:
-            properties = feature.get('properties', {})
-
-            try:
-                # Make prediction
-                pred_result = self.predict_single(properties)
-
-                # Add prediction to properties
-                properties['predicted_risk_score'] = pred_result['prediction']
-                if 'confidence' in pred_result:
-                    properties['prediction_confidence'] = pred_result['confidence']
-                properties['prediction_timestamp'] = pred_result['timestamp']
-
-                # Create new feature with predictions
-                predicted_feature = {
-                    'type': 'Feature',
-                    'properties': properties,
-                    'geometry': feature.get('geometry')
-                }
-                predicted_features.append(predicted_feature)
-
-            except Exception as e:
-                print(f"Error predicting for feature: {e}")
+        for feature, properties, pred_result in zip(features, properties_list, pred_results):
+            if pred_result is None:
                 predicted_features.append(feature)  # Keep original
+                continue
+
+            # Add prediction to properties
+            properties['predicted_risk_score'] = pred_result['prediction']
+            if 'confidence' in pred_result:
+                properties['prediction_confidence'] = pred_result['confidence']
+            properties['prediction_timestamp'] = pred_result['timestamp']
+
+            # Create new feature with predictions
+            predicted_features.append({
+                'type': 'Feature',
+                'properties': properties,
+                'geometry': feature.get('geometry')
+            })
+            successful += 1
+
+        if successful < len(features):
+            print(f"Skipped {len(features) - successful} features without usable feature values")
+
+        metadata = {
+            'prediction_date': datetime.now().isoformat(),
+            'total_features': len(features),
+            'successful_predictions': successful
+        }
+
+        if cache_before is not None:
+            cache_after = self.cache_stats()
+            hits = cache_after['hits'] - cache_before['hits']
+            lookups = hits + cache_after['misses'] - cache_before['misses']
+            metadata['cache_hits'] = hits
+            metadata['cache_hit_rate'] = hits / lookups if lookups else 0.0
+            print(f"Prediction cache: {hits}/{lookups} rows reused ({metadata['cache_hit_rate']:.1%})")
 
         return {
             'type': 'FeatureCollection',
             'features': predicted_features,
-            'metadata': {
-                'prediction_date': datetime.now().isoformat(),
-                'total_features': len(features),
-                'successful_predictions': len(predicted_features)
-            }
+            'metadata': metadata
         }
 
-    def predict_from_database(self, filter_params: Dict[str, Any] = None,
-                             limit: int = 100) -> List[Dict[str, Any]]:
+    def _database_feature_expressions(self) -> Dict[str, Any]:
         """
-        Make predictions for data from database
+        SQL expressions for the model features: table columns where they exist,
+        otherwise the value stored in the GeoJSON properties
         """
-        print("Fetching data from database...")
+        if self.feature_columns is None:
+            self.feature_columns = list(DEFAULT_FEATURE_COLUMNS)
+
+        table_columns = MahalleRiskData.__table__.c
+        expressions = {}
+        for col in self.feature_columns:
+            if col in table_columns:
+                expressions[col] = table_columns[col]
+            else:
+                expressions[col] = _json_float(MahalleRiskData.properties[col].as_string())
+        return expressions
+
+    def _database_feature_columns(self) -> list:
+        return [expr.label(col) for col, expr in self._database_feature_expressions().items()]
+
+    def _feature_hash_expression(self):
+        """
+        md5 over the model inputs of a row, computed in the database
+        NULLs keep their position so (1, NULL, 2) and (1, 2, NULL) differ
+        """
+        parts = [func.coalesce(cast(expr, Text), '')
+                 for expr in self._database_feature_expressions().values()]
+        return func.md5(func.concat_ws('|', *parts))
+
+    @property
+    def model_type(self) -> str:
+        """'classifier' or 'regressor': which write-back columns this model owns"""
+        return 'classifier' if hasattr(self.model, 'predict_proba') else 'regressor'
 
-        # Get data from database
+    def _stale_filter(self):
+        """
+        Rows never scored by this model type, scored by another version of it
+        (model file or preprocessing artifact), or whose inputs changed since
+        """
+        columns = {name: getattr(MahalleRiskData, col)
+                   for name, col in PREDICTION_COLUMNS[self.model_type].items()
+                   if name in ('prediction', 'feature_hash', 'model_version')}
+        return or_(
+            columns['prediction'].is_(None),
+            columns['model_version'].is_distinct_from(self.model_version),
+            columns['feature_hash'].is_distinct_from(self._feature_hash_expression())
+        )
+
+    def count_stale_rows(self, filter_params: Dict[str, Any] = None) -> int:
+        """
+        Number of rows rescore_database(only_stale=True) would evaluate
+        """
+        stmt = select(func.count()).select_from(MahalleRiskData).where(
+            *self._database_filters(filter_params), self._stale_filter()
+        )
+        return int(self.db.execute(stmt).scalar())
+
+    def _database_filters(self, filter_params: Dict[str, Any] = None) -> list:
+        """
+        WHERE clauses for district / high_risk / year filters, the same as
+        GeoSpatialRepository.get_by_district / get_high_risk_areas
+        """
+        filters = []
         if filter_params and filter_params.get('district'):
-            data = self.repo.get_by_district(filter_params['district'])
+            filters.append(GeoSpatialRepository.district_filter(filter_params['district']))
         elif filter_params and filter_params.get('high_risk'):
-            data = self.repo.get_high_risk_areas()
-        else:
-            # Get all data with limit
-            query = self.db.query(MahalleRiskData).limit(limit)
-            data = query.all()
+            filters.append(GeoSpatialRepository.high_risk_filter())
 
-        print(f"Found {len(data)} records")
+        if filter_params and filter_params.get('year'):
+            filters.append(MahalleRiskData.year == filter_params['year'])
 
-        # Convert to DataFrame
-        records = []
-        for item in data:
-            record = {
-                'id': item.id,
-                'name': item.name,
-                'rjb_km': item.rjb_km,
-                'earthquake_min_distance_km': item.earthquake_min_distance_km,
-                'earthquake_count_5km': item.earthquake_count_5km,
-                'earthquake_count_10km': item.earthquake_count_10km,
-                'pga_scenario_mw72': item.pga_scenario_mw72,
-                'vs30': item.vs30,
-                'toplam_nufus': item.toplam_nufus,
-                'toplam_bina': item.toplam_bina,
-                'population_density': item.population_density,
-                'building_density': item.building_density,
-                'distance_to_city_center_km': item.distance_to_city_center_km
-            }
-            records.append(record)
+        return filters
 
-        df = pd.DataFrame(records)
+    def iter_database_chunks(self, filter_params: Dict[str, Any] = None,
+                             chunk_size: int = 5000,
+                             limit: Optional[int] = None,
+                             only_stale: bool = False,
+                             with_feature_hash: bool = False):
+        """
+        Stream feature rows from the database in DataFrame chunks
+        Uses a server-side cursor on its own connection, so memory stays
+        constant and the session remains free for write-back
+        """
+        columns = [
+            MahalleRiskData.id,
+            MahalleRiskData.name,
+            MahalleRiskData.ilce_adi,
+            *self._database_feature_columns()
+        ]
+        if with_feature_hash or only_stale:
+            columns.append(self._feature_hash_expression().label('feature_hash'))
+
+        filters = self._database_filters(filter_params)
+        if only_stale:
+            filters.append(self._stale_filter())
+
+        # High-risk rows come riskiest first, as from get_high_risk_areas
+        order = (MahalleRiskData.id,)
+        if filter_params and filter_params.get('high_risk') and not filter_params.get('district'):
+            order = GeoSpatialRepository.HIGH_RISK_ORDER + order
+        stmt = select(*columns).where(*filters).order_by(*order)
+
+        if limit:
+            stmt = stmt.limit(limit)
+
+        with self.db.get_bind().connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(stmt)
+            columns = list(result.keys())
+            for partition in result.partitions():
+                yield pd.DataFrame(partition, columns=columns)
+
+    def stream_predictions_from_database(self, filter_params: Dict[str, Any] = None,
+                                         chunk_size: int = 5000,
+                                         limit: Optional[int] = None,
+                                         only_stale: bool = False,
+                                         with_feature_hash: bool = False):
+        """
+        Yield prediction DataFrames chunk by chunk
+        """
+        if self.model is None:
+            raise ValueError("Model not loaded. Use load_model() first.")
 
-        # Make predictions
-        result_df = self.predict_batch(df)
+        for chunk in self.iter_database_chunks(filter_params, chunk_size, limit,
+                                               only_stale, with_feature_hash):
+            yield self.predict_batch(chunk)
+
+    def rescore_database(self, filter_params: Dict[str, Any] = None,
+                         chunk_size: int = 5000,
+                         write_back: bool = True,
+                         only_stale: bool = False) -> Dict[str, Any]:
+        """
+        Re-score matching neighborhoods at constant memory and write the
+        predictions back to mahalle_risk_data: predicted_risk for a regressor,
+        predicted_class / prediction_confidence for a classifier
+        With only_stale, rows whose input hash and model version match their
+        last prediction are skipped
+        """
+        start_time = datetime.now()
+        if write_back or only_stale:
+            self.repo.ensure_prediction_columns()
+
+        total = 0
+        updated = 0
+        chunks = 0
+
+        for result_df in self.stream_predictions_from_database(filter_params, chunk_size,
+                                                               only_stale=only_stale,
+                                                               with_feature_hash=True):
+            chunks += 1
+            total += len(result_df)
+
+            if write_back:
+                confidences = (result_df['prediction_confidence'].tolist()
+                               if 'prediction_confidence' in result_df.columns else None)
+                updated += self.repo.bulk_update_predictions(
+                    result_df['id'].tolist(),
+                    result_df['predicted_risk'].tolist(),
+                    confidences,
+                    result_df['feature_hash'].tolist(),
+                    self.model_version,
+                    model_type=self.model_type
+                )
+
+            print(f"Chunk {chunks}: scored {len(result_df)} rows ({total} total)")
+
+        elapsed = (datetime.now() - start_time).total_seconds()
+        print(f"Re-scored {total} neighborhoods in {elapsed:.2f} seconds")
 
-        return result_df.to_dict('records')
+        return {
+            'scored': total,
+            'updated': updated,
+            'chunks': chunks,
+            'elapsed_seconds': elapsed
+        }
+
+    def predict_from_database(self, filter_params: Dict[str, Any] = None,
+                             limit: Optional[int] = 100) -> List[Dict[str, Any]]:
+        """
+        Make predictions for data from database
+        Use limit=None for no cap, or rescore_database() for constant memory
+        """
+        print("Fetching data from database...")
+
+        records = []
+        for result_df in self.stream_predictions_from_database(filter_params, limit=limit):
+            records.extend(result_df.to_dict('records'))
+
+        print(f"Found {len(records)} records")
+
+        return records
 
     def predict_and_save_geojson(self, input_file: str, output_file: str):
         """
@@ -297,10 +769,30 @@ class PredictionService:
 
         return stats
 
+    def _predict_file(self, file_path: Path, output_path: Path) -> Dict[str, Any]:
+        try:
+            output_file = output_path / f"predicted_{file_path.name}"
+            self.predict_and_save_geojson(str(file_path), str(output_file))
+
+            return {
+                'input_file': str(file_path),
+                'output_file': str(output_file),
+                'success': True
+            }
+        except Exception as e:
+            print(f"Error processing {file_path}: {e}")
+            return {
+                'input_file': str(file_path),
+                'success': False,
+                'error': str(e)
+            }
+
     def batch_predict_directory(self, input_dir: str, output_dir: str,
-                                pattern: str = "*.geojson"):
+                                pattern: str = "*.geojson", workers: int = 1):
         """
         Batch predict all GeoJSON files in directory
+        With workers > 1 the files are scored by a forked process pool that
+        shares this process's model copy-on-write
         """
         input_path = Path(input_dir)
         output_path = Path(output_dir)
@@ -309,28 +801,133 @@ class PredictionService:
         files = list(input_path.glob(pattern))
         print(f"Found {len(files)} files to process")
 
-        results = []
+        if workers > 1 and len(files) > 1 and fork_available():
+            results = run_forked(self, files, lambda predictor, file_path:
+                                 predictor._predict_file(file_path, output_path), workers,
+                                 cache=self.cache)
+        else:
+            results = [self._predict_file(file_path, output_path) for file_path in files]
 
-        for file_path in files:
-            try:
-                output_file = output_path / f"predicted_{file_path.name}"
-                self.predict_and_save_geojson(str(file_path), str(output_file))
-
-                results.append({
-                    'input_file': str(file_path),
-                    'output_file': str(output_file),
-                    'success': True
-                })
-            except Exception as e:
-                print(f"Error processing {file_path}: {e}")
-                results.append({
-                    'input_file': str(file_path),
-                    'success': False,
-                    'error': str(e)
-                })
+        if self.cache is not None:
+            stats = self.cache_stats()
+            print(f"Prediction cache hit rate: {stats['hit_rate']:.1%} "
+                  f"({stats['hits']} hits, {stats['misses']} misses)")
 
         return results
 
+    def after_fork(self, db_session=None):
+        """
+        Make a forked copy of this service safe to use in the child process:
+        new database session, own cache connection, one model thread per process
+        """
+        self.db = db_session or SessionLocal()
+        self.repo = GeoSpatialRepository(self.db)
+
+        if self.cache is not None:
+            self.cache.after_fork()
+
+        limit_model_threads(self.model)
+
+
+# Text that PostgreSQL can cast to float; other JSON values are read as NULL
+_NUMERIC_TEXT = r'^\s*[-+]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][-+]?[0-9]+)?\s*$'
+
+
+def _json_float(text_expr):
+    """
+    Float of a JSON property, NULL when it is not numeric, so one bad value
+    is imputed like a missing one instead of failing the whole query
+    """
+    return case((text_expr.op('~')(_NUMERIC_TEXT), cast(text_expr, Float)), else_=None)
+
+
+def _final_estimator(model):
+    """
+    Final estimator of a (imblearn/sklearn) pipeline and a function applying
+    the preceding transform steps; samplers such as SMOTE only act in fit
+    """
+    if not hasattr(model, 'steps'):
+        return model, lambda X: X
+
+    steps = [step for _, step in model.steps[:-1]
+             if step is not None and step != 'passthrough' and hasattr(step, 'transform')]
+
+    def transform(X):
+        # Pipelines fitted on arrays expect arrays
+        X = X.to_numpy() if getattr(model.steps[-1][1], 'feature_names_in_', None) is None else X
+        for step in steps:
+            X = step.transform(X)
+        return X
+
+    return model.steps[-1][1], transform
+
+
+def limit_model_threads(model, n_jobs: int = 1):
+    """
+    Set n_jobs on a LightGBM model (or the final step of a pipeline)
+    Forked workers already run one per core, and OpenMP thread pools do not
+    survive fork
+    """
+    estimator = model.steps[-1][1] if hasattr(model, 'steps') else model
+    if hasattr(estimator, 'get_params') and 'n_jobs' in estimator.get_params():
+        estimator.set_params(n_jobs=n_jobs)
+
+
+def fork_available() -> bool:
+    return 'fork' in mp.get_all_start_methods()
+
+
+# State handed to forked workers; set in the parent right before the pool starts
+_fork_state: Dict[str, Any] = {}
+
+
+def _init_fork_worker():
+    # Pooled connections belong to the parent: drop them without closing its sockets
+    engine.dispose(close=False)
+    _fork_state['target'].after_fork()
+
+
+def _run_fork_task(task):
+    index, file_path = task
+    result = _fork_state['task'](_fork_state['target'], file_path)
+    cache = _fork_state['cache']
+    return index, result, cache.take_journal() if cache is not None else None
+
+
+def run_forked(target, files: List[Path], task, workers: int,
+               cache: Optional[PredictionCache] = None) -> List[Dict[str, Any]]:
+    """
+    Run task(target, file_path) for every file in a forked process pool
+    Largest files are dispatched first for load balance; results come back
+    in the original file order
+    cache is the target's prediction cache: each worker returns its hit
+    counts and new entries with every result and they are merged into it
+    """
+    order = sorted(range(len(files)), key=lambda i: files[i].stat().st_size, reverse=True)
+    results: List[Optional[Dict[str, Any]]] = [None] * len(files)
+
+    _fork_state['target'] = target
+    _fork_state['task'] = task
+    _fork_state['cache'] = cache
+
+    # Keep the collector from touching (and so copying) the shared model pages
+    gc.collect()
+    gc.freeze()
+    try:
+        with mp.get_context('fork').Pool(min(workers, len(files)), initializer=_init_fork_worker) as pool:
+            for done, (index, result, journal) in enumerate(
+                    pool.imap_unordered(_run_fork_task, [(i, files[i]) for i in order]), 1):
+                results[index] = result
+                if cache is not None:
+                    cache.merge_journal(journal)
+                print(f"[{done}/{len(files)}] {files[index].name}: "
+                      f"{'ok' if result.get('success') else 'failed'}")
+    finally:
+        gc.unfreeze()
+        _fork_state.clear()
+
+    return results
+
 
 def quick_predict(data: Dict[str, Any], model_path: str) -> Dict[str, Any]:
     """
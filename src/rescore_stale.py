@@ -0,0 +1,56 @@
+"""
+Incremental Re-scoring
+Re-predicts only neighborhoods whose input features or model version changed
+since their last prediction and updates them in place
+
+Usage:
+    python rescore_stale.py --model src/model/final_lightgbm_regressor.pkl
+    python rescore_stale.py --model src/model/final_lightgbm_regressor.pkl --district Kadıköy --dry-run
+"""
+import argparse
+import json
+from prediction_service import PredictionService
+
+
+def rescore_stale(model_path: str, district: str = None, year: int = None,
+                  chunk_size: int = 5000, full: bool = False, dry_run: bool = False):
+    """
+    Score stale rows (or every row with full=True) and write them back
+    """
+    filter_params = {}
+    if district:
+        filter_params['district'] = district
+    if year:
+        filter_params['year'] = year
+
+    with PredictionService(model_path=model_path) as predictor:
+        predictor.repo.ensure_prediction_columns()
+
+        stale = predictor.count_stale_rows(filter_params)
+        print(f"Stale rows for {predictor.model_version}: {stale}")
+
+        if dry_run:
+            return {'stale': stale, 'scored': 0}
+
+        if not full and stale == 0:
+            print("Nothing to re-score")
+            return {'stale': 0, 'scored': 0}
+
+        summary = predictor.rescore_database(filter_params, chunk_size, only_stale=not full)
+        summary['stale'] = stale
+        return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-score neighborhoods whose inputs or model changed")
+    parser.add_argument('--model', default="src/model/final_lightgbm_regressor.pkl")
+    parser.add_argument('--district', default=None)
+    parser.add_argument('--year', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--full', action='store_true', help="Re-score every row, not only stale ones")
+    parser.add_argument('--dry-run', action='store_true', help="Only count stale rows")
+    args = parser.parse_args()
+
+    result = rescore_stale(args.model, args.district, args.year, args.chunk_size,
+                           args.full, args.dry_run)
+    print(json.dumps(result, indent=2))
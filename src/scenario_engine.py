@@ -0,0 +1,283 @@
+"""
+What-if Scenario Engine
+Evaluates a grid of feature perturbations (PGA scaling, vs30 shifts,
+population growth, ...) against every neighborhood in memory-bounded batches
+
+Usage:
+    python scenario_engine.py --data public/data/istanbul_risk_data.csv \
+        --pga-scale 0.8,1.0,1.2,1.5 --vs30-shift -100,-50,0,50 --population-growth 0,0.1,0.25
+"""
+import argparse
+import itertools
+import time
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Any, Optional, Sequence, Union
+from prediction_service import PredictionService
+
+
+PGA_COLUMNS = ('pga_scenario_mw72', 'pga_scenario_mw75')
+POPULATION_COLUMNS = ('toplam_nufus',)
+VS30_COLUMNS = ('vs30_mean',)
+
+ColumnKey = Union[str, Sequence[str]]
+
+
+class Scenario:
+    """
+    One perturbation of the base features: x' = x * scale + shift,
+    with set_values replacing a column outright
+    """
+
+    def __init__(self, name: str, scale: Optional[Dict[str, float]] = None,
+                 shift: Optional[Dict[str, float]] = None,
+                 set_values: Optional[Dict[str, float]] = None):
+        self.name = name
+        self.scale = dict(scale or {})
+        self.shift = dict(shift or {})
+        self.set_values = dict(set_values or {})
+
+    def columns(self) -> set:
+        return set(self.scale) | set(self.shift) | set(self.set_values)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'name': self.name, 'scale': self.scale, 'shift': self.shift,
+                'set_values': self.set_values}
+
+    def __repr__(self):
+        return f"<Scenario({self.name})>"
+
+
+def _columns_of(key: ColumnKey) -> List[str]:
+    return [key] if isinstance(key, str) else list(key)
+
+
+def scenario_grid(scale: Optional[Dict[ColumnKey, Sequence[float]]] = None,
+                  shift: Optional[Dict[ColumnKey, Sequence[float]]] = None) -> List[Scenario]:
+    """
+    Cartesian product of perturbation levels
+    Keys are a column or a tuple of columns that move together, e.g.
+    scale={('pga_scenario_mw72', 'pga_scenario_mw75'): [0.8, 1.0, 1.2]}
+    """
+    axes = []
+    for kind, spec in (('scale', scale or {}), ('shift', shift or {})):
+        for key, levels in spec.items():
+            axes.append((kind, _columns_of(key), list(levels)))
+
+    scenarios = []
+    for combination in itertools.product(*[levels for _, _, levels in axes]):
+        scale_values, shift_values, parts = {}, {}, []
+        for (kind, columns, _), level in zip(axes, combination):
+            target = scale_values if kind == 'scale' else shift_values
+            for col in columns:
+                target[col] = float(level)
+            parts.append(f"{'+'.join(columns)}x{level:g}" if kind == 'scale'
+                         else f"{'+'.join(columns)}{level:+g}")
+        scenarios.append(Scenario(', '.join(parts) or 'baseline', scale_values, shift_values))
+
+    return scenarios
+
+
+class ScenarioResult:
+    """
+    Compact (scenario x neighborhood) prediction array
+    """
+
+    def __init__(self, scenarios: List[Scenario], neighborhood_ids: np.ndarray,
+                 values: np.ndarray, baseline: np.ndarray, elapsed_seconds: float):
+        self.scenarios = scenarios
+        self.neighborhood_ids = neighborhood_ids
+        self.values = values
+        self.baseline = baseline
+        self.elapsed_seconds = elapsed_seconds
+
+    @property
+    def names(self) -> List[str]:
+        return [scenario.name for scenario in self.scenarios]
+
+    def summary(self) -> pd.DataFrame:
+        """
+        Per-scenario distribution of predictions and change vs. the base data
+        For probability output the last (highest risk) class is summarized
+        """
+        values = self.values.reshape(len(self.scenarios), len(self.neighborhood_ids), -1)[..., -1]
+        baseline = self.baseline.reshape(len(self.neighborhood_ids), -1)[:, -1]
+        delta = values - baseline[None, :]
+
+        return pd.DataFrame({
+            'scenario': self.names,
+            'mean': values.mean(axis=1),
+            'p50': np.percentile(values, 50, axis=1),
+            'p90': np.percentile(values, 90, axis=1),
+            'max': values.max(axis=1),
+            'mean_delta': delta.mean(axis=1),
+            'max_delta': delta.max(axis=1)
+        })
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Wide table: one row per neighborhood, one column per scenario
+        """
+        values = self.values.reshape(len(self.scenarios), len(self.neighborhood_ids), -1)[..., -1]
+        return pd.DataFrame(values.T, index=pd.Index(self.neighborhood_ids, name='mah_id'),
+                            columns=self.names)
+
+    def save(self, file_path: str) -> str:
+        """Save as compressed .npz"""
+        np.savez_compressed(
+            file_path,
+            values=self.values,
+            baseline=self.baseline,
+            neighborhood_ids=self.neighborhood_ids,
+            scenario_names=np.array(self.names)
+        )
+        return file_path
+
+
+class ScenarioEngine:
+    """
+    Prepares the base feature matrix once and evaluates many scenarios
+    with one model call per batch of stacked scenario copies
+    """
+
+    def __init__(self, predictor: PredictionService, max_batch_rows: int = 250000,
+                 output: str = 'prediction', dtype=np.float32):
+        if predictor.model is None:
+            raise ValueError("Model not loaded. Use load_model() first.")
+        if output not in ('prediction', 'proba'):
+            raise ValueError("output must be 'prediction' or 'proba'")
+        if output == 'proba' and not hasattr(predictor.model, 'predict_proba'):
+            raise ValueError("Model has no predict_proba")
+
+        self.predictor = predictor
+        self.max_batch_rows = max_batch_rows
+        self.output = output
+        self.dtype = dtype
+        self.base = None
+        self.columns: List[str] = []
+        self.neighborhood_ids = None
+        self._lower_bounds = None
+
+    def set_base(self, data: pd.DataFrame, id_column: str = 'mah_id') -> 'ScenarioEngine':
+        """
+        Prepare the base feature matrix for all neighborhoods
+        """
+        X = self.predictor.prepare_features(data)
+        self.columns = list(X.columns)
+        self.base = X.to_numpy(dtype=np.float64)
+        self.neighborhood_ids = (data[id_column].to_numpy() if id_column in data.columns
+                                 else np.arange(len(data)))
+
+        # Columns that are non-negative in the data stay non-negative after a shift
+        self._lower_bounds = np.where(self.base.min(axis=0) >= 0, 0.0, -np.inf)
+        return self
+
+    def _perturbation_arrays(self, scenarios: List[Scenario]):
+        index = {col: i for i, col in enumerate(self.columns)}
+        unknown = set().union(*[scenario.columns() for scenario in scenarios]) - set(index)
+        if unknown:
+            raise ValueError(f"Unknown feature columns in scenarios: {sorted(unknown)}")
+
+        n_features = len(self.columns)
+        scale = np.ones((len(scenarios), n_features))
+        shift = np.zeros((len(scenarios), n_features))
+        set_mask = np.zeros((len(scenarios), n_features), dtype=bool)
+        set_values = np.zeros((len(scenarios), n_features))
+
+        for s, scenario in enumerate(scenarios):
+            for col, value in scenario.scale.items():
+                scale[s, index[col]] = value
+            for col, value in scenario.shift.items():
+                shift[s, index[col]] = value
+            for col, value in scenario.set_values.items():
+                set_mask[s, index[col]] = True
+                set_values[s, index[col]] = value
+
+        return scale, shift, set_mask, set_values
+
+    def _evaluate(self, X: np.ndarray) -> np.ndarray:
+        frame = pd.DataFrame(X, columns=self.columns, copy=False)
+        if self.output == 'proba':
+            return np.asarray(self.predictor.model.predict_proba(frame))
+        return np.asarray(self.predictor.model.predict(frame))
+
+    def run(self, scenarios: List[Scenario]) -> ScenarioResult:
+        """
+        Evaluate every scenario for every neighborhood
+        Returns values of shape (scenarios, neighborhoods) or, for
+        output='proba', (scenarios, neighborhoods, classes)
+        """
+        if self.base is None:
+            raise ValueError("Base data not set. Use set_base() first.")
+
+        start = time.perf_counter()
+        n_rows, n_features = self.base.shape
+        scale, shift, set_mask, set_values = self._perturbation_arrays(scenarios)
+        per_batch = max(1, self.max_batch_rows // max(n_rows, 1))
+
+        baseline = self._evaluate(self.base).astype(self.dtype)
+        values = np.empty((len(scenarios),) + baseline.shape, dtype=self.dtype)
+
+        for first in range(0, len(scenarios), per_batch):
+            last = min(first + per_batch, len(scenarios))
+            batch = slice(first, last)
+
+            # (k, n, f) stack of perturbed copies, evaluated as one (k * n, f) matrix
+            X = self.base[None, :, :] * scale[batch, None, :] + shift[batch, None, :]
+            X = np.where(set_mask[batch, None, :], set_values[batch, None, :], X)
+            np.maximum(X, self._lower_bounds, out=X)
+
+            result = self._evaluate(X.reshape(-1, n_features))
+            values[batch] = result.reshape((last - first,) + baseline.shape)
+
+        elapsed = time.perf_counter() - start
+        print(f"Evaluated {len(scenarios)} scenarios x {n_rows} neighborhoods "
+              f"({len(scenarios) * n_rows} rows) in {elapsed:.2f} seconds")
+
+        return ScenarioResult(scenarios, self.neighborhood_ids, values, baseline, elapsed)
+
+
+def _levels(text: Optional[str]) -> List[float]:
+    return [float(value) for value in text.split(',')] if text else []
+
+
+def build_cli_grid(pga_scale: List[float], vs30_shift: List[float],
+                   population_growth: List[float]) -> List[Scenario]:
+    """
+    Grid over the standard what-if axes used by the dashboard
+    """
+    scale: Dict[ColumnKey, List[float]] = {}
+    shift: Dict[ColumnKey, List[float]] = {}
+    if pga_scale:
+        scale[PGA_COLUMNS] = pga_scale
+    if population_growth:
+        scale[POPULATION_COLUMNS] = [1.0 + growth for growth in population_growth]
+    if vs30_shift:
+        shift[VS30_COLUMNS] = vs30_shift
+    return scenario_grid(scale, shift)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="What-if scenario sweep")
+    parser.add_argument('--data', default="public/data/istanbul_risk_data.csv")
+    parser.add_argument('--model', default="src/model/final_lightgbm_regressor.pkl")
+    parser.add_argument('--pga-scale', default="0.8,0.9,1.0,1.1,1.2,1.5")
+    parser.add_argument('--vs30-shift', default="-100,-50,0,50")
+    parser.add_argument('--population-growth', default="0,0.05,0.1,0.25")
+    parser.add_argument('--output-type', default='prediction', choices=['prediction', 'proba'])
+    parser.add_argument('--max-batch-rows', type=int, default=250000)
+    parser.add_argument('--output', default=None, help="Save results as .npz")
+    args = parser.parse_args()
+
+    grid = build_cli_grid(_levels(args.pga_scale), _levels(args.vs30_shift),
+                          _levels(args.population_growth))
+
+    with PredictionService(model_path=args.model) as service:
+        engine = ScenarioEngine(service, args.max_batch_rows, args.output_type)
+        engine.set_base(pd.read_csv(args.data))
+        sweep = engine.run(grid)
+
+    print(sweep.summary().to_string(index=False))
+
+    if args.output:
+        print(f"Results saved to {sweep.save(args.output)}")
@@ -11,10 +11,25 @@ Author: Seismic Risk ML Team
 Date: October 2025
 """
 
+import os
+import sys
+import math
+import time
+import sqlite3
+import hashlib
+import shutil
+import tempfile
+import inspect
+import argparse
+import threading
+import subprocess
+import multiprocessing
 import pandas as pd
 import numpy as np
 import json
 import joblib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
@@ -24,19 +39,39 @@ from datetime import datetime
 import warnings
 warnings.filterwarnings('ignore')
 
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Data sources
+import sqlalchemy as sa
+import pyarrow as pa
+import pyarrow.parquet as pq
+
 # ML libraries
 import lightgbm as lgb
 import shap
-from sklearn.model_selection import KFold, StratifiedKFold
+import sklearn
+import imblearn
+from sklearn.model_selection import KFold, StratifiedKFold, train_test_split
 from sklearn.metrics import (
     mean_squared_error, mean_absolute_error, r2_score,
     cohen_kappa_score, classification_report, confusion_matrix,
     balanced_accuracy_score, f1_score
 )
-from scipy.stats import spearmanr
+from scipy.stats import spearmanr, norm
 from imblearn.over_sampling import SMOTE
 from imblearn.pipeline import Pipeline as ImbPipeline
 
+# Preprocessing artifacts are written by the prediction service's own class
+# (src/feature_preprocessor.py, next to or one level above this directory)
+for service_dir in (Path(__file__).resolve().parent.parent, Path(__file__).resolve().parent.parent / 'src'):
+    if (service_dir / 'feature_preprocessor.py').exists():
+        sys.path.append(str(service_dir))
+        break
+from feature_preprocessor import FeaturePreprocessor
+
 # Reproducibility
 SEED = 42
 np.random.seed(SEED)
@@ -54,6 +89,17 @@ class Config:
     ARTIFACTS_DIR = OUTPUT_DIR / 'artifacts'
     PLOTS_DIR = OUTPUT_DIR / 'plots'
 
+    # PostGIS training source: versioned Parquet snapshots of the neighborhood table
+    DATABASE_URL = os.getenv('DATABASE_URL', 'postgresql://{}:{}@{}:{}/{}'.format(
+        os.getenv('DB_USER', 'postgres'), os.getenv('DB_PASSWORD', 'password'),
+        os.getenv('DB_HOST', 'localhost'), os.getenv('DB_PORT', '5432'),
+        os.getenv('DB_NAME', 'urban_risk_db')))
+    DB_TABLE = 'mahalle_risk_data'
+    SNAPSHOT_DIR = SCRIPT_DIR / 'data' / 'snapshots'
+    SNAPSHOT_CHUNK_ROWS = 50000
+    DATA_SOURCE = None  # set when training from snapshots instead of DATA_FILE
+    DATA_SOURCE_KEY = None  # cities and years of those snapshots, e.g. 'istanbul/2025'
+
     # Create directories
     for d in [OUTPUT_DIR, MODEL_DIR, ARTIFACTS_DIR, PLOTS_DIR]:
         d.mkdir(exist_ok=True, parents=True)
@@ -72,6 +118,22 @@ class Config:
     TARGET_REGRESSION = 'risk_score'
     TARGET_CLASSIFICATION = 'risk_class_5'
 
+    # Table columns used when a training column is missing from a row's GeoJSON properties
+    DB_COLUMNS = {
+        'toplam_nufus': 'toplam_nufus',
+        'toplam_bina': 'toplam_bina',
+        'vs30_mean': 'vs30_mean',
+        'rjb_distance_km': 'rjb_km',
+        'pga_scenario_mw72': 'pga_scenario_mw72',
+        'pga_scenario_mw75': 'pga_scenario_mw75',
+        'earthquake_min_distance_km': 'earthquake_min_distance_km',
+        'earthquake_count_10km': 'earthquake_count_10km',
+        'max_magnitude_nearby_20km': 'max_magnitude_nearby_20km',
+        'strong_earthquakes_20km': 'strong_earthquakes_20km',
+        'risk_score': 'bilesik_risk_skoru',
+        'risk_class_5': 'risk_label_5li'
+    }
+
     # Model A: Regression
     MODEL_A_PARAMS = {
         'objective': 'regression',
@@ -113,6 +175,96 @@ class Config:
     # Cross-validation
     CV_FOLDS = 5
 
+    # Parallelism: CPU threads shared between concurrent CV folds and LightGBM
+    N_JOBS = os.cpu_count() or 1
+    CV_PARALLEL_FOLDS = None  # None = as many folds as the thread budget allows
+
+    # Profiling: RSS sampling interval (seconds) for per-stage peak memory
+    PROFILE_INTERVAL = 0.05
+
+    # Benchmark: synthetic datasets of these sizes; flag stages slower than
+    # tolerance x the previous benchmark
+    BENCHMARK_DIR = OUTPUT_DIR / 'benchmark'
+    BENCHMARK_SIZES = [1000, 10000, 100000]
+    BENCHMARK_TOLERANCE = 1.25
+
+    # Content-addressed cache of training stage outputs
+    STAGE_CACHE_DIR = OUTPUT_DIR / 'stage_cache'
+
+    # Binned LightGBM datasets, cached in binary form by data hash + binning params
+    DATASET_CACHE_DIR = OUTPUT_DIR / 'dataset_cache'
+    BINNING_PARAMS = {
+        'max_bin': 255,
+        'min_data_in_bin': 3,
+        'bin_construct_sample_cnt': 200000,
+        'data_random_seed': SEED,
+        'feature_pre_filter': False  # keep bins independent of min_data_in_leaf
+    }
+
+    # SHAP: 'sample' explains a target-stratified sample, 'full' every row (opt-in)
+    SHAP_MODE = 'sample'
+    SHAP_SAMPLE_SIZE = 2000
+    SHAP_STRATA = 10
+    SHAP_CHUNK_SIZE = 1000
+    SHAP_CI_LEVEL = 0.95
+
+    # Hyperparameter search: successive halving, every trial logged to SQLite
+    STUDY_DB = OUTPUT_DIR / 'tuning_studies.sqlite'
+    TUNED_PARAMS_FILE = ARTIFACTS_DIR / 'tuned_params.json'
+    TUNING_TRIALS = 27
+    TUNING_MIN_ROUNDS = 50
+    TUNING_MAX_ROUNDS = 500
+    TUNING_ETA = 3  # keep the best 1/eta of trials per rung, eta x more rounds
+    TUNING_SPACE = {
+        'learning_rate': ('log', 0.01, 0.2),
+        'num_leaves': ('int', 15, 127),
+        'min_data_in_leaf': ('int', 5, 100),
+        'feature_fraction': ('float', 0.5, 1.0),
+        'bagging_fraction': ('float', 0.5, 1.0),
+        'lambda_l1': ('log', 1e-3, 10.0),
+        'lambda_l2': ('log', 1e-3, 10.0)
+    }
+
+    # Distilled serving models: smaller students fit on the teachers' OOF outputs
+    DISTILL_A_PARAMS = {
+        'objective': 'regression',
+        'learning_rate': 0.1,
+        'num_leaves': 15,
+        'max_depth': 5,
+        'min_data_in_leaf': 20,
+        'feature_fraction': 0.9,
+        'bagging_fraction': 0.8,
+        'bagging_freq': 1,
+        'lambda_l2': 1.0,
+        'n_estimators': 150,
+        'random_state': SEED,
+        'verbose': -1
+    }
+    DISTILL_B_PARAMS = {
+        'objective': 'multiclass',
+        'num_class': 5,
+        'learning_rate': 0.1,
+        'num_leaves': 15,
+        'max_depth': 5,
+        'min_data_in_leaf': 10,
+        'feature_fraction': 0.9,
+        'bagging_fraction': 0.8,
+        'bagging_freq': 1,
+        'lambda_l2': 1.0,
+        'n_estimators': 100,
+        'random_state': SEED,
+        'verbose': -1
+    }
+    # Largest accepted drop vs. the teacher (CV, against the true targets)
+    DISTILL_BOUNDS = {'spearman_loss': 0.01, 'qwk_loss': 0.02}
+
+    # Incremental refresh: warm start from the previous models
+    INCREMENTAL_ROUNDS = 100
+    INCREMENTAL_REPLAY_FRACTION = 0.2  # unchanged rows mixed in to limit forgetting
+    INCREMENTAL_VALIDATION_FRACTION = 0.2  # of the changed rows, held out for the drift guard
+    FINGERPRINT_DIGITS = 10  # significant digits hashed, so CSV round-trip noise is not an edit
+    DRIFT_TOLERANCE = {'rmse': 0.10, 'qwk': 0.02}  # relative RMSE rise, absolute QWK drop
+
 # ============================================================================
 # HELPER FUNCTIONS
 # ============================================================================
@@ -134,99 +286,914 @@ def save_json(data, filepath):
         json.dump(data, f, indent=2, ensure_ascii=False)
     print(f"  ✓ Saved: {filepath.name}")
 
+def set_output_dir(output_dir):
+    """
+    Write models, artifacts and plots under another directory
+    Snapshots, the stage and dataset caches, tuning studies and tuned params
+    stay shared
+    """
+    Config.OUTPUT_DIR = Path(output_dir)
+    Config.MODEL_DIR = Config.OUTPUT_DIR / 'models'
+    Config.ARTIFACTS_DIR = Config.OUTPUT_DIR / 'artifacts'
+    Config.PLOTS_DIR = Config.OUTPUT_DIR / 'plots'
+    for d in [Config.OUTPUT_DIR, Config.MODEL_DIR, Config.ARTIFACTS_DIR, Config.PLOTS_DIR]:
+        d.mkdir(exist_ok=True, parents=True)
+
+def save_preprocessing_artifact(X, model_path, training_columns=None):
+    """
+    Fit the prediction service's FeaturePreprocessor (column order, dtypes,
+    train-time means) on X and save it next to a model
+    training_columns is the column order the model was fitted in; pass it for
+    models fitted on arrays (Model B), whose pickles only name Column_N
+    """
+    columns = list(training_columns if training_columns is not None else X.columns)
+    preprocessor = FeaturePreprocessor.fit(X, columns, 'mean')
+    preprocessor.metadata['training_columns'] = columns
+    preprocessor.metadata['source'] = Config.DATA_SOURCE or str(Config.DATA_FILE)
+
+    artifact_path = model_path.with_name(model_path.stem + '.preprocessing.json')
+    preprocessor.save(artifact_path)
+    print(f"  ✓ Saved: {artifact_path.name}")
+    return artifact_path
+
+def thread_budget(n_tasks, n_jobs=None, max_parallel=None):
+    """
+    Split the CPU thread budget between concurrent tasks and LightGBM threads
+    Returns (parallel_tasks, threads_per_task)
+    """
+    n_jobs = n_jobs or Config.N_JOBS
+    parallel = max(1, min(n_tasks, n_jobs, max_parallel or n_tasks))
+    return parallel, max(1, n_jobs // parallel)
+
+def lgb_params(params, n_threads):
+    """
+    LightGBM params pinned to n_threads; deterministic mode keeps results
+    identical whatever the thread count or fold parallelism
+    """
+    return {**params, 'n_jobs': n_threads, 'deterministic': True, 'force_row_wise': True}
+
+def booster_params(params, n_threads):
+    """
+    Native lgb.train params for the sklearn-style params in Config
+    Returns (params, num_boost_round)
+    """
+    params = lgb_params(params, n_threads)
+    num_boost_round = params.pop('n_estimators', 100)
+    params['seed'] = params.pop('random_state', SEED)
+    params['num_threads'] = params.pop('n_jobs')
+    return {**Config.BINNING_PARAMS, **params}, num_boost_round
+
+def dataset_key(X, y, binning_params):
+    """Hash of feature values, labels, column order and binning params"""
+    digest = hashlib.md5()
+    digest.update(json.dumps({'columns': list(X.columns), 'binning': binning_params},
+                             sort_keys=True).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes())
+    digest.update(pd.util.hash_pandas_object(y, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def binned_cache_path(X, y, binning_params=None):
+    """Binary cache file for the binned Dataset of X, y"""
+    binning_params = binning_params or Config.BINNING_PARAMS
+    Config.DATASET_CACHE_DIR.mkdir(exist_ok=True, parents=True)
+    return Config.DATASET_CACHE_DIR / f"{dataset_key(X, y, binning_params)}.bin"
+
+def load_binned_dataset(X, y, binning_params=None):
+    """
+    Constructed (binned) LightGBM Dataset for X, y
+    Loaded from the binary cache when the same data and binning params were
+    binned before; otherwise binned once and saved
+    """
+    binning_params = binning_params or Config.BINNING_PARAMS
+    if Config.DATASET_CACHE_DIR is None:
+        return lgb.Dataset(X, label=y, feature_name=list(X.columns),
+                           params=binning_params, free_raw_data=False).construct()
+    cache_path = binned_cache_path(X, y, binning_params)
+
+    if cache_path.exists():
+        dataset = lgb.Dataset(str(cache_path), params=binning_params, free_raw_data=False).construct()
+        print(f"  ✓ Binned dataset loaded from cache: {cache_path.name}")
+        return dataset
+
+    dataset = lgb.Dataset(X, label=y, feature_name=list(X.columns),
+                          params=binning_params, free_raw_data=False).construct()
+    tmp_path = cache_path.with_suffix(f'.{os.getpid()}.tmp')
+    dataset.save_binary(str(tmp_path))
+    os.replace(tmp_path, cache_path)
+    print(f"  ✓ Binned dataset cached: {cache_path.name}")
+    return dataset
+
+def run_folds(fit_fold, splits):
+    """
+    Run fit_fold(fold_idx, train_idx, val_idx, n_threads) for every CV split
+    Folds run in a thread pool (LightGBM releases the GIL while training);
+    results come back in fold order
+    """
+    parallel, threads = thread_budget(len(splits), max_parallel=Config.CV_PARALLEL_FOLDS)
+    print(f"  Thread budget: {parallel} parallel folds x {threads} LightGBM threads")
+
+    if parallel == 1:
+        return [fit_fold(i, train_idx, val_idx, threads)
+                for i, (train_idx, val_idx) in enumerate(splits, 1)]
+
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        futures = [pool.submit(fit_fold, i, train_idx, val_idx, threads)
+                   for i, (train_idx, val_idx) in enumerate(splits, 1)]
+        return [future.result() for future in futures]
+
 # ============================================================================
-# MODEL A: REGRESSION
+# POSTGIS TRAINING SOURCE (PARQUET SNAPSHOTS)
+# ============================================================================
+def snapshot_table():
+    """Lightweight construct of the neighborhood table (no PostGIS types needed)"""
+    numeric = sorted(set(Config.DB_COLUMNS.values()))
+    return sa.table(
+        Config.DB_TABLE,
+        sa.column('id', sa.Integer),
+        sa.column('source_file', sa.String),
+        sa.column('year', sa.Integer),
+        sa.column('updated_at', sa.DateTime),
+        sa.column('properties', sa.JSON),
+        sa.column('mah_id', sa.Float),
+        sa.column('mahalle_adi', sa.String),
+        sa.column('ilce_adi', sa.String),
+        *[sa.column(name, sa.Float) for name in numeric]
+    )
+
+def snapshot_numeric_columns():
+    return Config.FEATURES + [Config.TARGET_REGRESSION, Config.TARGET_CLASSIFICATION]
+
+def snapshot_select(table):
+    """
+    SELECT expressions for the training columns: the value in the GeoJSON
+    properties, falling back to the table column in Config.DB_COLUMNS
+    """
+    columns = [table.c.mah_id, table.c.mahalle_adi, table.c.ilce_adi]
+    for col in snapshot_numeric_columns():
+        expr = sa.cast(sa.func.nullif(table.c.properties[col].as_string(), ''), sa.Float)
+        if col in Config.DB_COLUMNS:
+            expr = sa.func.coalesce(expr, table.c[Config.DB_COLUMNS[col]])
+        columns.append(expr.label(col))
+    return columns
+
+def snapshot_filters(table, city, year):
+    # City comes from the imported file name (e.g. .../2025/istanbul_risk.geojson)
+    return [table.c.source_file.ilike(f"%{city}%"), table.c.year == year]
+
+def snapshot_schema(city, year, version):
+    fields = [('mah_id', pa.float64()), ('mahalle_adi', pa.string()), ('ilce_adi', pa.string())]
+    fields += [(col, pa.float64()) for col in snapshot_numeric_columns()]
+    return pa.schema(fields, metadata={
+        'city': city,
+        'year': str(year),
+        'version': version,
+        'table': Config.DB_TABLE,
+        'created_at': datetime.now().isoformat()
+    })
+
+def snapshot_version(conn, table, city, year):
+    """
+    Row count and a short version hash of the selection: row count, last id,
+    last update and the column spec; unchanged data gives the same version
+    """
+    filters = snapshot_filters(table, city, year)
+    count, last_id, last_update = conn.execute(
+        sa.select(sa.func.count(), sa.func.max(table.c.id), sa.func.max(table.c.updated_at)).where(*filters)
+    ).one()
+    spec = [count, last_id, str(last_update), snapshot_numeric_columns(), Config.DB_COLUMNS]
+    return int(count), hashlib.md5(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+def write_snapshot(conn, table, city, year, version, path):
+    """
+    Stream one city/year from the database into a Parquet file, one
+    row group per fetched chunk, converting each chunk column by column
+    """
+    schema = snapshot_schema(city, year, version)
+    stmt = sa.select(*snapshot_select(table)).where(*snapshot_filters(table, city, year)).order_by(table.c.id)
+    result = conn.execution_options(stream_results=True,
+                                    yield_per=Config.SNAPSHOT_CHUNK_ROWS).execute(stmt)
+
+    rows = 0
+    tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+    with pq.ParquetWriter(str(tmp_path), schema) as writer:
+        for partition in result.partitions():
+            columns = list(zip(*partition))
+            arrays = [pa.array(values, type=field.type, from_pandas=True)
+                      for values, field in zip(columns, schema)]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            rows += len(partition)
+    os.replace(tmp_path, path)
+
+    # Older versions of the same city/year are superseded
+    for old in path.parent.glob(f"{city}_{year}_*.parquet"):
+        if old != path:
+            old.unlink()
+    return rows
+
+def ensure_snapshots(cities, years=None, refresh=False, database_url=None):
+    """
+    Versioned Parquet snapshot per (city, year) of the training columns
+    An existing snapshot is reused while the database rows are unchanged;
+    without years every year stored for the city is used
+    Returns the snapshot paths
+    """
+    Config.SNAPSHOT_DIR.mkdir(exist_ok=True, parents=True)
+    engine = sa.create_engine(database_url or Config.DATABASE_URL)
+    table = snapshot_table()
+    paths = []
+
+    try:
+        with engine.connect() as conn:
+            for city in cities:
+                city_years = years or [year for (year,) in conn.execute(
+                    sa.select(table.c.year).distinct()
+                    .where(table.c.source_file.ilike(f"%{city}%"), table.c.year.is_not(None))
+                    .order_by(table.c.year)
+                )]
+                if not city_years:
+                    print(f"  ⚠️  No rows with a year for {city}")
+
+                for year in city_years:
+                    count, version = snapshot_version(conn, table, city, year)
+                    path = Config.SNAPSHOT_DIR / f"{city}_{year}_{version}.parquet"
+                    if path.exists() and not refresh:
+                        print(f"  ↺ Snapshot {path.name}: {count} rows, unchanged")
+                    else:
+                        start = time.perf_counter()
+                        rows = write_snapshot(conn, table, city, year, version, path)
+                        print(f"  ✓ Snapshot {path.name}: {rows} rows in {time.perf_counter() - start:.1f}s")
+                    paths.append(path)
+    finally:
+        engine.dispose()
+
+    return paths
+
+def snapshot_source_key(paths):
+    """'city/year' of each snapshot, e.g. 'ankara/2026,istanbul/2026'"""
+    sources = []
+    for path in paths:
+        meta = pq.read_metadata(str(path)).metadata or {}
+        sources.append(f"{meta.get(b'city', b'').decode()}/{int(meta.get(b'year', b'0'))}")
+    return ','.join(sorted(sources))
+
+def load_snapshots(paths):
+    """
+    Load stage for database training: memory-map the Parquet snapshots and
+    concatenate them (with city and year columns) into one training frame
+    Rows without targets are dropped
+    """
+    tables = []
+    for path in paths:
+        snapshot = pq.read_table(str(path), memory_map=True)
+        meta = snapshot.schema.metadata or {}
+        n = snapshot.num_rows
+        snapshot = snapshot.append_column('city', pa.array([meta.get(b'city', b'').decode()] * n, pa.string()))
+        snapshot = snapshot.append_column('year', pa.array([int(meta.get(b'year', b'0'))] * n, pa.int32()))
+        tables.append(snapshot.replace_schema_metadata(None))
+
+    df = pa.concat_tables(tables).to_pandas()
+    targets = [Config.TARGET_REGRESSION, Config.TARGET_CLASSIFICATION]
+    missing = df[targets].isna().any(axis=1)
+    if missing.any():
+        print(f"  ⚠️  Dropping {int(missing.sum())} rows without targets")
+        df = df[~missing].reset_index(drop=True)
+    df['mah_id'] = df['mah_id'].astype('Int64')
+    return df
+
 # ============================================================================
-def train_model_a(X, y):
+# PROFILING
+# ============================================================================
+def current_rss_mb():
+    """Resident memory of this process in MB (peak so far where /proc is unavailable)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_mb()
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB"""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+class TrainingProfile:
     """
-    Train Model A: LightGBM Regression for risk_score (0-1)
+    Wall time and peak resident memory per training stage
 
-    Returns:
-        - model: Trained LightGBM regressor
-        - metrics: Cross-validation metrics
-        - predictions: OOF predictions
-        - shap_values: SHAP values for interpretability
+    A daemon thread samples RSS every Config.PROFILE_INTERVAL seconds, so
+    native allocations (LightGBM, SHAP, SMOTE's neighbor search) count
+    towards the stage that made them. Stages may nest; an outer stage's
+    peak includes its inner stages
     """
-    print_section("MODEL A: REGRESSION (risk_score)")
 
-    # Cross-validation
+    def __init__(self, interval=None):
+        self.interval = interval or Config.PROFILE_INTERVAL
+        self.stages = {}
+        self.started = time.perf_counter()
+        self._peak = current_rss_mb()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            rss = current_rss_mb()
+            with self._lock:
+                self._peak = max(self._peak, rss)
+
+    @contextmanager
+    def measure(self, stage, cached=False):
+        with self._lock:
+            outer_peak = self._peak
+            self._peak = current_rss_mb()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                peak = max(self._peak, current_rss_mb())
+                self._peak = max(outer_peak, peak)
+            self.record(stage, seconds, peak, cached)
+
+    def record(self, stage, seconds, peak_mb, cached=False, background=False):
+        self.stages[stage] = {
+            'seconds': round(seconds, 3),
+            'peak_rss_mb': round(peak_mb, 1),
+            'cached': cached,
+            'background': background
+        }
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def to_dict(self):
+        return {
+            'total_seconds': round(time.perf_counter() - self.started, 3),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'n_jobs': Config.N_JOBS,
+            'stages': self.stages
+        }
+
+    def summary(self):
+        for stage, entry in self.stages.items():
+            note = ' (cached)' if entry['cached'] else ' (background)' if entry['background'] else ''
+            print(f"   {stage:<16} {entry['seconds']:>8.2f}s {entry['peak_rss_mb']:>8.0f} MB{note}")
+        print(f"   {'total':<16} {time.perf_counter() - self.started:>8.2f}s {peak_rss_mb():>8.0f} MB peak")
+
+def save_profile(profile, results_path=None):
+    """Add the stage profile to an existing training_results.json"""
+    results_path = results_path or artifact_paths()['results']
+    if not results_path.exists():
+        return
+    with open(results_path, encoding='utf-8') as f:
+        results = json.load(f)
+    results['profile'] = profile.to_dict()
+    save_json(results, results_path)
+
+def smote_probe(X, y):
+    """
+    SMOTE resampling of the full training set on its own
+    (the cv_b and fit_b stages include it, inside the pipeline fits)
+    """
+    X_res, _ = SMOTE(k_neighbors=SMOTE_NEIGHBORS, random_state=SEED,
+                     sampling_strategy='not majority').fit_resample(X.to_numpy(), y.to_numpy())
+    return len(X_res)
+
+# ============================================================================
+# STAGE CACHE
+# ============================================================================
+def file_digest(path, block_size=1 << 20):
+    """md5 of a file's bytes"""
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class StageCache:
+    """
+    Content-addressed cache of training stage outputs
+
+    A stage key hashes the stage name, the source of its function(s), the
+    keys of upstream stages and the config it reads, so a rerun skips every
+    stage whose inputs are unchanged. Outputs are stored as
+    output/stage_cache/<stage>-<key>.joblib
+
+    Disabled, nothing is read or stored: files a stage has to write anyway
+    (SHAP values, plot markers) go to a scratch directory removed by close()
+    """
+
+    def __init__(self, cache_dir, enabled=True, profile=None):
+        self.cache_dir = Path(cache_dir) if enabled else Path(tempfile.mkdtemp(prefix='stage_scratch_'))
+        self.enabled = enabled
+        self.profile = profile
+        self.computed = {}
+        self.cached = []
+
+    def key(self, stage, fns, *parts):
+        fns = fns if isinstance(fns, (list, tuple)) else [fns]
+        digest = hashlib.md5(stage.encode('utf-8'))
+        for fn in fns:
+            digest.update(inspect.getsource(fn).encode('utf-8'))
+        digest.update(json.dumps(parts, sort_keys=True, default=str).encode('utf-8'))
+        return digest.hexdigest()
+
+    def model_key(self, stage, fns, *parts):
+        """
+        key() for stages that train or explain models: also covers the shared
+        training helpers and the library versions the results depend on
+        """
+        fns = list(fns) if isinstance(fns, (list, tuple)) else [fns]
+        helpers = [lgb_params, booster_params, load_binned_dataset, run_folds]
+        versions = {'lightgbm': lgb.__version__, 'sklearn': sklearn.__version__,
+                    'imblearn': imblearn.__version__, 'shap': shap.__version__,
+                    'numpy': np.__version__}
+        return self.key(stage, fns + helpers, *parts, versions)
+
+    def path(self, stage, key, suffix='.joblib'):
+        self.cache_dir.mkdir(exist_ok=True, parents=True)
+        return self.cache_dir / f"{stage}-{key[:16]}{suffix}"
+
+    def is_fresh(self, stage, key, outputs=(), suffix='.joblib'):
+        return (self.enabled and self.path(stage, key, suffix).exists()
+                and all(Path(p).exists() for p in outputs))
+
+    def run(self, stage, key, fn, *args, outputs=()):
+        """
+        fn(*args), or its cached output when the key (and any extra output
+        files the stage writes) already exist
+        """
+        path = self.path(stage, key)
+        fresh = self.is_fresh(stage, key, outputs)
+        with self.profile.measure(stage, cached=fresh) if self.profile else nullcontext():
+            if fresh:
+                self.cached.append(stage)
+                print(f"  ↺ Stage {stage}: inputs unchanged, loaded from cache")
+                return joblib.load(path)
+
+            start = time.perf_counter()
+            result = fn(*args)
+            if self.enabled:
+                tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+                joblib.dump(result, tmp_path)
+                os.replace(tmp_path, path)
+            self.computed[stage] = time.perf_counter() - start
+            print(f"  ✓ Stage {stage}: computed in {self.computed[stage]:.1f}s")
+            return result
+
+    def mark_done(self, stage, key):
+        self.path(stage, key, '.done').touch()
+
+    def close(self):
+        """Remove the scratch directory of a disabled cache"""
+        if not self.enabled:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def summary(self):
+        computed = ', '.join(f"{stage} ({seconds:.1f}s)" for stage, seconds in self.computed.items())
+        print(f"   Computed: {computed or '-'}")
+        print(f"   From cache: {', '.join(self.cached) or '-'}")
+
+def render_plots(jobs):
+    """Plot worker entry point: run (plot_fn, args) jobs, return the worker's peak RSS"""
+    for plot_fn, args in jobs:
+        plot_fn(*args)
+    return peak_rss_mb()
+
+class PlotWorker:
+    """
+    Renders plot stages in a separate process, off the critical path;
+    a plot stage whose key and files already exist is skipped
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.pool = None
+        self.pending = []
+
+    def submit(self, stage, key, jobs):
+        outputs = [Path(args[-1]) for _, args in jobs]
+        if self.cache.is_fresh(stage, key, outputs, suffix='.done'):
+            self.cache.cached.append(stage)
+            print(f"  ↺ Stage {stage}: inputs unchanged, plots kept")
+            return
+
+        if self.pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+            self.pool = ProcessPoolExecutor(max_workers=1, mp_context=context)
+        self.pending.append((stage, key, outputs, time.perf_counter(), self.pool.submit(render_plots, jobs)))
+        print(f"  … Stage {stage}: rendering {len(jobs)} plots in the background")
+
+    def wait(self):
+        """Block until every submitted plot stage has finished"""
+        for stage, key, outputs, start, future in self.pending:
+            worker_peak_mb = future.result()
+            self.cache.mark_done(stage, key)
+            self.cache.computed[stage] = time.perf_counter() - start
+            if self.cache.profile:
+                self.cache.profile.record(stage, self.cache.computed[stage], worker_peak_mb, background=True)
+            for plot_path in outputs:
+                print(f"  ✓ Plot saved: {plot_path.name}")
+        self.pending = []
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+# ============================================================================
+# HYPERPARAMETER SEARCH
+# ============================================================================
+class StudyStore:
+    """
+    SQLite log of tuning trials; (trial, rung) results already in the log
+    are reused when an interrupted search is resumed
+    """
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(exist_ok=True, parents=True)
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS trials (
+                study TEXT NOT NULL,
+                trial_id INTEGER NOT NULL,
+                rung INTEGER NOT NULL,
+                rounds INTEGER NOT NULL,
+                params TEXT NOT NULL,
+                score REAL NOT NULL,
+                best_iteration INTEGER NOT NULL,
+                seconds REAL NOT NULL,
+                finished_at TEXT NOT NULL,
+                PRIMARY KEY (study, trial_id, rung)
+            )
+        """)
+        self.conn.commit()
+
+    def completed(self, study):
+        """{(trial_id, rung): (score, best_iteration)} for a study"""
+        rows = self.conn.execute(
+            "SELECT trial_id, rung, score, best_iteration FROM trials WHERE study = ?", (study,)
+        )
+        return {(trial_id, rung): (score, best_iteration) for trial_id, rung, score, best_iteration in rows}
+
+    def record(self, study, trial_id, rung, rounds, params, score, best_iteration, seconds):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO trials VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (study, trial_id, rung, rounds, json.dumps(params, sort_keys=True), score,
+             best_iteration, seconds, datetime.now().isoformat())
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+def sample_trial_params(n_trials, space=None, seed=SEED):
+    """
+    Random candidates from the search space; the sequence is fixed by the
+    seed so a resumed study sees the same trials
+    """
+    space = space or Config.TUNING_SPACE
+    rng = np.random.default_rng(seed)
+    candidates = []
+    for _ in range(n_trials):
+        params = {}
+        for name, (kind, low, high) in space.items():
+            if kind == 'int':
+                params[name] = int(rng.integers(low, high + 1))
+            elif kind == 'log':
+                params[name] = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+            else:
+                params[name] = float(rng.uniform(low, high))
+        candidates.append(params)
+    return candidates
+
+def halving_schedule(min_rounds=None, max_rounds=None, eta=None):
+    """Boosting rounds per rung, ending at max_rounds (e.g. 55, 166, 500)"""
+    min_rounds = min_rounds or Config.TUNING_MIN_ROUNDS
+    max_rounds = max_rounds or Config.TUNING_MAX_ROUNDS
+    eta = eta or Config.TUNING_ETA
+    n_rungs = int(math.floor(math.log(max_rounds / min_rounds, eta) + 1e-9)) + 1
+    return [int(round(max_rounds / eta ** (n_rungs - 1 - rung))) for rung in range(n_rungs)]
+
+def cv_trial(dataset_path, params, rounds, splits, weights, n_threads):
+    """
+    Per-iteration CV curve for one candidate on the cached binned dataset
+    Returns (best mean validation score, best iteration, seconds)
+    """
+    start = time.perf_counter()
+    config, _ = booster_params(params, n_threads)
+    dataset = lgb.Dataset(str(dataset_path), weight=weights, params=Config.BINNING_PARAMS,
+                          free_raw_data=False)
+    history = lgb.cv(config, dataset, num_boost_round=rounds, folds=splits,
+                     callbacks=[lgb.early_stopping(50, verbose=False)])
+    curve = history[f"valid {config['metric']}-mean"]
+    best = int(np.argmin(curve))
+    return float(curve[best]), best + 1, time.perf_counter() - start
+
+def tune_hyperparameters(X, y, model='a', n_trials=None, study_name=None):
+    """
+    Successive halving over Config.TUNING_SPACE for Model A ('a') or B ('b')
+
+    Every rung evaluates the surviving trials with more boosting rounds
+    (CV early stopping cuts weak trials short inside a rung) and keeps the
+    best 1/eta. Trials of a rung run in parallel on the thread budget and
+    each result is written to the study database as soon as it finishes,
+    so re-running the same study resumes where it stopped.
+
+    Model B is tuned on class-weighted folds without SMOTE (oversampling
+    would have to re-bin every fold).
+
+    Returns sklearn-style params ready for Config.MODEL_*_PARAMS
+    """
+    print_section(f"HYPERPARAMETER SEARCH (MODEL {model.upper()})")
+    n_trials = n_trials or Config.TUNING_TRIALS
+
+    if model == 'a':
+        base_params, labels, weights = Config.MODEL_A_PARAMS, y, None
+        splits = list(KFold(n_splits=Config.CV_FOLDS, shuffle=True, random_state=SEED).split(X))
+    elif model == 'b':
+        base_params, labels = Config.MODEL_B_PARAMS, y - 1
+        weights = y.map(Config.CLASS_WEIGHTS).to_numpy(dtype=float)
+        splits = list(StratifiedKFold(n_splits=Config.CV_FOLDS, shuffle=True,
+                                      random_state=SEED).split(X, y))
+    else:
+        raise ValueError("model must be 'a' or 'b'")
+
+    # Trials load the binned dataset from a binary file; with the dataset
+    # cache off it lives in a temporary directory for the search only
+    scratch_dir = None
+    if Config.DATASET_CACHE_DIR is None:
+        scratch_dir = tempfile.TemporaryDirectory(prefix='tuning_')
+        dataset_path = Path(scratch_dir.name) / f"{dataset_key(X, labels, Config.BINNING_PARAMS)}.bin"
+        load_binned_dataset(X, labels).save_binary(str(dataset_path))
+    else:
+        load_binned_dataset(X, labels)
+        dataset_path = binned_cache_path(X, labels)
+
+    schedule = halving_schedule()
+    candidates = sample_trial_params(n_trials)
+    search_key = hashlib.md5(json.dumps(
+        {'base': base_params, 'space': Config.TUNING_SPACE, 'schedule': schedule,
+         'eta': Config.TUNING_ETA, 'trials': n_trials, 'folds': Config.CV_FOLDS},
+        sort_keys=True).encode('utf-8')).hexdigest()
+    study = study_name or f"model_{model}_{dataset_path.stem[:12]}_{search_key[:8]}"
+
+    store = StudyStore(Config.STUDY_DB)
+    done = store.completed(study)
+    print(f"  Study: {study} ({len(done)} logged results in {Config.STUDY_DB.name})")
+    print(f"  Trials: {n_trials}, rungs (boosting rounds): {schedule}")
+
+    alive = list(range(n_trials))
+    scores = {}
+    try:
+        for rung, rounds in enumerate(schedule):
+            pending = [t for t in alive if (t, rung) not in done]
+            scores = {t: done[(t, rung)] for t in alive if (t, rung) in done}
+            parallel, threads = thread_budget(max(len(pending), 1))
+            print(f"  Rung {rung + 1}/{len(schedule)}: {len(alive)} trials x {rounds} rounds "
+                  f"({len(alive) - len(pending)} resumed, {parallel} parallel x {threads} threads)")
+
+            with ThreadPoolExecutor(max_workers=parallel) as pool:
+                futures = {
+                    pool.submit(cv_trial, dataset_path, {**base_params, **candidates[t]},
+                                rounds, splits, weights, threads): t
+                    for t in pending
+                }
+                for future in as_completed(futures):
+                    t = futures[future]
+                    score, best_iteration, seconds = future.result()
+                    store.record(study, t, rung, rounds, candidates[t], score, best_iteration, seconds)
+                    scores[t] = (score, best_iteration)
+
+            ranked = sorted(alive, key=lambda t: (scores[t][0], t))
+            print(f"    best {base_params['metric']}={scores[ranked[0]][0]:.6f} (trial {ranked[0]})")
+            if rung < len(schedule) - 1:
+                alive = ranked[:max(1, math.ceil(len(alive) / Config.TUNING_ETA))]
+            else:
+                alive = ranked
+    finally:
+        store.close()
+        if scratch_dir is not None:
+            scratch_dir.cleanup()
+
+    best_trial = alive[0]
+    best_score, best_iteration = scores[best_trial]
+    tuned = {**base_params, **candidates[best_trial], 'n_estimators': int(best_iteration)}
+
+    print(f"\n  ✓ Best trial {best_trial}: CV {base_params['metric']}={best_score:.6f}, "
+          f"{best_iteration} rounds")
+    for name in Config.TUNING_SPACE:
+        print(f"     {name}: {tuned[name]}")
+
+    saved = load_tuned_params()
+    saved.setdefault(tuning_source(), {})[f"model_{model}"] = {
+        'params': tuned,
+        'cv_score': best_score,
+        'metric': base_params['metric'],
+        'study': study,
+        'trial_id': best_trial,
+        'tuned_at': datetime.now().isoformat(),
+        'source': Config.DATA_SOURCE or str(Config.DATA_FILE)
+    }
+    save_json(saved, Config.TUNED_PARAMS_FILE)
+    return tuned
+
+def tuning_source():
+    """Key of the training data in the tuned params file"""
+    return Config.DATA_SOURCE_KEY or str(Config.DATA_FILE)
+
+def load_tuned_params():
+    """
+    Saved tuning results by data source: {source: {'model_a': ..., 'model_b': ...}}
+    Entries of the older flat layout are filed under their recorded source
+    """
+    if not Config.TUNED_PARAMS_FILE.exists():
+        return {}
+    with open(Config.TUNED_PARAMS_FILE, encoding='utf-8') as f:
+        saved = json.load(f)
+    for name in ('model_a', 'model_b'):
+        if name in saved:
+            entry = saved.pop(name)
+            saved.setdefault(entry.get('source', 'unknown'), {})[name] = entry
+    return saved
+
+def apply_tuned_params():
+    """
+    Replace Config.MODEL_*_PARAMS with the results tuned on the same data
+    source (cities and years, or data file), if any
+    """
+    saved = load_tuned_params().get(tuning_source())
+    if not saved:
+        print(f"  No tuned params for {tuning_source()} in {Config.TUNED_PARAMS_FILE}")
+        return
+    if 'model_a' in saved:
+        Config.MODEL_A_PARAMS = saved['model_a']['params']
+        print(f"  ✓ Model A params from study {saved['model_a']['study']}")
+    if 'model_b' in saved:
+        Config.MODEL_B_PARAMS = saved['model_b']['params']
+        print(f"  ✓ Model B params from study {saved['model_b']['study']}")
+
+# ============================================================================
+# SHAP
+# ============================================================================
+def shap_sample_index(y, sample_size, n_strata=None):
+    """
+    Sorted row positions of a sample stratified by target quantiles
+    (every row when the data is not larger than sample_size)
+    """
+    if len(y) <= sample_size:
+        return np.arange(len(y))
+    strata = pd.qcut(y.rank(method='first'), n_strata or Config.SHAP_STRATA, labels=False)
+    index, _ = train_test_split(np.arange(len(y)), train_size=sample_size,
+                                stratify=strata, random_state=SEED)
+    return np.sort(index)
+
+def compute_shap_stage(model, X, y, output_path, mode=None):
+    """
+    Exact TreeSHAP values (LightGBM pred_contrib) for a stratified sample
+    (mode='sample') or every row (mode='full'), computed in parallel chunks
+    and streamed to a memory-mapped .npy file
+
+    Returns (shap_values memmap, row positions, importance DataFrame with
+    mean |SHAP| and its confidence interval)
+    """
+    mode = mode or Config.SHAP_MODE
+    if mode not in ('sample', 'full'):
+        raise ValueError("SHAP mode must be 'sample' or 'full'")
+
+    rows = np.arange(len(X)) if mode == 'full' else shap_sample_index(y, Config.SHAP_SAMPLE_SIZE)
+    X_rows = X.iloc[rows]
+    shap_values = np.lib.format.open_memmap(output_path, mode='w+', dtype=np.float32,
+                                            shape=(len(rows), X.shape[1]))
+
+    chunks = [(start, min(start + Config.SHAP_CHUNK_SIZE, len(rows)))
+              for start in range(0, len(rows), Config.SHAP_CHUNK_SIZE)]
+    parallel, threads = thread_budget(len(chunks))
+    print(f"  SHAP mode: {mode}, {len(rows)} of {len(X)} rows, "
+          f"{len(chunks)} chunks ({parallel} parallel x {threads} threads)")
+
+    def explain_chunk(bounds):
+        start, stop = bounds
+        contributions = model.predict(X_rows.iloc[start:stop], pred_contrib=True, num_threads=threads)
+        shap_values[start:stop] = contributions[:, :-1]  # last column is the expected value
+        abs_values = np.abs(contributions[:, :-1])
+        return abs_values.sum(axis=0), np.square(abs_values).sum(axis=0)
+
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        partials = list(pool.map(explain_chunk, chunks))
+    shap_values.flush()
+
+    # Mean |SHAP| with a normal-approximation confidence interval over rows
+    n = len(rows)
+    mean = sum(p[0] for p in partials) / n
+    variance = np.maximum(sum(p[1] for p in partials) / n - mean ** 2, 0) * n / max(n - 1, 1)
+    margin = norm.ppf(0.5 + Config.SHAP_CI_LEVEL / 2) * np.sqrt(variance / n)
+
+    importance = pd.DataFrame({
+        'feature': list(X.columns),
+        'shap_importance': mean,
+        'shap_ci_low': mean - margin,
+        'shap_ci_high': mean + margin
+    })
+    return shap_values, rows, importance
+
+# ============================================================================
+# MODEL A: REGRESSION
+# ============================================================================
+def cross_validate_model_a(X, y):
+    """
+    K-fold CV of Model A on the cached binned dataset
+    Returns OOF predictions, per-fold and overall metrics
+    """
     print(f"Running {Config.CV_FOLDS}-Fold Cross-Validation...")
     kf = KFold(n_splits=Config.CV_FOLDS, shuffle=True, random_state=SEED)
 
     cv_metrics = []
     oof_predictions = np.zeros(len(X))
-    fold_models = []
 
-    for fold_idx, (train_idx, val_idx) in enumerate(kf.split(X), 1):
-        X_train, X_val = X.iloc[train_idx], X.iloc[val_idx]
-        y_train, y_val = y.iloc[train_idx], y.iloc[val_idx]
+    # Bin once; fold train/validation sets are row subsets sharing the bin mappers
+    binned = load_binned_dataset(X, y)
+    splits = list(kf.split(X))
+    fold_sets = {fold_idx: (binned.subset(train_idx).construct(), binned.subset(val_idx).construct())
+                 for fold_idx, (train_idx, val_idx) in enumerate(splits, 1)}
+
+    def fit_fold(fold_idx, train_idx, val_idx, n_threads):
+        X_val, y_val = X.iloc[val_idx], y.iloc[val_idx]
+        train_set, val_set = fold_sets[fold_idx]
 
         # Train
-        model = lgb.LGBMRegressor(**Config.MODEL_A_PARAMS)
-        model.fit(X_train, y_train, eval_set=[(X_val, y_val)],
-                 callbacks=[lgb.early_stopping(50, verbose=False)])
+        params, num_boost_round = booster_params(Config.MODEL_A_PARAMS, n_threads)
+        model = lgb.train(params, train_set, num_boost_round=num_boost_round,
+                          valid_sets=[val_set],
+                          callbacks=[lgb.early_stopping(50, verbose=False)])
 
         # Predict
-        y_val_pred = model.predict(X_val)
-        oof_predictions[val_idx] = y_val_pred
+        y_val_pred = model.predict(X_val, num_iteration=model.best_iteration)
 
         # Metrics
-        rmse = np.sqrt(mean_squared_error(y_val, y_val_pred))
-        mae = mean_absolute_error(y_val, y_val_pred)
-        r2 = r2_score(y_val, y_val_pred)
-        spearman = spearmanr(y_val, y_val_pred)[0]
-
-        cv_metrics.append({
+        metrics = {
             'fold': fold_idx,
-            'rmse': float(rmse),
-            'mae': float(mae),
-            'r2': float(r2),
-            'spearman': float(spearman)
-        })
-
-        fold_models.append(model)
-        print(f"  Fold {fold_idx}: RMSE={rmse:.6f}, MAE={mae:.6f}, Spearman={spearman:.4f}")
+            'rmse': float(np.sqrt(mean_squared_error(y_val, y_val_pred))),
+            'mae': float(mean_absolute_error(y_val, y_val_pred)),
+            'r2': float(r2_score(y_val, y_val_pred)),
+            'spearman': float(spearmanr(y_val, y_val_pred)[0])
+        }
+        return val_idx, y_val_pred, metrics
 
-    # Overall metrics
-    overall_rmse = np.sqrt(mean_squared_error(y, oof_predictions))
-    overall_mae = mean_absolute_error(y, oof_predictions)
-    overall_r2 = r2_score(y, oof_predictions)
-    overall_spearman = spearmanr(y, oof_predictions)[0]
+    # Merge OOF predictions back in fold order
+    for val_idx, y_val_pred, metrics in run_folds(fit_fold, splits):
+        oof_predictions[val_idx] = y_val_pred
+        cv_metrics.append(metrics)
+        print(f"  Fold {metrics['fold']}: RMSE={metrics['rmse']:.6f}, MAE={metrics['mae']:.6f}, "
+              f"Spearman={metrics['spearman']:.4f}")
 
-    print(f"\n  📊 Overall CV Results:")
-    print(f"     RMSE:     {overall_rmse:.6f}")
-    print(f"     MAE:      {overall_mae:.6f}")
-    print(f"     R²:       {overall_r2:.4f}")
-    print(f"     Spearman: {overall_spearman:.4f}")
+    return {
+        'oof_predictions': oof_predictions,
+        'cv_metrics': cv_metrics,
+        'overall_metrics': {
+            'rmse': float(np.sqrt(mean_squared_error(y, oof_predictions))),
+            'mae': float(mean_absolute_error(y, oof_predictions)),
+            'r2': float(r2_score(y, oof_predictions)),
+            'spearman': float(spearmanr(y, oof_predictions)[0])
+        }
+    }
 
-    # Train final model on all data
+def fit_model_a(X, y):
+    """Final Model A fit on the full dataset"""
     print(f"\n  Training final model on full dataset...")
-    final_model = lgb.LGBMRegressor(**Config.MODEL_A_PARAMS)
+    final_model = lgb.LGBMRegressor(**lgb_params(Config.MODEL_A_PARAMS, Config.N_JOBS))
     final_model.fit(X, y)
+    return final_model
 
-    # SHAP analysis
+def explain_model_a(model, X, y, shap_path):
+    """SHAP stage: values go to shap_path, rows and importance are returned"""
     print(f"\n  Computing SHAP values...")
-    explainer = shap.TreeExplainer(final_model)
-    shap_values = explainer.shap_values(X)
-
-    # Save SHAP summary plot
+    # Concurrent runs may share the stage cache: write privately, then rename
+    tmp_path = Path(shap_path).with_suffix(f'.{os.getpid()}.tmp')
+    shap_values, shap_rows, shap_importance = compute_shap_stage(model, X, y, tmp_path)
+    shap_values.flush()
+    del shap_values
+    os.replace(tmp_path, shap_path)
+    return {'shap_rows': shap_rows, 'shap_importance': shap_importance}
+
+def plot_shap_summary(shap_path, shap_rows, X, plot_path):
+    """SHAP summary plot from the memory-mapped SHAP values"""
+    shap_values = np.load(shap_path, mmap_mode='r')
     plt.figure(figsize=(10, 8))
-    shap.summary_plot(shap_values, X, feature_names=Config.FEATURES,
+    shap.summary_plot(np.asarray(shap_values), X.iloc[shap_rows], feature_names=Config.FEATURES,
                      show=False, max_display=15)
     plt.tight_layout()
-    shap_plot_path = Config.PLOTS_DIR / 'model_a_shap_summary.png'
-    plt.savefig(shap_plot_path, dpi=150, bbox_inches='tight')
+    plt.savefig(plot_path, dpi=150, bbox_inches='tight')
     plt.close()
-    print(f"  ✓ SHAP plot saved: {shap_plot_path.name}")
 
-    # Feature importance
-    feature_importance = pd.DataFrame({
-        'feature': Config.FEATURES,
-        'importance': final_model.feature_importances_,
-        'shap_importance': np.abs(shap_values).mean(axis=0)
-    }).sort_values('importance', ascending=False)
-
-    # Plot feature importance
+def plot_model_a_importance(feature_importance, plot_path):
+    """LightGBM gain and SHAP importance side by side"""
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 6))
 
     # LightGBM importance
@@ -240,7 +1207,9 @@ def train_model_a(X, y):
 
     # SHAP importance
     top_shap = feature_importance.sort_values('shap_importance', ascending=False).head(15)
-    ax2.barh(range(len(top_shap)), top_shap['shap_importance'])
+    ax2.barh(range(len(top_shap)), top_shap['shap_importance'],
+             xerr=[top_shap['shap_importance'] - top_shap['shap_ci_low'],
+                   top_shap['shap_ci_high'] - top_shap['shap_importance']])
     ax2.set_yticks(range(len(top_shap)))
     ax2.set_yticklabels(top_shap['feature'])
     ax2.set_xlabel('SHAP Importance (Mean |SHAP|)')
@@ -248,23 +1217,77 @@ def train_model_a(X, y):
     ax2.invert_yaxis()
 
     plt.tight_layout()
-    importance_plot_path = Config.PLOTS_DIR / 'model_a_feature_importance.png'
-    plt.savefig(importance_plot_path, dpi=150, bbox_inches='tight')
+    plt.savefig(plot_path, dpi=150, bbox_inches='tight')
     plt.close()
-    print(f"  ✓ Feature importance plot saved: {importance_plot_path.name}")
+
+def train_model_a(X, y, cache=None, plotter=None):
+    """
+    Train Model A: LightGBM Regression for risk_score (0-1)
+    CV, final fit and SHAP are reused from the stage cache when their inputs
+    are unchanged; plots are handed to the plot worker
+
+    Returns:
+        - model: Trained LightGBM regressor
+        - metrics: Cross-validation metrics
+        - predictions: OOF predictions
+        - shap_values: SHAP values for interpretability
+    """
+    print_section("MODEL A: REGRESSION (risk_score)")
+    cache = cache or StageCache(Config.STAGE_CACHE_DIR, enabled=False)
+    own_plotter = plotter is None
+    plotter = plotter or PlotWorker(cache)
+    data_key = dataset_key(X, y, {})
+
+    # Cross-validation
+    cv_key = cache.model_key('cv_a', cross_validate_model_a, data_key, Config.MODEL_A_PARAMS,
+                             Config.BINNING_PARAMS, Config.CV_FOLDS, SEED)
+    cv = cache.run('cv_a', cv_key, cross_validate_model_a, X, y)
+    overall = cv['overall_metrics']
+
+    print(f"\n  📊 Overall CV Results:")
+    print(f"     RMSE:     {overall['rmse']:.6f}")
+    print(f"     MAE:      {overall['mae']:.6f}")
+    print(f"     R²:       {overall['r2']:.4f}")
+    print(f"     Spearman: {overall['spearman']:.4f}")
+
+    # Train final model on all data
+    fit_key = cache.model_key('fit_a', fit_model_a, data_key, Config.MODEL_A_PARAMS)
+    final_model = cache.run('fit_a', fit_key, fit_model_a, X, y)
+
+    # SHAP analysis
+    shap_key = cache.model_key('shap_a', [explain_model_a, compute_shap_stage, shap_sample_index], fit_key,
+                               Config.SHAP_MODE, Config.SHAP_SAMPLE_SIZE, Config.SHAP_STRATA,
+                               Config.SHAP_CHUNK_SIZE, Config.SHAP_CI_LEVEL, SEED)
+    shap_path = cache.path('shap_a', shap_key, '.npy')
+    explained = cache.run('shap_a', shap_key, explain_model_a, final_model, X, y, shap_path,
+                          outputs=[shap_path])
+    shap_rows = explained['shap_rows']
+
+    # Feature importance
+    feature_importance = pd.DataFrame({
+        'feature': Config.FEATURES,
+        'importance': final_model.feature_importances_
+    }).merge(explained['shap_importance'], on='feature').sort_values('importance', ascending=False)
+
+    # Plots (SHAP summary, feature importance)
+    plot_key = cache.key('plots_a', [plot_shap_summary, plot_model_a_importance], shap_key, fit_key)
+    plotter.submit('plots_a', plot_key, [
+        (plot_shap_summary, (str(shap_path), shap_rows, X, Config.PLOTS_DIR / 'model_a_shap_summary.png')),
+        (plot_model_a_importance, (feature_importance, Config.PLOTS_DIR / 'model_a_feature_importance.png'))
+    ])
+    if own_plotter:
+        plotter.wait()
 
     results = {
         'model': final_model,
-        'oof_predictions': oof_predictions,
-        'cv_metrics': cv_metrics,
-        'overall_metrics': {
-            'rmse': float(overall_rmse),
-            'mae': float(overall_mae),
-            'r2': float(overall_r2),
-            'spearman': float(overall_spearman)
-        },
+        'oof_predictions': cv['oof_predictions'],
+        'cv_metrics': cv['cv_metrics'],
+        'overall_metrics': overall,
         'feature_importance': feature_importance,
-        'shap_values': shap_values
+        'shap_values': np.load(shap_path, mmap_mode='r'),
+        'shap_rows': shap_rows,
+        'shap_path': shap_path,
+        'stage_keys': {'cv_a': cv_key, 'fit_a': fit_key, 'shap_a': shap_key, 'plots_a': plot_key}
     }
 
     return results
@@ -272,38 +1295,28 @@ def train_model_a(X, y):
 # ============================================================================
 # MODEL B: CLASSIFICATION
 # ============================================================================
-def train_model_b(X, y):
-    """
-    Train Model B: LightGBM Classification for risk_class_5 (1-5) with SMOTE
-
-    Returns:
-        - model: Trained LightGBM classifier with SMOTE pipeline
-        - metrics: Cross-validation metrics
-        - predictions: OOF predictions and probabilities
-    """
-    print_section("MODEL B: CLASSIFICATION (risk_class_5) with SMOTE")
-
-    # Class distribution
-    print(f"Class distribution:")
-    class_counts = y.value_counts().sort_index()
-    for cls, count in class_counts.items():
-        pct = 100 * count / len(y)
-        print(f"  Class {cls}: {count:3d} ({pct:5.1f}%)")
+SMOTE_NEIGHBORS = 5
 
+def make_model_b_pipeline(n_threads, params=None):
+    """SMOTE + class-weighted LightGBM classifier pipeline"""
     # LightGBM Classifier with class weights
     lgb_clf = lgb.LGBMClassifier(
-        **Config.MODEL_B_PARAMS,
+        **lgb_params(params or Config.MODEL_B_PARAMS, n_threads),
         class_weight=Config.CLASS_WEIGHTS
     )
 
     # SMOTE pipeline
-    pipeline = ImbPipeline([
-        ('smote', SMOTE(k_neighbors=5, random_state=SEED,
+    return ImbPipeline([
+        ('smote', SMOTE(k_neighbors=SMOTE_NEIGHBORS, random_state=SEED,
                        sampling_strategy='not majority')),
         ('classifier', lgb_clf)
     ])
 
-    # Cross-validation
+def cross_validate_model_b(X, y):
+    """
+    Stratified K-fold CV of the Model B SMOTE pipeline
+    Returns OOF predictions and probabilities, per-fold and overall metrics
+    """
     print(f"\nRunning {Config.CV_FOLDS}-Fold Stratified Cross-Validation with SMOTE...")
     skf = StratifiedKFold(n_splits=Config.CV_FOLDS, shuffle=True, random_state=SEED)
 
@@ -314,44 +1327,111 @@ def train_model_b(X, y):
     oof_probabilities = np.zeros((len(y_np), 5))
     cv_metrics = []
 
-    for fold_idx, (train_idx, val_idx) in enumerate(skf.split(X_np, y_np), 1):
+    def fit_fold(fold_idx, train_idx, val_idx, n_threads):
         X_train, X_val = X_np[train_idx], X_np[val_idx]
         y_train, y_val = y_np[train_idx], y_np[val_idx]
 
-        # Train with SMOTE
-        pipeline.fit(X_train, y_train)
+        # Train with SMOTE (one pipeline per fold so folds can run concurrently)
+        fold_pipeline = make_model_b_pipeline(n_threads)
+        fold_pipeline.fit(X_train, y_train)
 
         # Predict
-        y_val_pred = pipeline.predict(X_val)
-        y_val_proba = pipeline.predict_proba(X_val)
+        y_val_pred = fold_pipeline.predict(X_val)
+        y_val_proba = fold_pipeline.predict_proba(X_val)
 
-        # Store OOF predictions
+        # Metrics
+        metrics = {
+            'fold': fold_idx,
+            'qwk': float(cohen_kappa_score(y_val, y_val_pred, weights='quadratic')),
+            'macro_f1': float(f1_score(y_val, y_val_pred, average='macro')),
+            'balanced_accuracy': float(balanced_accuracy_score(y_val, y_val_pred))
+        }
+        return val_idx, y_val_pred, y_val_proba, metrics
+
+    # Store OOF predictions in fold order
+    for val_idx, y_val_pred, y_val_proba, metrics in run_folds(fit_fold, list(skf.split(X_np, y_np))):
         oof_predictions[val_idx] = y_val_pred
         oof_probabilities[val_idx] = y_val_proba
+        cv_metrics.append(metrics)
+        print(f"  Fold {metrics['fold']}: QWK={metrics['qwk']:.4f}, Macro-F1={metrics['macro_f1']:.4f}, "
+              f"BalAcc={metrics['balanced_accuracy']:.4f}")
 
-        # Metrics
-        qwk = cohen_kappa_score(y_val, y_val_pred, weights='quadratic')
-        macro_f1 = f1_score(y_val, y_val_pred, average='macro')
-        balanced_acc = balanced_accuracy_score(y_val, y_val_pred)
+    return {
+        'oof_predictions': oof_predictions,
+        'oof_probabilities': oof_probabilities,
+        'cv_metrics': cv_metrics,
+        'overall_metrics': {
+            'qwk': float(cohen_kappa_score(y, oof_predictions, weights='quadratic')),
+            'macro_f1': float(f1_score(y, oof_predictions, average='macro')),
+            'balanced_accuracy': float(balanced_accuracy_score(y, oof_predictions))
+        }
+    }
 
-        cv_metrics.append({
-            'fold': fold_idx,
-            'qwk': float(qwk),
-            'macro_f1': float(macro_f1),
-            'balanced_accuracy': float(balanced_acc)
-        })
+def fit_model_b(X, y):
+    """Final Model B pipeline fit on the full dataset"""
+    print(f"\n  Training final model on full dataset with SMOTE...")
+    pipeline = make_model_b_pipeline(Config.N_JOBS)
+    pipeline.fit(X.to_numpy(), y.to_numpy())
+    return pipeline
+
+def plot_confusion_matrix(cm, plot_path):
+    plt.figure(figsize=(10, 8))
+    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues',
+               xticklabels=range(1, 6), yticklabels=range(1, 6))
+    plt.title('Model B: Confusion Matrix')
+    plt.ylabel('True Class')
+    plt.xlabel('Predicted Class')
+    plt.tight_layout()
+    plt.savefig(plot_path, dpi=150, bbox_inches='tight')
+    plt.close()
+
+def plot_model_b_importance(feature_importance, plot_path):
+    plt.figure(figsize=(10, 8))
+    top_features = feature_importance.head(15)
+    plt.barh(range(len(top_features)), top_features['importance'])
+    plt.yticks(range(len(top_features)), top_features['feature'])
+    plt.xlabel('Importance (Gain)')
+    plt.title('Model B: Feature Importance')
+    plt.gca().invert_yaxis()
+    plt.tight_layout()
+    plt.savefig(plot_path, dpi=150, bbox_inches='tight')
+    plt.close()
+
+def train_model_b(X, y, cache=None, plotter=None):
+    """
+    Train Model B: LightGBM Classification for risk_class_5 (1-5) with SMOTE
+    CV and final fit are reused from the stage cache when their inputs are
+    unchanged; plots are handed to the plot worker
 
-        print(f"  Fold {fold_idx}: QWK={qwk:.4f}, Macro-F1={macro_f1:.4f}, BalAcc={balanced_acc:.4f}")
+    Returns:
+        - model: Trained LightGBM classifier with SMOTE pipeline
+        - metrics: Cross-validation metrics
+        - predictions: OOF predictions and probabilities
+    """
+    print_section("MODEL B: CLASSIFICATION (risk_class_5) with SMOTE")
+    cache = cache or StageCache(Config.STAGE_CACHE_DIR, enabled=False)
+    own_plotter = plotter is None
+    plotter = plotter or PlotWorker(cache)
+    data_key = dataset_key(X, y, {})
+
+    # Class distribution
+    print(f"Class distribution:")
+    class_counts = y.value_counts().sort_index()
+    for cls, count in class_counts.items():
+        pct = 100 * count / len(y)
+        print(f"  Class {cls}: {count:3d} ({pct:5.1f}%)")
 
-    # Overall metrics
-    overall_qwk = cohen_kappa_score(y, oof_predictions, weights='quadratic')
-    overall_macro_f1 = f1_score(y, oof_predictions, average='macro')
-    overall_balanced_acc = balanced_accuracy_score(y, oof_predictions)
+    # Cross-validation
+    cv_key = cache.model_key('cv_b', [cross_validate_model_b, make_model_b_pipeline], data_key,
+                             Config.MODEL_B_PARAMS, Config.CLASS_WEIGHTS, Config.CV_FOLDS, SEED)
+    cv = cache.run('cv_b', cv_key, cross_validate_model_b, X, y)
+    oof_predictions = cv['oof_predictions']
+    overall = cv['overall_metrics']
 
     print(f"\n  📊 Overall CV Results:")
-    print(f"     QWK (Quadratic Weighted Kappa): {overall_qwk:.4f}")
-    print(f"     Macro-F1:                       {overall_macro_f1:.4f}")
-    print(f"     Balanced Accuracy:              {overall_balanced_acc:.4f}")
+    print(f"     QWK (Quadratic Weighted Kappa): {overall['qwk']:.4f}")
+    print(f"     Macro-F1:                       {overall['macro_f1']:.4f}")
+    print(f"     Balanced Accuracy:              {overall['balanced_accuracy']:.4f}")
 
     # Classification report
     print(f"\n  Classification Report:")
@@ -365,22 +1445,10 @@ def train_model_b(X, y):
     print(f"\n  Confusion Matrix:")
     print(cm)
 
-    # Plot confusion matrix
-    plt.figure(figsize=(10, 8))
-    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues',
-               xticklabels=range(1, 6), yticklabels=range(1, 6))
-    plt.title('Model B: Confusion Matrix')
-    plt.ylabel('True Class')
-    plt.xlabel('Predicted Class')
-    plt.tight_layout()
-    cm_plot_path = Config.PLOTS_DIR / 'model_b_confusion_matrix.png'
-    plt.savefig(cm_plot_path, dpi=150, bbox_inches='tight')
-    plt.close()
-    print(f"\n  ✓ Confusion matrix plot saved: {cm_plot_path.name}")
-
     # Train final model on all data
-    print(f"\n  Training final model on full dataset with SMOTE...")
-    pipeline.fit(X_np, y_np)
+    fit_key = cache.model_key('fit_b', [fit_model_b, make_model_b_pipeline], data_key,
+                              Config.MODEL_B_PARAMS, Config.CLASS_WEIGHTS)
+    pipeline = cache.run('fit_b', fit_key, fit_model_b, X, y)
 
     # Feature importance
     feature_importance = pd.DataFrame({
@@ -388,100 +1456,432 @@ def train_model_b(X, y):
         'importance': pipeline.named_steps['classifier'].feature_importances_
     }).sort_values('importance', ascending=False)
 
-    # Plot feature importance
-    plt.figure(figsize=(10, 8))
-    top_features = feature_importance.head(15)
-    plt.barh(range(len(top_features)), top_features['importance'])
-    plt.yticks(range(len(top_features)), top_features['feature'])
-    plt.xlabel('Importance (Gain)')
-    plt.title('Model B: Feature Importance')
-    plt.gca().invert_yaxis()
-    plt.tight_layout()
-    importance_plot_path = Config.PLOTS_DIR / 'model_b_feature_importance.png'
-    plt.savefig(importance_plot_path, dpi=150, bbox_inches='tight')
-    plt.close()
-    print(f"  ✓ Feature importance plot saved: {importance_plot_path.name}")
+    # Plots (confusion matrix, feature importance)
+    plot_key = cache.key('plots_b', [plot_confusion_matrix, plot_model_b_importance], cv_key, fit_key)
+    plotter.submit('plots_b', plot_key, [
+        (plot_confusion_matrix, (cm, Config.PLOTS_DIR / 'model_b_confusion_matrix.png')),
+        (plot_model_b_importance, (feature_importance, Config.PLOTS_DIR / 'model_b_feature_importance.png'))
+    ])
+    if own_plotter:
+        plotter.wait()
 
     results = {
         'model': pipeline,
         'oof_predictions': oof_predictions,
-        'oof_probabilities': oof_probabilities,
-        'cv_metrics': cv_metrics,
-        'overall_metrics': {
-            'qwk': float(overall_qwk),
-            'macro_f1': float(overall_macro_f1),
-            'balanced_accuracy': float(overall_balanced_acc)
-        },
+        'oof_probabilities': cv['oof_probabilities'],
+        'cv_metrics': cv['cv_metrics'],
+        'overall_metrics': overall,
         'classification_report': class_report_dict,
         'confusion_matrix': cm.tolist(),
-        'feature_importance': feature_importance
+        'feature_importance': feature_importance,
+        'stage_keys': {'cv_b': cv_key, 'fit_b': fit_key, 'plots_b': plot_key}
     }
 
     return results
 
 # ============================================================================
-# MAIN TRAINING PIPELINE
+# INCREMENTAL (WARM-START) TRAINING
 # ============================================================================
-def main():
-    """Main training pipeline"""
-    print_header("🎯 SEISMIC RISK ASSESSMENT - MODEL TRAINING")
-    print(f"Start time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"Random seed: {SEED}")
+def quantize(values, digits):
+    """Round to significant digits; NaN stays NaN and -0.0 becomes 0.0"""
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        magnitude = np.floor(np.log10(np.abs(values)))
+    unit = 10.0 ** (np.where(np.isfinite(magnitude), magnitude, 0) - digits + 1)
+    return np.round(values / unit) * unit + 0.0
+
+def row_fingerprints(df):
+    """
+    mah_id (or row position) and a hash of features + targets for every row
+    Values are hashed as float64 rounded to Config.FINGERPRINT_DIGITS, so
+    dtype changes and last-digit noise from a CSV round-trip do not count
+    as edits
+    """
+    columns = Config.FEATURES + [Config.TARGET_REGRESSION, Config.TARGET_CLASSIFICATION]
+    ids = df['mah_id'] if 'mah_id' in df.columns else pd.Series(np.arange(len(df)))
+    values = df[columns].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    rounded = pd.DataFrame(quantize(values, Config.FINGERPRINT_DIGITS), columns=columns)
+    return pd.DataFrame({
+        'mah_id': ids.astype(str).to_numpy(),
+        'row_hash': pd.util.hash_pandas_object(rounded, index=False).astype(str).to_numpy()
+    })
 
-    # Load data
-    print_section("1. LOADING DATA")
-    print(f"Data file: {Config.DATA_FILE}")
+def changed_rows(df, fingerprints_path):
+    """
+    Boolean mask of neighborhoods that are new or whose features/targets
+    changed since the run that wrote fingerprints_path (all rows if none)
+    """
+    if not fingerprints_path.exists():
+        return np.ones(len(df), dtype=bool)
+    previous = pd.read_csv(fingerprints_path, dtype=str)
+    known = set(zip(previous['mah_id'], previous['row_hash']))
+    current = row_fingerprints(df)
+    return np.array([key not in known for key in zip(current['mah_id'], current['row_hash'])])
+
+def incremental_rows(train_idx, changed, y_clf):
+    """
+    Changed training rows plus a replay sample of unchanged ones, with every
+    class topped up to enough rows for SMOTE
+    """
+    rng = np.random.default_rng(SEED)
+    labels = y_clf.to_numpy()
+    unchanged_idx = train_idx[~changed[train_idx]]
+    n_replay = int(round(len(unchanged_idx) * Config.INCREMENTAL_REPLAY_FRACTION))
+    fit_idx = np.union1d(train_idx[changed[train_idx]],
+                         rng.choice(unchanged_idx, size=n_replay, replace=False))
+
+    for cls in np.unique(labels[train_idx]):
+        short = SMOTE_NEIGHBORS + 1 - int(np.sum(labels[fit_idx] == cls))
+        if short > 0:
+            pool = np.setdiff1d(train_idx[labels[train_idx] == cls], fit_idx)
+            fit_idx = np.union1d(fit_idx, rng.choice(pool, size=min(short, len(pool)), replace=False))
+    return fit_idx
+
+def train_incremental(df, X, y_reg, y_clf):
+    """
+    Continue boosting both saved models (LightGBM init_model) on new or
+    changed neighborhoods instead of retraining from scratch
+
+    A drift guard scores the warm-started models on held-out changed rows
+    (unseen by either model); if they are worse than the previous run's CV
+    metrics or the previous models on the same rows (beyond
+    Config.DRIFT_TOLERANCE) nothing is saved and False is returned so the
+    caller can run a full retrain
+    """
+    print_section("INCREMENTAL TRAINING (WARM START)")
+    start = time.perf_counter()
 
-    if not Config.DATA_FILE.exists():
-        print(f"❌ ERROR: Data file not found!")
-        print(f"   Please place training data at: {Config.DATA_FILE}")
-        print(f"   Expected columns: {Config.FEATURES + [Config.TARGET_REGRESSION, Config.TARGET_CLASSIFICATION]}")
-        return
+    model_a_path = Config.MODEL_DIR / 'model_a_regression.pkl'
+    model_b_path = Config.MODEL_DIR / 'model_b_classification.pkl'
+    results_path = Config.ARTIFACTS_DIR / 'training_results.json'
+    fingerprints_path = Config.ARTIFACTS_DIR / 'row_fingerprints.csv'
+
+    missing = [p.name for p in (model_a_path, model_b_path, results_path) if not p.exists()]
+    if missing:
+        print(f"  No previous run to continue from (missing {', '.join(missing)})")
+        return False
+
+    with open(results_path, encoding='utf-8') as f:
+        previous_results = json.load(f)
+
+    changed = changed_rows(df, fingerprints_path)
+    print(f"  New or changed neighborhoods: {int(changed.sum())} of {len(df)}")
+    if not changed.any():
+        print(f"  Nothing changed since the previous run; models kept")
+        return True
+
+    # Held-out changed rows for the drift guard
+    changed_idx = np.flatnonzero(changed)
+    n_val = max(1, int(round(len(changed_idx) * Config.INCREMENTAL_VALIDATION_FRACTION)))
+    val_idx = np.sort(np.random.default_rng(SEED).choice(changed_idx, size=n_val, replace=False))
+    train_idx = np.setdiff1d(np.arange(len(df)), val_idx)
+    fit_idx = incremental_rows(train_idx, changed, y_clf)
+    print(f"  Warm-start rows: {len(fit_idx)} (changed + replay), validation rows: {len(val_idx)}")
+
+    X_fit, X_val = X.iloc[fit_idx], X.iloc[val_idx]
+    y_reg_val, y_clf_val = y_reg.iloc[val_idx], y_clf.iloc[val_idx]
+
+    # Model A: continue boosting the saved regressor
+    previous_a = joblib.load(model_a_path)
+    model_a = lgb.LGBMRegressor(**lgb_params({**Config.MODEL_A_PARAMS, 'n_estimators': Config.INCREMENTAL_ROUNDS},
+                                             Config.N_JOBS))
+    model_a.fit(X_fit, y_reg.iloc[fit_idx], init_model=previous_a.booster_)
+
+    # Model B: continue boosting the saved classifier (SMOTE on the warm-start rows)
+    previous_b = joblib.load(model_b_path)
+    model_b = make_model_b_pipeline(Config.N_JOBS, {**Config.MODEL_B_PARAMS,
+                                                    'n_estimators': Config.INCREMENTAL_ROUNDS})
+    model_b.fit(X_fit.to_numpy(), y_clf.iloc[fit_idx].to_numpy(),
+                classifier__init_model=previous_b.named_steps['classifier'].booster_)
+
+    # Drift guard
+    y_a_new, y_a_old = model_a.predict(X_val), previous_a.predict(X_val)
+    y_b_new, y_b_old = model_b.predict(X_val.to_numpy()), previous_b.predict(X_val.to_numpy())
+    rmse_new = float(np.sqrt(mean_squared_error(y_reg_val, y_a_new)))
+    rmse_old = float(np.sqrt(mean_squared_error(y_reg_val, y_a_old)))
+    qwk_new = float(cohen_kappa_score(y_clf_val, y_b_new, weights='quadratic'))
+    qwk_old = float(cohen_kappa_score(y_clf_val, y_b_old, weights='quadratic'))
+    rmse_ref = previous_results['model_a']['metrics']['rmse']
+    qwk_ref = previous_results['model_b']['metrics']['qwk']
+
+    rmse_ok = rmse_new <= min(rmse_ref, rmse_old) * (1 + Config.DRIFT_TOLERANCE['rmse'])
+    qwk_ok = qwk_new >= max(qwk_ref, qwk_old) - Config.DRIFT_TOLERANCE['qwk']
+
+    print(f"\n  📊 Drift guard (held-out changed rows):")
+    print(f"     {'':<10} {'warm start':>11} {'previous':>10} {'last run':>10}")
+    print(f"     {'RMSE':<10} {rmse_new:>11.6f} {rmse_old:>10.6f} {rmse_ref:>10.6f}  {'✓' if rmse_ok else '✗'}")
+    print(f"     {'QWK':<10} {qwk_new:>11.4f} {qwk_old:>10.4f} {qwk_ref:>10.4f}  {'✓' if qwk_ok else '✗'}")
+
+    if not (rmse_ok and qwk_ok):
+        print(f"\n  ❌ Validation degraded beyond tolerance {Config.DRIFT_TOLERANCE}")
+        return False
+
+    # Save
+    joblib.dump(model_a, model_a_path)
+    save_preprocessing_artifact(X, model_a_path)
+    joblib.dump(model_b, model_b_path)
+    save_preprocessing_artifact(X, model_b_path, training_columns=list(X.columns))
+    row_fingerprints(df).to_csv(fingerprints_path, index=False)
+    elapsed = time.perf_counter() - start
 
-    df = pd.read_csv(Config.DATA_FILE)
-    print(f"✓ Loaded {len(df)} neighborhoods, {len(df.columns)} columns")
+    results = {
+        'timestamp': datetime.now().isoformat(),
+        'mode': 'incremental',
+        'elapsed_seconds': elapsed,
+        'dataset': {
+            'total_neighborhoods': len(df),
+            'changed_neighborhoods': int(changed.sum()),
+            'warm_start_rows': int(len(fit_idx)),
+            'validation_rows': int(len(val_idx)),
+            'n_features': len(Config.FEATURES),
+            'features': Config.FEATURES
+        },
+        'model_a': {
+            'type': 'LightGBM Regression',
+            'target': Config.TARGET_REGRESSION,
+            'n_trees': int(model_a.booster_.num_trees()),
+            'metrics_source': 'holdout',
+            'metrics': {
+                'rmse': rmse_new,
+                'mae': float(mean_absolute_error(y_reg_val, y_a_new)),
+                'r2': float(r2_score(y_reg_val, y_a_new)),
+                'spearman': float(spearmanr(y_reg_val, y_a_new)[0])
+            }
+        },
+        'model_b': {
+            'type': 'LightGBM Classification with SMOTE',
+            'target': Config.TARGET_CLASSIFICATION,
+            'n_trees': int(model_b.named_steps['classifier'].booster_.num_trees()),
+            'metrics_source': 'holdout',
+            'metrics': {
+                'qwk': qwk_new,
+                'macro_f1': float(f1_score(y_clf_val, y_b_new, average='macro')),
+                'balanced_accuracy': float(balanced_accuracy_score(y_clf_val, y_b_new))
+            }
+        },
+        'previous_run': previous_results.get('timestamp')
+    }
+    save_json(results, results_path)
 
-    # Prepare features and targets
-    X = df[Config.FEATURES].copy()
-    y_reg = df[Config.TARGET_REGRESSION].copy()
-    y_clf = df[Config.TARGET_CLASSIFICATION].copy().astype(int)
+    print_header("✅ INCREMENTAL TRAINING COMPLETE", char='=')
+    print(f"   Models updated in {elapsed:.1f} seconds")
+    print(f"   - {model_a_path}")
+    print(f"   - {model_b_path}")
+    return True
 
-    print(f"\nFeatures: {len(Config.FEATURES)}")
-    print(f"Target (regression): {Config.TARGET_REGRESSION}")
-    print(f"Target (classification): {Config.TARGET_CLASSIFICATION}")
+# ============================================================================
+# DISTILLATION
+# ============================================================================
+def distill_model_a(X, teacher_oof, y):
+    """
+    Student regressor fit on the teacher's OOF predictions
+    Returns the final student and its own OOF predictions (same folds as
+    the teacher) for comparing against the ground truth
+    """
+    print(f"  Distilling Model A: {Config.DISTILL_A_PARAMS['n_estimators']} trees x "
+          f"{Config.DISTILL_A_PARAMS['num_leaves']} leaves")
+    splits = list(KFold(n_splits=Config.CV_FOLDS, shuffle=True, random_state=SEED).split(X))
+    student_oof = np.zeros(len(X))
 
-    # Train Model A
-    print_section("2. TRAINING MODEL A (REGRESSION)")
-    model_a_results = train_model_a(X, y_reg)
+    def fit_fold(fold_idx, train_idx, val_idx, n_threads):
+        student = lgb.LGBMRegressor(**lgb_params(Config.DISTILL_A_PARAMS, n_threads))
+        student.fit(X.iloc[train_idx], teacher_oof[train_idx])
+        return val_idx, student.predict(X.iloc[val_idx])
 
-    # Save Model A
-    model_a_path = Config.MODEL_DIR / 'model_a_regression.pkl'
-    joblib.dump(model_a_results['model'], model_a_path)
-    print(f"\n  ✓ Model A saved: {model_a_path}")
+    for val_idx, y_val_pred in run_folds(fit_fold, splits):
+        student_oof[val_idx] = y_val_pred
 
-    # Train Model B
-    print_section("3. TRAINING MODEL B (CLASSIFICATION)")
-    model_b_results = train_model_b(X, y_clf)
+    student = lgb.LGBMRegressor(**lgb_params(Config.DISTILL_A_PARAMS, Config.N_JOBS))
+    student.fit(X, teacher_oof)
+    return {'model': student, 'oof_predictions': student_oof}
 
-    # Save Model B
+def distill_model_b(X, teacher_oof, teacher_proba, y):
+    """
+    Student classifier fit on the teacher's OOF classes, weighted by the
+    teacher's OOF probability for that class
+    Returns the final student and its own OOF predictions
+    """
+    print(f"  Distilling Model B: {Config.DISTILL_B_PARAMS['n_estimators']} rounds x "
+          f"{Config.DISTILL_B_PARAMS['num_leaves']} leaves")
+    X_np = X.to_numpy()
+    labels = np.asarray(teacher_oof)
+    weights = teacher_proba.max(axis=1)
+    splits = list(StratifiedKFold(n_splits=Config.CV_FOLDS, shuffle=True,
+                                  random_state=SEED).split(X_np, y.to_numpy()))
+    student_oof = np.zeros(len(X), dtype=labels.dtype)
+
+    def fit_fold(fold_idx, train_idx, val_idx, n_threads):
+        student = lgb.LGBMClassifier(**lgb_params(Config.DISTILL_B_PARAMS, n_threads))
+        student.fit(X_np[train_idx], labels[train_idx], sample_weight=weights[train_idx])
+        return val_idx, student.predict(X_np[val_idx])
+
+    for val_idx, y_val_pred in run_folds(fit_fold, splits):
+        student_oof[val_idx] = y_val_pred
+
+    student = lgb.LGBMClassifier(**lgb_params(Config.DISTILL_B_PARAMS, Config.N_JOBS))
+    student.fit(X_np, labels, sample_weight=weights)
+    return {'model': student, 'oof_predictions': student_oof}
+
+def model_size(model):
+    """(trees, leaves) of a LightGBM model or a pipeline ending in one"""
+    if hasattr(model, 'named_steps'):
+        model = model.named_steps['classifier']
+    dump = model.booster_.dump_model()
+    return len(dump['tree_info']), sum(tree['num_leaves'] for tree in dump['tree_info'])
+
+def measure_latency(predict, X, n_single=200, repeats=3):
+    """p50 single-row latency and full-batch latency in milliseconds"""
+    rows = [X[i:i + 1] for i in range(min(n_single, len(X)))]
+    for row in rows[:20]:
+        predict(row)
+
+    single = []
+    for row in rows:
+        start = time.perf_counter()
+        predict(row)
+        single.append((time.perf_counter() - start) * 1000)
+
+    batch = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        predict(X)
+        batch.append((time.perf_counter() - start) * 1000)
+
+    return {'single_p50_ms': float(np.median(single)), 'batch_ms': float(min(batch))}
+
+def distillation_report(name, teacher, student, predict_name, X, metric, teacher_score, student_score, bound):
+    """Accuracy loss vs the teacher, size and latency, and whether the student is within bounds"""
+    loss = teacher_score - student_score
+    teacher_latency = measure_latency(getattr(teacher, predict_name), X)
+    student_latency = measure_latency(getattr(student, predict_name), X)
+    teacher_trees, teacher_leaves = model_size(teacher)
+    student_trees, student_leaves = model_size(student)
+    accepted = loss <= bound
+
+    print(f"\n  📊 Distillation ({name}):")
+    print(f"     Trees / leaves:      {teacher_trees} / {teacher_leaves} → {student_trees} / {student_leaves}")
+    print(f"     {metric + ':':<20} {teacher_score:.4f} → {student_score:.4f} "
+          f"(loss {loss:.4f}, bound {bound}) {'✓' if accepted else '✗'}")
+    print(f"     Latency (1 row p50): {teacher_latency['single_p50_ms']:.3f} ms → "
+          f"{student_latency['single_p50_ms']:.3f} ms "
+          f"({teacher_latency['single_p50_ms'] / student_latency['single_p50_ms']:.1f}x)")
+    print(f"     Latency ({len(X)} rows):  {teacher_latency['batch_ms']:.2f} ms → "
+          f"{student_latency['batch_ms']:.2f} ms "
+          f"({teacher_latency['batch_ms'] / student_latency['batch_ms']:.1f}x)")
+
+    return {
+        'metric': metric,
+        'teacher_score': float(teacher_score),
+        'student_score': float(student_score),
+        'loss': float(loss),
+        'bound': bound,
+        'accepted': bool(accepted),
+        'teacher_size': {'trees': teacher_trees, 'leaves': teacher_leaves},
+        'student_size': {'trees': student_trees, 'leaves': student_leaves},
+        'teacher_latency': teacher_latency,
+        'student_latency': student_latency
+    }
+
+def run_distillation(X, y_reg, y_clf, model_a_results, model_b_results, cache):
+    """
+    Distill both models, report accuracy loss and latency gain, and save
+    each student next to its teacher only if it stays inside
+    Config.DISTILL_BOUNDS
+    """
+    distill_a_key = cache.model_key('distill_a', distill_model_a, model_a_results['stage_keys']['cv_a'],
+                                    Config.DISTILL_A_PARAMS, Config.CV_FOLDS, SEED)
+    student_a = cache.run('distill_a', distill_a_key, distill_model_a,
+                          X, model_a_results['oof_predictions'], y_reg)
+    distill_b_key = cache.model_key('distill_b', distill_model_b, model_b_results['stage_keys']['cv_b'],
+                                    Config.DISTILL_B_PARAMS, Config.CV_FOLDS, SEED)
+    student_b = cache.run('distill_b', distill_b_key, distill_model_b,
+                          X, model_b_results['oof_predictions'], model_b_results['oof_probabilities'], y_clf)
+
+    with cache.profile.measure('distill_report') if cache.profile else nullcontext():
+        report = {
+            'model_a': distillation_report(
+                'Model A', model_a_results['model'], student_a['model'], 'predict', X, 'spearman',
+                spearmanr(y_reg, model_a_results['oof_predictions'])[0],
+                spearmanr(y_reg, student_a['oof_predictions'])[0],
+                Config.DISTILL_BOUNDS['spearman_loss']),
+            'model_b': distillation_report(
+                'Model B', model_b_results['model'], student_b['model'], 'predict_proba', X.to_numpy(), 'qwk',
+                cohen_kappa_score(y_clf, model_b_results['oof_predictions'], weights='quadratic'),
+                cohen_kappa_score(y_clf, student_b['oof_predictions'], weights='quadratic'),
+                Config.DISTILL_BOUNDS['qwk_loss'])
+        }
+
+        for name, student, teacher_path in (('model_a', student_a['model'], artifact_paths()['model_a']),
+                                            ('model_b', student_b['model'], artifact_paths()['model_b'])):
+            student_path = teacher_path.with_name(teacher_path.stem + '.student.pkl')
+            report[name]['path'] = str(student_path)
+            if report[name]['accepted']:
+                joblib.dump(student, student_path)
+                # Students follow X's column order (student B is fitted on arrays)
+                save_preprocessing_artifact(X, student_path, training_columns=list(X.columns))
+                print(f"  ✓ Student saved: {student_path.name}")
+            else:
+                print(f"  ✗ Student for {name} outside accuracy bounds; not emitted")
+                for stale in (student_path, student_path.with_suffix('.preprocessing.json')):
+                    if stale.exists():
+                        stale.unlink()
+
+    save_json(report, Config.ARTIFACTS_DIR / 'distillation_report.json')
+    return report
+
+# ============================================================================
+# ARTIFACTS
+# ============================================================================
+def artifact_paths():
+    """Files written by the artifacts stage"""
+    model_a_path = Config.MODEL_DIR / 'model_a_regression.pkl'
     model_b_path = Config.MODEL_DIR / 'model_b_classification.pkl'
-    joblib.dump(model_b_results['model'], model_b_path)
-    print(f"\n  ✓ Model B saved: {model_b_path}")
+    return {
+        'model_a': model_a_path,
+        'model_b': model_b_path,
+        'model_a_preprocessing': model_a_path.with_name(model_a_path.stem + '.preprocessing.json'),
+        'model_b_preprocessing': model_b_path.with_name(model_b_path.stem + '.preprocessing.json'),
+        'feature_importance': Config.ARTIFACTS_DIR / 'feature_importance.csv',
+        'predictions': Config.ARTIFACTS_DIR / 'predictions.csv',
+        'fingerprints': Config.ARTIFACTS_DIR / 'row_fingerprints.csv',
+        'shap_values': Config.ARTIFACTS_DIR / 'model_a_shap_values.npy',
+        'results': Config.ARTIFACTS_DIR / 'training_results.json'
+    }
 
-    # Save artifacts
-    print_section("4. SAVING ARTIFACTS")
+def artifacts_current(key, paths):
+    """True when the last full run wrote these artifacts from the same stage outputs"""
+    if not all(path.exists() for path in paths.values()):
+        return False
+    with open(paths['results'], encoding='utf-8') as f:
+        previous = json.load(f)
+    return previous.get('mode') == 'full' and previous.get('stage_keys', {}).get('artifacts') == key
+
+def save_artifacts(df, X, y_reg, y_clf, model_a_results, model_b_results, stage_keys):
+    """Models, preprocessing artifacts, CSVs and the results JSON"""
+    paths = artifact_paths()
+
+    # Models
+    joblib.dump(model_a_results['model'], paths['model_a'])
+    print(f"  ✓ Model A saved: {paths['model_a']}")
+    save_preprocessing_artifact(X, paths['model_a'])
+    joblib.dump(model_b_results['model'], paths['model_b'])
+    print(f"  ✓ Model B saved: {paths['model_b']}")
+    save_preprocessing_artifact(X, paths['model_b'], training_columns=list(X.columns))
 
     # Feature importance
+    importance_a = model_a_results['feature_importance'].set_index('feature').loc[Config.FEATURES]
+    importance_b = model_b_results['feature_importance'].set_index('feature').loc[Config.FEATURES]
     feature_importance_combined = pd.DataFrame({
         'feature': Config.FEATURES,
-        'model_a_importance': model_a_results['feature_importance'].set_index('feature').loc[Config.FEATURES, 'importance'].values,
-        'model_a_shap': model_a_results['feature_importance'].set_index('feature').loc[Config.FEATURES, 'shap_importance'].values,
-        'model_b_importance': model_b_results['feature_importance'].set_index('feature').loc[Config.FEATURES, 'importance'].values
+        'model_a_importance': importance_a['importance'].values,
+        'model_a_shap': importance_a['shap_importance'].values,
+        'model_a_shap_ci_low': importance_a['shap_ci_low'].values,
+        'model_a_shap_ci_high': importance_a['shap_ci_high'].values,
+        'model_b_importance': importance_b['importance'].values
     }).sort_values('model_a_importance', ascending=False)
 
-    feature_importance_path = Config.ARTIFACTS_DIR / 'feature_importance.csv'
-    feature_importance_combined.to_csv(feature_importance_path, index=False)
-    print(f"  ✓ Feature importance: {feature_importance_path.name}")
+    feature_importance_combined.to_csv(paths['feature_importance'], index=False)
+    print(f"  ✓ Feature importance: {paths['feature_importance'].name}")
 
     # Predictions
     predictions_df = pd.DataFrame({
@@ -498,13 +1898,21 @@ def main():
         'prob_class_5': model_b_results['oof_probabilities'][:, 4],
     })
 
-    predictions_path = Config.ARTIFACTS_DIR / 'predictions.csv'
-    predictions_df.to_csv(predictions_path, index=False)
-    print(f"  ✓ Predictions: {predictions_path.name}")
+    predictions_df.to_csv(paths['predictions'], index=False)
+    print(f"  ✓ Predictions: {paths['predictions'].name}")
+
+    # Row fingerprints (new/changed neighborhoods for --incremental)
+    row_fingerprints(df).to_csv(paths['fingerprints'], index=False)
+    print(f"  ✓ Row fingerprints: {paths['fingerprints'].name}")
+
+    # SHAP values
+    shutil.copyfile(model_a_results['shap_path'], paths['shap_values'])
+    print(f"  ✓ SHAP values: {paths['shap_values'].name}")
 
     # Results JSON
     results = {
         'timestamp': datetime.now().isoformat(),
+        'mode': 'full',
         'dataset': {
             'total_neighborhoods': len(df),
             'n_features': len(Config.FEATURES),
@@ -515,7 +1923,13 @@ def main():
             'target': Config.TARGET_REGRESSION,
             'cv_folds': Config.CV_FOLDS,
             'metrics': model_a_results['overall_metrics'],
-            'cv_metrics': model_a_results['cv_metrics']
+            'cv_metrics': model_a_results['cv_metrics'],
+            'shap': {
+                'mode': Config.SHAP_MODE,
+                'rows_explained': int(len(model_a_results['shap_rows'])),
+                'ci_level': Config.SHAP_CI_LEVEL,
+                'values_file': paths['shap_values'].name
+            }
         },
         'model_b': {
             'type': 'LightGBM Classification with SMOTE',
@@ -526,11 +1940,344 @@ def main():
             'cv_metrics': model_b_results['cv_metrics'],
             'classification_report': model_b_results['classification_report'],
             'confusion_matrix': model_b_results['confusion_matrix']
-        }
+        },
+        'stage_keys': stage_keys
     }
 
-    results_path = Config.ARTIFACTS_DIR / 'training_results.json'
-    save_json(results, results_path)
+    save_json(results, paths['results'])
+    return paths
+
+# ============================================================================
+# BENCHMARK
+# ============================================================================
+def synthetic_training_data(n_rows, seed=SEED):
+    """
+    Synthetic neighborhoods with the training columns, for benchmarks
+    Feature ranges roughly follow the Istanbul data; the risk score is a
+    fixed noisy function of the features and class 5 is kept rare (~3%)
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'mah_id': np.arange(1, n_rows + 1),
+        'toplam_nufus': rng.lognormal(9.2, 1.0, n_rows).round(),
+        'toplam_bina': rng.lognormal(6.8, 0.7, n_rows).round(),
+        'vs30_mean': rng.normal(413, 60, n_rows).clip(180, 760),
+        'rjb_distance_km': rng.gamma(7.0, 3.7, n_rows),
+        'pga_scenario_mw72': rng.normal(0.00426, 0.00039, n_rows),
+        'pga_scenario_mw75': rng.normal(0.00426, 0.00032, n_rows),
+        'earthquake_min_distance_km': rng.gamma(3.0, 0.9, n_rows),
+        'earthquake_count_10km': rng.poisson(29, n_rows),
+        'max_magnitude_nearby_20km': rng.normal(4.0, 0.35, n_rows).clip(3.0, 6.0).round(1),
+        'strong_earthquakes_20km': rng.poisson(1.1, n_rows),
+        'insan_etkisi': rng.beta(0.5, 60, n_rows),
+        'bina_etkisi': rng.beta(1.6, 4.0, n_rows),
+        'zemin_etkisi': rng.beta(5.5, 3.7, n_rows),
+        'altyapi_etkisi': rng.beta(0.4, 60, n_rows),
+        'barinma_etkisi': rng.beta(0.5, 60, n_rows)
+    })
+
+    score = (0.35 * df['zemin_etkisi'] + 0.30 * df['bina_etkisi']
+             + 0.10 * (760 - df['vs30_mean']) / 580 + 0.10 * np.exp(-df['rjb_distance_km'] / 20)
+             + 0.05 * np.log1p(df['toplam_nufus']) / 12
+             + 2.0 * (df['insan_etkisi'] + df['altyapi_etkisi'] + df['barinma_etkisi'])
+             + rng.normal(0, 0.03, n_rows))
+    df[Config.TARGET_REGRESSION] = (score - score.min()) / (score.max() - score.min())
+    cuts = np.quantile(df[Config.TARGET_REGRESSION], [0.25, 0.60, 0.85, 0.97])
+    df[Config.TARGET_CLASSIFICATION] = np.searchsorted(cuts, df[Config.TARGET_REGRESSION], side='right') + 1
+    return df
+
+def git_revision():
+    """Short commit hash of the training code, when run from a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=Config.SCRIPT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def latest_benchmark():
+    """The most recent saved benchmark, or None"""
+    runs = sorted(Config.BENCHMARK_DIR.glob('benchmark_*.json'))
+    if not runs:
+        return None
+    with open(runs[-1], encoding='utf-8') as f:
+        return json.load(f)
+
+def compare_benchmarks(current, previous):
+    """
+    Stages slower than Config.BENCHMARK_TOLERANCE x the previous run
+    (stages under half a second in both runs are ignored as noise)
+    """
+    regressions = []
+    for size, run in current['sizes'].items():
+        before = previous['sizes'].get(size, {}).get('profile', {}).get('stages', {})
+        for stage, entry in run.get('profile', {}).get('stages', {}).items():
+            if stage not in before or max(entry['seconds'], before[stage]['seconds']) < 0.5:
+                continue
+            ratio = entry['seconds'] / max(before[stage]['seconds'], 1e-9)
+            if ratio > Config.BENCHMARK_TOLERANCE:
+                regressions.append((size, stage, before[stage]['seconds'], entry['seconds'], ratio))
+    return regressions
+
+def run_benchmark(sizes=None, train_args=()):
+    """
+    Train on synthetic datasets of each size, each in a fresh process with
+    caching off, and collect the stage profiles into
+    output/benchmark/benchmark_<run>.json; stage times are compared with
+    the previous benchmark to catch regressions between versions
+    """
+    sizes = sizes or Config.BENCHMARK_SIZES
+    run_id = datetime.now().strftime('%Y%m%d-%H%M%S')
+    data_dir = Config.BENCHMARK_DIR / 'data'
+    data_dir.mkdir(exist_ok=True, parents=True)
+    previous = latest_benchmark()
+
+    print_header("⏱️  SEISMIC RISK ASSESSMENT - TRAINING BENCHMARK")
+    print(f"Sizes: {', '.join(str(size) for size in sizes)}, threads: {Config.N_JOBS}")
+
+    benchmark = {
+        'run_id': run_id,
+        'created_at': datetime.now().isoformat(),
+        'git_revision': git_revision(),
+        'versions': {
+            'python': sys.version.split()[0],
+            'lightgbm': lgb.__version__,
+            'shap': shap.__version__,
+            'numpy': np.__version__,
+            'pandas': pd.__version__
+        },
+        'n_jobs': Config.N_JOBS,
+        'sizes': {}
+    }
+
+    for size in sizes:
+        print_section(f"{size} NEIGHBORHOODS")
+        data_path = data_dir / f'synthetic_{size}.csv'
+        if not data_path.exists():
+            synthetic_training_data(size).to_csv(data_path, index=False)
+            print(f"  ✓ Generated {data_path.name}")
+
+        output_dir = Config.BENCHMARK_DIR / run_id / f'n{size}'
+        output_dir.mkdir(exist_ok=True, parents=True)
+        command = [sys.executable, str(Path(__file__).resolve()), '--data-file', str(data_path),
+                   '--output-dir', str(output_dir), '--no-stage-cache',
+                   '--n-jobs', str(Config.N_JOBS)] + list(train_args)
+
+        start = time.perf_counter()
+        with open(output_dir / 'train.log', 'w', encoding='utf-8') as log:
+            returncode = subprocess.run(command, stdout=log, stderr=subprocess.STDOUT).returncode
+        elapsed = time.perf_counter() - start
+
+        entry = {'elapsed_s': round(elapsed, 2), 'returncode': returncode}
+        results_path = output_dir / 'artifacts' / 'training_results.json'
+        if returncode == 0 and results_path.exists():
+            with open(results_path, encoding='utf-8') as f:
+                results = json.load(f)
+            entry['profile'] = results.get('profile', {})
+            entry['metrics'] = {'model_a': results['model_a']['metrics'],
+                                'model_b': results['model_b']['metrics']}
+            print(f"  ✓ {elapsed:.1f}s, peak {entry['profile'].get('peak_rss_mb', 0):.0f} MB")
+        else:
+            print(f"  ❌ Failed (exit {returncode}), see {output_dir / 'train.log'}")
+        benchmark['sizes'][str(size)] = entry
+
+    save_json(benchmark, Config.BENCHMARK_DIR / f'benchmark_{run_id}.json')
+
+    # Stage x size table
+    print_header("📊 BENCHMARK RESULTS", char='=')
+    stages = []
+    for entry in benchmark['sizes'].values():
+        stages += [stage for stage in entry.get('profile', {}).get('stages', {}) if stage not in stages]
+    header = ''.join(f"{f'{size} rows':>22}" for size in benchmark['sizes'])
+    print(f"   {'stage':<16}{header}")
+    for stage in stages + ['total']:
+        cells = []
+        for entry in benchmark['sizes'].values():
+            profile = entry.get('profile', {})
+            if stage == 'total' and profile:
+                cells.append(f"{profile['total_seconds']:>10.2f}s {profile['peak_rss_mb']:>7.0f} MB")
+            elif stage in profile.get('stages', {}):
+                cells.append(f"{profile['stages'][stage]['seconds']:>10.2f}s "
+                             f"{profile['stages'][stage]['peak_rss_mb']:>7.0f} MB")
+            else:
+                cells.append(f"{'-':>22}")
+        print(f"   {stage:<16}{''.join(cells)}")
+
+    if previous:
+        regressions = compare_benchmarks(benchmark, previous)
+        print(f"\n   Compared with {previous['run_id']} ({previous.get('git_revision') or 'unknown revision'}):")
+        for size, stage, before, after, ratio in regressions:
+            print(f"   ⚠️  {stage} at {size} rows: {before:.2f}s → {after:.2f}s ({ratio:.2f}x)")
+        if not regressions:
+            print(f"   ✓ No stage slower than {Config.BENCHMARK_TOLERANCE}x")
+
+    return benchmark
+
+# ============================================================================
+# MAIN TRAINING PIPELINE
+# ============================================================================
+def load_training_data(path):
+    """Load stage: the training CSV"""
+    return pd.read_csv(path)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Seismic risk model training")
+    parser.add_argument('--tune', choices=['a', 'b', 'both'], default=None,
+                        help="Search hyperparameters before training")
+    parser.add_argument('--tune-trials', type=int, default=None)
+    parser.add_argument('--tune-only', action='store_true', help="Stop after the search")
+    parser.add_argument('--use-tuned', action='store_true',
+                        help="Train with previously tuned params")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Warm-start the saved models on new or changed neighborhoods")
+    parser.add_argument('--no-stage-cache', action='store_true',
+                        help="Recompute every stage (and binned dataset) instead of reusing cached outputs")
+    parser.add_argument('--skip-distill', action='store_true',
+                        help="Do not fit the distilled student models")
+    parser.add_argument('--cities', default=None,
+                        help="Train from the database for these cities (comma-separated) instead of DATA_FILE")
+    parser.add_argument('--years', default=None, help="Comma-separated years (default: all)")
+    parser.add_argument('--refresh-snapshots', action='store_true',
+                        help="Re-export Parquet snapshots even if the database is unchanged")
+    parser.add_argument('--data-file', default=None, help="Train from this CSV instead of DATA_FILE")
+    parser.add_argument('--benchmark', nargs='?', const=','.join(str(size) for size in Config.BENCHMARK_SIZES),
+                        default=None, metavar='SIZES',
+                        help="Profile training on synthetic datasets of these sizes (comma-separated)")
+    parser.add_argument('--output-dir', default=None,
+                        help="Write models, artifacts and plots here instead of OUTPUT_DIR")
+    parser.add_argument('--n-jobs', type=int, default=None, help="CPU threads for this run")
+    args = parser.parse_args(argv)
+    if args.years and not args.cities:
+        parser.error("--years requires --cities")
+    return args
+
+def main(argv=None):
+    """Main training pipeline"""
+    args = parse_args(argv)
+    if args.output_dir:
+        set_output_dir(args.output_dir)
+    if args.n_jobs:
+        Config.N_JOBS = args.n_jobs
+    if args.data_file:
+        Config.DATA_FILE = Path(args.data_file)
+    if args.benchmark:
+        return run_benchmark([int(size) for size in args.benchmark.split(',')],
+                             ['--skip-distill'] if args.skip_distill else [])
+    if args.no_stage_cache:
+        Config.DATASET_CACHE_DIR = None
+
+    profile = TrainingProfile()
+    print_header("🎯 SEISMIC RISK ASSESSMENT - MODEL TRAINING")
+    print(f"Start time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"Random seed: {SEED}")
+
+    # Load data
+    print_section("1. LOADING DATA")
+    cache = StageCache(Config.STAGE_CACHE_DIR, enabled=not args.no_stage_cache, profile=profile)
+
+    if args.cities:
+        cities = [city.strip().lower() for city in args.cities.split(',') if city.strip()]
+        years = [int(year) for year in args.years.split(',')] if args.years else None
+        print(f"Data source: {sa.engine.make_url(Config.DATABASE_URL).render_as_string(hide_password=True)}"
+              f" ({Config.DB_TABLE})")
+        print(f"Cities: {', '.join(cities)}, years: {args.years or 'all'}")
+
+        snapshot_paths = ensure_snapshots(cities, years, refresh=args.refresh_snapshots)
+        if not snapshot_paths:
+            print(f"❌ ERROR: No rows found for the selected cities and years!")
+            return
+
+        Config.DATA_SOURCE = ', '.join(str(path) for path in snapshot_paths)
+        Config.DATA_SOURCE_KEY = snapshot_source_key(snapshot_paths)
+        data_key = cache.key('load', load_snapshots, [path.name for path in snapshot_paths],
+                             Config.FEATURES, Config.TARGET_REGRESSION, Config.TARGET_CLASSIFICATION)
+        df = cache.run('load', data_key, load_snapshots, snapshot_paths)
+    else:
+        print(f"Data file: {Config.DATA_FILE}")
+
+        if not Config.DATA_FILE.exists():
+            print(f"❌ ERROR: Data file not found!")
+            print(f"   Please place training data at: {Config.DATA_FILE}")
+            print(f"   Expected columns: {Config.FEATURES + [Config.TARGET_REGRESSION, Config.TARGET_CLASSIFICATION]}")
+            return
+
+        data_key = cache.key('load', load_training_data, file_digest(Config.DATA_FILE),
+                             Config.FEATURES, Config.TARGET_REGRESSION, Config.TARGET_CLASSIFICATION)
+        df = cache.run('load', data_key, load_training_data, Config.DATA_FILE)
+    print(f"✓ Loaded {len(df)} neighborhoods, {len(df.columns)} columns")
+
+    # Prepare features and targets
+    X = df[Config.FEATURES].copy()
+    y_reg = df[Config.TARGET_REGRESSION].copy()
+    y_clf = df[Config.TARGET_CLASSIFICATION].copy().astype(int)
+
+    print(f"\nFeatures: {len(Config.FEATURES)}")
+    print(f"Target (regression): {Config.TARGET_REGRESSION}")
+    print(f"Target (classification): {Config.TARGET_CLASSIFICATION}")
+
+    # Hyperparameter search
+    if args.tune in ('a', 'both'):
+        with profile.measure('tune_a'):
+            Config.MODEL_A_PARAMS = tune_hyperparameters(X, y_reg, 'a', args.tune_trials)
+    if args.tune in ('b', 'both'):
+        with profile.measure('tune_b'):
+            Config.MODEL_B_PARAMS = tune_hyperparameters(X, y_clf, 'b', args.tune_trials)
+    if args.tune_only:
+        profile.stop()
+        cache.close()
+        return
+    if args.use_tuned and not args.tune:
+        apply_tuned_params()
+
+    # Incremental refresh, falling back to a full retrain
+    if args.incremental:
+        with profile.measure('incremental'):
+            refreshed = train_incremental(df, X, y_reg, y_clf)
+        if refreshed:
+            profile.stop()
+            save_profile(profile)
+            cache.close()
+            return
+        print(f"\n  ↪ Falling back to full retrain")
+
+    # Train models (plots render in a background process meanwhile)
+    plotter = PlotWorker(cache)
+
+    print_section("2. TRAINING MODEL A (REGRESSION)")
+    model_a_results = train_model_a(X, y_reg, cache, plotter)
+
+    print_section("3. TRAINING MODEL B (CLASSIFICATION)")
+    model_b_results = train_model_b(X, y_clf, cache, plotter)
+    if 'cv_b' in cache.computed:
+        with profile.measure('smote_resample'):
+            smote_probe(X, y_clf)
+
+    # Save artifacts
+    print_section("4. SAVING ARTIFACTS")
+    stage_keys = {'load': data_key, **model_a_results['stage_keys'], **model_b_results['stage_keys']}
+    stage_keys['artifacts'] = cache.key('artifacts', [save_artifacts, save_preprocessing_artifact,
+                                                     row_fingerprints, quantize], stage_keys)
+    paths = artifact_paths()
+
+    artifacts_cached = cache.enabled and artifacts_current(stage_keys['artifacts'], paths)
+    with profile.measure('artifacts', cached=artifacts_cached):
+        if artifacts_cached:
+            cache.cached.append('artifacts')
+            print(f"  ↺ Stage artifacts: inputs unchanged, files kept")
+        else:
+            start = time.perf_counter()
+            save_artifacts(df, X, y_reg, y_clf, model_a_results, model_b_results, stage_keys)
+            cache.computed['artifacts'] = time.perf_counter() - start
+
+    # Distilled serving models
+    if not args.skip_distill:
+        print_section("5. DISTILLING SERVING MODELS")
+        run_distillation(X, y_reg, y_clf, model_a_results, model_b_results, cache)
+
+    # Wait for background plots
+    plotter.wait()
+    cache.close()
+    profile.stop()
+    save_profile(profile, paths['results'])
 
     # Summary
     print_header("✅ TRAINING COMPLETE", char='=')
@@ -544,14 +2291,20 @@ def main():
     print(f"   Macro-F1:         {model_b_results['overall_metrics']['macro_f1']:.4f}")
     print(f"   Balanced Accuracy: {model_b_results['overall_metrics']['balanced_accuracy']:.4f}")
 
+    print(f"\n🗂️  STAGES:")
+    cache.summary()
+
+    print(f"\n⏱️  PROFILE (wall time, peak RSS):")
+    profile.summary()
+
     print(f"\n📁 OUTPUT FILES:")
     print(f"   Models:")
-    print(f"   - {model_a_path}")
-    print(f"   - {model_b_path}")
+    print(f"   - {paths['model_a']}")
+    print(f"   - {paths['model_b']}")
     print(f"\n   Artifacts:")
-    print(f"   - {feature_importance_path}")
-    print(f"   - {predictions_path}")
-    print(f"   - {results_path}")
+    print(f"   - {paths['feature_importance']}")
+    print(f"   - {paths['predictions']}")
+    print(f"   - {paths['results']}")
     print(f"\n   Plots:")
     print(f"   - {Config.PLOTS_DIR / 'model_a_shap_summary.png'}")
     print(f"   - {Config.PLOTS_DIR / 'model_a_feature_importance.png'}")
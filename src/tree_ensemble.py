@@ -0,0 +1,384 @@
+"""
+Compiled Tree Ensemble Evaluator
+Flattens trained LightGBM boosters into contiguous NumPy arrays and evaluates
+all trees for a whole batch without the sklearn wrapper or pandas
+"""
+import json
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional
+
+
+# LightGBM missing_type encoding
+MISSING_NONE = 0
+MISSING_ZERO = 1
+MISSING_NAN = 2
+_MISSING_TYPES = {'None': MISSING_NONE, 'Zero': MISSING_ZERO, 'NaN': MISSING_NAN}
+
+# LightGBM treats |x| <= kZeroThreshold as zero
+ZERO_THRESHOLD = 1e-35
+
+# Budget for the (rows x trees) node-index matrix of one chunk
+DEFAULT_CHUNK_CELLS = 1 << 22
+
+
+class CompiledTreeEnsemble:
+    """
+    Array form of a gradient boosted tree ensemble
+
+    Every node lives in flat arrays shared by all trees. Sibling nodes are
+    stored next to each other and leaves point to themselves, so walking
+    max_depth steps from the roots lands every (row, tree) pair on its leaf
+    without per-row branching.
+    """
+
+    def __init__(self, split_feature: np.ndarray, threshold: np.ndarray,
+                 left_child: np.ndarray, right_child: np.ndarray,
+                 default_left: np.ndarray, missing_type: np.ndarray,
+                 node_value: np.ndarray, roots: np.ndarray, max_depth: int,
+                 objective: str, num_class: int, feature_names: List[str],
+                 classes: Optional[np.ndarray] = None):
+        self.split_feature = np.ascontiguousarray(split_feature, dtype=np.int32)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.left_child = np.ascontiguousarray(left_child, dtype=np.int32)
+        self.right_child = np.ascontiguousarray(right_child, dtype=np.int32)
+        self.default_left = np.ascontiguousarray(default_left, dtype=bool)
+        self.missing_type = np.ascontiguousarray(missing_type, dtype=np.int8)
+        self.node_value = np.ascontiguousarray(node_value, dtype=np.float64)
+        self.roots = np.ascontiguousarray(roots, dtype=np.int32)
+        self.max_depth = int(max_depth)
+        self.objective = objective
+        self.num_class = int(num_class)
+        self.feature_names = list(feature_names)
+        self.classes = None if classes is None else np.asarray(classes)
+
+        self.num_trees = len(self.roots)
+        self._has_zero_missing = bool((self.missing_type == MISSING_ZERO).any())
+
+    @classmethod
+    def from_model(cls, model, num_iteration: Optional[int] = None) -> 'CompiledTreeEnsemble':
+        """
+        Compile a LightGBM Booster, sklearn wrapper or pipeline ending in one
+        Raises ValueError for models it cannot compile (e.g. categorical splits)
+        """
+        estimator = model.steps[-1][1] if hasattr(model, 'steps') else model
+        booster = estimator.booster_ if hasattr(estimator, 'booster_') else estimator
+
+        if not hasattr(booster, 'dump_model'):
+            raise ValueError(f"Not a LightGBM model: {type(model).__name__}")
+
+        if num_iteration is None:
+            best = getattr(booster, 'best_iteration', 0)
+            num_iteration = best if best and best > 0 else None
+
+        dump = booster.dump_model(num_iteration=num_iteration)
+        classes = getattr(estimator, 'classes_', None)
+
+        return cls._from_dump(dump, classes)
+
+    @classmethod
+    def _from_dump(cls, dump: Dict[str, Any], classes=None) -> 'CompiledTreeEnsemble':
+        split_feature, threshold = [], []
+        left_child, right_child = [], []
+        default_left, missing_type, node_value = [], [], []
+        roots = []
+        max_depth = 0
+
+        def new_node():
+            # Leaves: +inf threshold and NaN-goes-left, so they always "go left" to themselves
+            index = len(split_feature)
+            split_feature.append(0)
+            threshold.append(np.inf)
+            left_child.append(index)
+            right_child.append(index)
+            default_left.append(True)
+            missing_type.append(MISSING_NAN)
+            node_value.append(0.0)
+            return index
+
+        def fill_node(index, node, depth):
+            nonlocal max_depth
+            if 'leaf_value' in node:
+                node_value[index] = float(node['leaf_value'])
+                max_depth = max(max_depth, depth)
+                return
+
+            if node.get('decision_type', '<=') != '<=':
+                raise ValueError("Categorical splits are not supported; use the model's own predict")
+
+            split_feature[index] = int(node['split_feature'])
+            threshold[index] = float(node['threshold'])
+            default_left[index] = bool(node.get('default_left', True))
+            missing_type[index] = _MISSING_TYPES.get(node.get('missing_type', 'None'), MISSING_NONE)
+
+            # Children are allocated as a pair so right child == left child + 1
+            left = new_node()
+            right = new_node()
+            left_child[index] = left
+            right_child[index] = right
+            fill_node(left, node['left_child'], depth + 1)
+            fill_node(right, node['right_child'], depth + 1)
+
+        for tree in dump['tree_info']:
+            root = new_node()
+            fill_node(root, tree['tree_structure'], 0)
+            roots.append(root)
+
+        objective = dump.get('objective', 'regression').split(' ')[0]
+
+        return cls(
+            np.array(split_feature), np.array(threshold),
+            np.array(left_child), np.array(right_child),
+            np.array(default_left), np.array(missing_type),
+            np.array(node_value), np.array(roots), max_depth,
+            objective, dump.get('num_class', 1), dump.get('feature_names', []),
+            classes
+        )
+
+    def _as_matrix(self, X) -> np.ndarray:
+        """
+        Feature matrix in training column order; float32 input is kept as float32
+        """
+        if isinstance(X, pd.DataFrame):
+            if self.feature_names and set(self.feature_names).issubset(X.columns):
+                X = X[self.feature_names]
+            X = X.to_numpy()
+
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.dtype not in (np.float32, np.float64):
+            X = X.astype(np.float64)
+
+        if X.shape[1] != len(self.feature_names) and self.feature_names:
+            raise ValueError(f"Expected {len(self.feature_names)} features, got {X.shape[1]}")
+
+        return X
+
+    def _leaf_values(self, X: np.ndarray) -> np.ndarray:
+        """
+        Walk all trees for a block of rows; returns (rows, trees) leaf values
+        """
+        n_rows = X.shape[0]
+        n_features = X.shape[1]
+        flat = np.ascontiguousarray(X).ravel()
+        row_offsets = (np.arange(n_rows, dtype=np.int64) * n_features)[:, None]
+
+        nodes = np.broadcast_to(self.roots, (n_rows, self.num_trees)).copy()
+        check_missing = self._has_zero_missing or bool(np.isnan(flat).any())
+
+        for _ in range(self.max_depth):
+            x = np.take(flat, row_offsets + np.take(self.split_feature, nodes))
+            threshold = np.take(self.threshold, nodes)
+
+            if check_missing:
+                nan = np.isnan(x)
+                node_missing = np.take(self.missing_type, nodes)
+
+                # NaN is treated as zero unless the split has its own NaN branch
+                x = np.where(nan & (node_missing != MISSING_NAN), 0.0, x)
+                missing = (nan & (node_missing == MISSING_NAN)) | \
+                          ((node_missing == MISSING_ZERO) & (np.abs(x) <= ZERO_THRESHOLD))
+                go_left = np.where(missing, np.take(self.default_left, nodes), x <= threshold)
+            else:
+                go_left = x <= threshold
+
+            # Right child is stored right after the left child; leaves point to themselves
+            nodes = np.take(self.left_child, nodes) + ~go_left
+
+        return np.take(self.node_value, nodes)
+
+    def _raw_block(self, X: np.ndarray) -> np.ndarray:
+        values = self._leaf_values(X)
+        if self.num_class > 1:
+            # Trees are stored iteration-major: tree t belongs to class t % num_class
+            return values.reshape(len(X), -1, self.num_class).sum(axis=1)
+        return values.sum(axis=1)
+
+    def predict_raw(self, X, chunk_size: Optional[int] = None, n_threads: int = 1) -> np.ndarray:
+        """
+        Raw scores (before the objective's link function)
+        Rows are processed in chunks; with n_threads > 1 chunks run in a thread
+        pool, which overlaps because NumPy releases the GIL in its array kernels
+        """
+        X = self._as_matrix(X)
+        n_rows = X.shape[0]
+
+        if chunk_size is None:
+            chunk_size = max(1, DEFAULT_CHUNK_CELLS // max(self.num_trees, 1))
+
+        starts = range(0, n_rows, chunk_size)
+        shape = (n_rows, self.num_class) if self.num_class > 1 else (n_rows,)
+        raw = np.empty(shape, dtype=np.float64)
+
+        def run(start):
+            raw[start:start + chunk_size] = self._raw_block(X[start:start + chunk_size])
+
+        if n_threads > 1 and n_rows > chunk_size:
+            with ThreadPoolExecutor(max_workers=n_threads) as pool:
+                list(pool.map(run, starts))
+        else:
+            for start in starts:
+                run(start)
+
+        return raw
+
+    def _transform(self, raw: np.ndarray) -> np.ndarray:
+        if self.objective == 'multiclass':
+            shifted = raw - raw.max(axis=1, keepdims=True)
+            exp = np.exp(shifted)
+            return exp / exp.sum(axis=1, keepdims=True)
+        if self.objective in ('binary', 'multiclassova', 'cross_entropy', 'xentropy'):
+            return 1.0 / (1.0 + np.exp(-raw))
+        if self.objective in ('poisson', 'gamma', 'tweedie'):
+            return np.exp(raw)
+        return raw
+
+    def predict(self, X, chunk_size: Optional[int] = None, n_threads: int = 1) -> np.ndarray:
+        """
+        Same output as the LightGBM model's predict(): values for regression,
+        class labels for classification
+        """
+        output = self._transform(self.predict_raw(X, chunk_size, n_threads))
+
+        if self.classes is None:
+            return output
+
+        if self.num_class > 1:
+            return self.classes[np.argmax(output, axis=1)]
+        return self.classes[(output > 0.5).astype(int)]
+
+    def predict_proba(self, X, chunk_size: Optional[int] = None, n_threads: int = 1) -> np.ndarray:
+        """
+        Class probabilities, shaped like sklearn's predict_proba()
+        """
+        if self.classes is None:
+            raise ValueError("predict_proba is only available for classifiers")
+
+        output = self._transform(self.predict_raw(X, chunk_size, n_threads))
+        if self.num_class > 1:
+            return output
+        return np.column_stack([1.0 - output, output])
+
+    def predict_outputs(self, X):
+        """
+        (predictions, probabilities or None) from a single tree walk
+        """
+        output = self._transform(self.predict_raw(X))
+
+        if self.classes is None:
+            return output, None
+
+        if self.num_class > 1:
+            return self.classes[np.argmax(output, axis=1)], output
+
+        probas = np.column_stack([1.0 - output, output])
+        return self.classes[(output > 0.5).astype(int)], probas
+
+    def save(self, file_path: str) -> str:
+        """
+        Save arrays and metadata as a single .npz file
+        """
+        meta = {
+            'max_depth': self.max_depth,
+            'objective': self.objective,
+            'num_class': self.num_class,
+            'feature_names': self.feature_names,
+            'classes': None if self.classes is None else self.classes.tolist()
+        }
+        np.savez(
+            file_path,
+            split_feature=self.split_feature, threshold=self.threshold,
+            left_child=self.left_child, right_child=self.right_child,
+            default_left=self.default_left, missing_type=self.missing_type,
+            node_value=self.node_value, roots=self.roots,
+            meta=np.array(json.dumps(meta))
+        )
+        return file_path
+
+    @classmethod
+    def load(cls, file_path: str) -> 'CompiledTreeEnsemble':
+        """
+        Load a compiled ensemble saved with save()
+        """
+        with np.load(file_path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            return cls(
+                data['split_feature'], data['threshold'],
+                data['left_child'], data['right_child'],
+                data['default_left'], data['missing_type'],
+                data['node_value'], data['roots'], meta['max_depth'],
+                meta['objective'], meta['num_class'], meta['feature_names'],
+                meta['classes']
+            )
+
+    def info(self) -> Dict[str, Any]:
+        """Size of the compiled ensemble"""
+        return {
+            'objective': self.objective,
+            'num_class': self.num_class,
+            'num_trees': self.num_trees,
+            'num_nodes': int(len(self.split_feature)),
+            'max_depth': self.max_depth,
+            'num_features': len(self.feature_names),
+            'array_bytes': int(sum(a.nbytes for a in (
+                self.split_feature, self.threshold, self.left_child, self.right_child,
+                self.default_left, self.missing_type, self.node_value, self.roots)))
+        }
+
+
+def compiled_path_for(model_path: str) -> str:
+    """
+    'model/final_lightgbm_regressor.pkl' -> 'model/final_lightgbm_regressor.compiled.npz'
+    """
+    root, _ = os.path.splitext(model_path)
+    return root + '.compiled.npz'
+
+
+def export_compiled_model(model_path: str, output_path: Optional[str] = None) -> str:
+    """
+    Export step: compile a saved LightGBM model and write it next to the model
+    """
+    from model_registry import get_model
+
+    compiled = CompiledTreeEnsemble.from_model(get_model(model_path))
+    output_path = output_path or compiled_path_for(model_path)
+    compiled.save(output_path)
+
+    info = compiled.info()
+    print(f"Compiled {info['num_trees']} trees ({info['num_nodes']} nodes, "
+          f"depth {info['max_depth']}) -> {output_path}")
+    return output_path
+
+
+def check_against_model(model, compiled: CompiledTreeEnsemble, X,
+                        atol: float = 1e-9) -> Dict[str, Any]:
+    """
+    Compare compiled outputs against the LightGBM model
+    """
+    if compiled.classes is not None:
+        expected = np.asarray(model.predict_proba(X))
+        actual = compiled.predict_proba(X)
+    else:
+        expected = np.asarray(model.predict(X))
+        actual = compiled.predict(X)
+
+    max_abs_error = float(np.max(np.abs(expected - actual))) if len(expected) else 0.0
+    return {
+        'rows': int(len(expected)),
+        'max_abs_error': max_abs_error,
+        'within_tolerance': max_abs_error <= atol
+    }
+
+
+if __name__ == "__main__":
+    import sys
+
+    paths = sys.argv[1:] or [
+        "src/model/final_lightgbm_regressor.pkl",
+        "src/model/final_lightgbm_classifier.pkl"
+    ]
+    for path in paths:
+        export_compiled_model(path)